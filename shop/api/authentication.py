@@ -0,0 +1,110 @@
+import time
+from functools import cached_property
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import (
+    JWTStatelessUserAuthentication
+)
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.cache import (
+    cache_token,
+    get_cached_token,
+    get_generation,
+    revoked_tokens
+)
+from users.consts import ADMIN, ERRORS
+
+
+SESSION_CLAIM = 'sid'
+ROLE_CLAIM = 'role'
+# Время выдачи с долями секунды: iat - целые секунды, и токен,
+# выданный в ту же секунду сразу после отзыва, считался бы отозванным.
+ISSUED_CLAIM = 'issued'
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кэшем токен -> пользователь.
+
+    Пользователь ищется в LRU процесса, затем в общем кэше
+    и только потом в БД. Кэш сбрасывается при удалении
+    токена (logout) и при изменении пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = get_cached_token(key)
+        if cached is None:
+            generation = get_generation()
+            user, token = super().authenticate_credentials(key)
+            cache_token(token, generation)
+            return user, token
+
+        user, token = cached
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, token
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh-токен с ролью пользователя, id сессии и точным
+    временем выдачи.
+
+    Утверждения копируются в access-токены, выданные
+    по этому refresh, поэтому отзыв сессии действует на все.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[ROLE_CLAIM] = user.role
+        token['is_staff'] = user.is_staff
+        token[SESSION_CLAIM] = token[jwt_settings.JTI_CLAIM]
+        token[ISSUED_CLAIM] = time.time()
+        return token
+
+
+class RoleTokenUser(TokenUser):
+    """Пользователь из утверждений JWT, без запроса к БД."""
+
+    @cached_property
+    def id(self):
+        return int(self.token[jwt_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def role(self):
+        return self.token.get(ROLE_CLAIM)
+
+    @property
+    def is_admin(self):
+        return self.role == ADMIN
+
+
+def is_token_revoked(token):
+    """Проверка токена по списку отзыва в памяти процесса."""
+    return revoked_tokens.is_revoked(
+        token.get(SESSION_CLAIM),
+        token.get(jwt_settings.USER_ID_CLAIM),
+        token.get(ISSUED_CLAIM, token.get('iat', 0))
+    )
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Аутентификация по access-токену JWT (Authorization: Bearer).
+
+    Пользователь и роль берутся из токена, отзыв проверяется
+    по списку в памяти - запросов к БД нет.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_token_revoked(token):
+            raise InvalidToken(ERRORS['token']['revoked'])
+        return token
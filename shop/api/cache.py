@@ -0,0 +1,225 @@
+import hashlib
+from collections import Counter
+from functools import wraps
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from prometheus_client import Counter as MetricCounter
+from rest_framework.response import Response
+from rest_framework.status import (
+    HTTP_200_OK as OK,
+    HTTP_412_PRECONDITION_FAILED as PRECONDITION_FAILED,
+)
+
+from products.cache import CATALOG, get_version
+from products.models import Cart
+
+
+RESPONSE_KEY = 'api:response:{version}:{endpoint}:{digest}'
+CONDITIONAL_HEADERS = (
+    'HTTP_IF_MATCH',
+    'HTTP_IF_NONE_MATCH',
+    'HTTP_IF_MODIFIED_SINCE',
+    'HTTP_IF_UNMODIFIED_SINCE',
+)
+
+_stats = Counter()
+_stats_lock = Lock()
+
+CACHE_REQUESTS = MetricCounter(
+    'shop_catalog_cache_requests',
+    'Обращения к кэшу ответов каталога: hit или miss.',
+    ('endpoint', 'result')
+)
+CART_CONFLICTS = MetricCounter(
+    'shop_cart_write_conflicts',
+    'Записи в корзину, отклоненные с 412: etag - If-Match не совпал, '
+    'race - корзину изменили между проверкой и записью.',
+    ('reason',)
+)
+
+
+def get_response_cache():
+    """Бэкенд кэша ответов каталога из настроек CATALOG_CACHE."""
+    return caches[settings.CATALOG_CACHE['ALIAS']]
+
+
+def get_timeout(endpoint):
+    return settings.CATALOG_CACHE['TIMEOUTS'].get(endpoint, 0)
+
+
+def get_cache_stats():
+    """Счетчики попаданий и промахов кэша текущего процесса."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def count(endpoint, result):
+    with _stats_lock:
+        _stats[(endpoint, result)] += 1
+    CACHE_REQUESTS.labels(endpoint, result).inc()
+
+
+def get_request_digest(request):
+    """
+    Хэш схемы, хоста, пути и отсортированных параметров запроса.
+
+    В ответах абсолютные URL (изображения, next/previous),
+    поэтому http и https кэшируются отдельно.
+    """
+    params = sorted(request.query_params.lists())
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{params}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def make_etag(*parts):
+    """Сильный ETag из частей состояния ресурса."""
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def cache_response(method):
+    """
+    Кэширует GET-ответы эндпоинта каталога.
+
+    Ключ включает версию каталога, которая меняется
+    при любой записи товаров, подкатегорий и категорий,
+    поэтому устаревшие ответы не отдаются.
+    Время жизни задается по имени эндпоинта в CATALOG_CACHE.
+
+    ETag строится из той же версии, поэтому на If-None-Match
+    ответ 304 отдается до обращения к кэшу и сериализатору.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return method(self, request, *args, **kwargs)
+
+        endpoint = request.resolver_match.url_name
+        version = get_version(CATALOG)
+        digest = get_request_digest(request)
+        etag = make_etag(
+            version,
+            endpoint,
+            digest,
+            request.META.get('HTTP_ACCEPT', '')
+        )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        timeout = get_timeout(endpoint)
+        key = RESPONSE_KEY.format(
+            version=version,
+            endpoint=endpoint,
+            digest=digest
+        )
+        response_cache = get_response_cache()
+        data = response_cache.get(key) if timeout else None
+
+        if data is not None:
+            count(endpoint, 'hit')
+            response = Response(data, status=OK)
+            response['X-Cache'] = 'HIT'
+        else:
+            response = method(self, request, *args, **kwargs)
+            if timeout:
+                count(endpoint, 'miss')
+                if response.status_code == OK:
+                    response_cache.set(key, response.data, timeout)
+                response['X-Cache'] = 'MISS'
+
+        if response.status_code == OK:
+            response['ETag'] = etag
+        return response
+
+    return wrapper
+
+
+def get_cart_etag(cart, items):
+    """ETag корзины по времени изменения и набору товаров."""
+    return make_etag(cart.updated_at.isoformat(), list(items))
+
+
+def get_cart_items_state(cart):
+    """Набор товаров корзины для ETag: id, товар, количество, цена."""
+    return cart.cart_products.order_by('id').values_list(
+        'id',
+        'product_id',
+        'quantity',
+        'product__price'
+    )
+
+
+def check_cart_preconditions(request, cart, etag):
+    """
+    Ответ на условный запрос к корзине или None.
+
+    304 - для GET с совпавшим If-None-Match или If-Modified-Since,
+    412 - для записи с несовпавшим If-Match.
+    """
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(cart.updated_at.timestamp())
+    )
+
+
+def set_cart_headers(response, cart, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(cart.updated_at.timestamp())
+    return response
+
+
+def has_conditional_headers(request):
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
+
+
+def touch_cart(request, updated_at=None):
+    """
+    Отмечает изменение корзины пользователя.
+
+    С updated_at обновление условное: если между проверкой
+    ETag и записью корзину изменили в другой вкладке,
+    updated_at уже другой и функция вернет False
+    (сравнение и запись одним UPDATE, без блокировки строки).
+    """
+    queryset = Cart.objects.filter(user_id=request.user.id)
+    if updated_at is not None:
+        queryset = queryset.filter(updated_at=updated_at)
+    return bool(queryset.update(updated_at=timezone.now()))
+
+
+def conditional_cart_write(method):
+    """
+    Запись в корзину с учетом If-Match.
+
+    Без условных заголовков метод вызывается как есть.
+    Иначе при несовпадении ETag ответ 412, а при совпадении
+    корзина условно отмечается измененной и запись
+    выполняется в той же транзакции.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if not has_conditional_headers(request):
+            return method(self, request, *args, **kwargs)
+
+        cart, created = Cart.objects.get_or_create(user_id=request.user.id)
+        etag = get_cart_etag(cart, get_cart_items_state(cart))
+        response = check_cart_preconditions(request, cart, etag)
+        if response is not None:
+            CART_CONFLICTS.labels('etag').inc()
+            return response
+
+        with transaction.atomic():
+            if not touch_cart(request, cart.updated_at):
+                CART_CONFLICTS.labels('race').inc()
+                return Response(status=PRECONDITION_FAILED)
+            return method(self, request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+# Бэкенды, данные которых не видны другим процессам.
+PROCESS_LOCAL_CACHES = frozenset((
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+))
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Общий кэш вне DEBUG.
+
+    Через него процессы узнают о версиях каталога и дерева
+    категорий и поколении кэша токенов: с кэшем в памяти
+    процесса удаленный на одном воркере токен принимается
+    остальными.
+    """
+    if settings.DEBUG:
+        return []
+    aliases = {
+        'default',
+        settings.CATALOG_CACHE['ALIAS'],
+        settings.AUTH_TOKEN_CACHE['ALIAS'],
+    }
+    return [
+        Error(
+            f'Кэш {alias!r} ({settings.CACHES[alias]["BACKEND"]}) '
+            'не общий для процессов.',
+            hint=(
+                'Задайте CACHE_BACKEND и CACHE_LOCATION (Redis, '
+                'Memcached) или DEBUG=True для разработки.'
+            ),
+            id='api.E001',
+        )
+        for alias in sorted(aliases)
+        if settings.CACHES.get(alias, {}).get('BACKEND')
+        in PROCESS_LOCAL_CACHES
+    ]
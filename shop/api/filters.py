@@ -0,0 +1,119 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity
+)
+from django.db import connections, transaction
+from django.db.models import F
+from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
+
+from products.cache import get_category_tree
+from products.models import Product
+from users.consts import MAGIC_NUMBERS, SEARCH_CONFIG
+
+
+class SlugInFilter(filters.BaseInFilter, filters.CharFilter):
+    """Список слагов через запятую."""
+
+
+class ProductFilter(filters.FilterSet):
+    """
+    Фильтры списка товаров.
+
+    price_min, price_max - диапазон цены,
+    category, subcategory - несколько слагов через запятую.
+    Слаги переводятся в id подкатегорий по снимку дерева
+    категорий, поэтому запрос обходится без JOIN и использует
+    индекс (subcategory_id, price, id).
+    """
+
+    price_min = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    category = SlugInFilter(method='filter_category')
+    subcategory = SlugInFilter(method='filter_subcategory')
+
+    class Meta:
+        model = Product
+        fields = (
+            'subcategory__category__slug',
+            'subcategory__slug'
+        )
+
+    def filter_category(self, queryset, name, value):
+        tree = get_category_tree()
+        return queryset.filter(subcategory_id__in=[
+            subcategory.id
+            for slug in value
+            if (category := tree.get_category(slug)) is not None
+            for subcategory in tree.get_subcategories(category)
+        ])
+
+    def filter_subcategory(self, queryset, name, value):
+        slugs = set(value)
+        return queryset.filter(subcategory_id__in=[
+            subcategory.id
+            for subcategory in get_category_tree().subcategories_by_id.values()
+            if subcategory.slug in slugs
+        ])
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск по товарам.
+
+    Ищет по поисковому вектору (название товара, подкатегории
+    и категории) с сортировкой по релевантности. Если ничего
+    не найдено - ищет по схожести названий (опечатки)
+    по триграммному индексу.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search = ' '.join(self.get_search_terms(request))
+        if not search:
+            return queryset
+
+        query = SearchQuery(
+            search,
+            config=SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        found = queryset.filter(
+            search_vector=query
+        ).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', 'id')
+
+        if found.exists():
+            return found
+
+        similar = queryset.filter(
+            id__in=self.get_similar_ids(queryset, search)
+        )
+        return similar.annotate(
+            similarity=TrigramWordSimilarity(search, 'name')
+        ).order_by('-similarity', 'id')
+
+    @staticmethod
+    def get_similar_ids(queryset, search):
+        """
+        Id товаров, похожих по названию, по оператору %>.
+
+        Условие по оператору, в отличие от сравнения
+        word_similarity() с порогом, использует GIN-индекс
+        product_name_trgm_idx; порог оператор берет из настройки
+        pg_trgm.word_similarity_threshold. Настройка задается
+        на транзакцию (is_local), поэтому id выбираются в той же
+        транзакции и порог не остается на соединении из пула.
+        """
+        using = queryset.db
+        with transaction.atomic(using=using, savepoint=False):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config("
+                    "'pg_trgm.word_similarity_threshold', %s, true)",
+                    [str(MAGIC_NUMBERS['search']['trigram_threshold'])]
+                )
+            return list(queryset.filter(
+                name__trigram_word_similar=search
+            ).values_list('id', flat=True))
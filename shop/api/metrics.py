@@ -0,0 +1,194 @@
+import os
+from time import monotonic, perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from api.timing import request_timings
+
+
+REQUEST_DURATION = Histogram(
+    'shop_http_request_duration_seconds',
+    'Время обработки запроса по маршруту.',
+    ('route', 'method')
+)
+REQUESTS = Counter(
+    'shop_http_requests',
+    'Запросы по маршруту и статусу ответа.',
+    ('route', 'method', 'status')
+)
+DB_QUERIES = Histogram(
+    'shop_http_request_db_queries',
+    'Запросов к БД за запрос.',
+    ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_DURATION = Histogram(
+    'shop_http_request_db_duration_seconds',
+    'Время запросов к БД за запрос.',
+    ('route',)
+)
+
+POOL_CONNECTIONS = Gauge(
+    'shop_db_pool_connections',
+    'Соединения пула: size - открыто, available - свободно.',
+    ('alias', 'state'),
+    multiprocess_mode='livesum'
+)
+POOL_WAITING = Gauge(
+    'shop_db_pool_requests_waiting',
+    'Запросы, ожидающие соединение из пула.',
+    ('alias',),
+    multiprocess_mode='livesum'
+)
+POOL_REQUESTS = Counter(
+    'shop_db_pool_requests',
+    'Выдачи соединения из пула: queued - пришлось ждать, '
+    'error - не дождались за timeout.',
+    ('alias', 'result')
+)
+POOL_WAIT = Counter(
+    'shop_db_pool_wait_seconds',
+    'Суммарное ожидание соединения из пула.',
+    ('alias',)
+)
+POOL_CONNECTIONS_LOST = Counter(
+    'shop_db_pool_connections_lost',
+    'Соединения, не прошедшие проверку пула.',
+    ('alias',)
+)
+# Статистика пулов снимается не чаще раза в столько секунд.
+POOL_STATS_INTERVAL = 1
+
+
+def record_pool_stats():
+    """Статистика пулов соединений процесса (psycopg_pool) в метрики."""
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        stats = pool.pop_stats()
+        POOL_CONNECTIONS.labels(alias, 'size').set(stats.get('pool_size', 0))
+        POOL_CONNECTIONS.labels(alias, 'available').set(
+            stats.get('pool_available', 0)
+        )
+        POOL_WAITING.labels(alias).set(stats.get('requests_waiting', 0))
+        POOL_REQUESTS.labels(alias, 'total').inc(stats.get('requests_num', 0))
+        POOL_REQUESTS.labels(alias, 'queued').inc(
+            stats.get('requests_queued', 0)
+        )
+        POOL_REQUESTS.labels(alias, 'error').inc(
+            stats.get('requests_errors', 0)
+        )
+        POOL_WAIT.labels(alias).inc(stats.get('requests_wait_ms', 0) / 1000)
+        POOL_CONNECTIONS_LOST.labels(alias).inc(
+            stats.get('connections_lost', 0)
+        )
+
+
+def get_route(request):
+    """Имя маршрута (products-list, admin:index) или unmatched."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.view_name:
+        return 'unmatched'
+    return match.view_name
+
+
+class PrometheusMiddleware:
+    """
+    Время, статус и запросы к БД каждого запроса по маршруту.
+
+    Метрики с метками кэшируются по (маршрут, метод, статус):
+    labels() стоит столько же, сколько сама запись значений.
+    Статистика пулов соединений снимается раз в POOL_STATS_INTERVAL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.children = {}
+        self.pool_stats_at = None
+
+    def get_children(self, route, method, status):
+        key = (route, method, status)
+        children = self.children.get(key)
+        if children is None:
+            children = self.children[key] = (
+                REQUEST_DURATION.labels(route, method),
+                REQUESTS.labels(route, method, status),
+                DB_QUERIES.labels(route),
+                DB_DURATION.labels(route),
+            )
+        return children
+
+    def __call__(self, request):
+        with request_timings(request) as timings:
+            response = self.get_response(request)
+        duration = perf_counter() - timings.start
+
+        request_duration, requests, db_queries, db_duration = (
+            self.get_children(
+                get_route(request),
+                request.method,
+                response.status_code
+            )
+        )
+        request_duration.observe(duration)
+        requests.inc()
+        db_queries.observe(timings.queries)
+        db_duration.observe(timings.db)
+
+        now = monotonic()
+        if (
+            self.pool_stats_at is None
+            or now - self.pool_stats_at >= POOL_STATS_INTERVAL
+        ):
+            self.pool_stats_at = now
+            record_pool_stats()
+        return response
+
+
+def get_registry():
+    """
+    Реестр для выгрузки.
+
+    С PROMETHEUS_MULTIPROC_DIR (gunicorn, uvicorn с воркерами)
+    значения пишутся каждым процессом в свои файлы и здесь
+    собираются по всем процессам.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus, доступ - с METRICS_ALLOWED_IPS.
+
+    Без списка адресов метрики доступны только при DEBUG.
+    Адрес берется из REMOTE_ADDR: за обратным прокси это адрес
+    прокси, и закрывать /metrics нужно на нем.
+    """
+    allowed = settings.METRICS['ALLOWED_IPS']
+    if allowed:
+        permitted = request.META.get('REMOTE_ADDR') in allowed
+    else:
+        permitted = settings.DEBUG
+    if not permitted:
+        raise Http404
+    return HttpResponse(
+        generate_latest(get_registry()),
+        content_type=CONTENT_TYPE_LATEST
+    )
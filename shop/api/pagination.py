@@ -0,0 +1,269 @@
+import base64
+import binascii
+import json
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from users.consts import ERRORS, MAGIC_NUMBERS
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк по плану запроса PostgreSQL.
+
+    Вместо COUNT(*) берется число строк,
+    которое ожидает планировщик.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (курсору).
+
+    Страница выбирается условием по паре (поле сортировки, id),
+    поэтому запрос не делает OFFSET и время ответа
+    не зависит от глубины прокрутки.
+
+    Параметры запроса:
+        ordering - name, -name, price, -price
+        cursor - курсор из ссылок next/previous
+        count - exact (COUNT(*)), estimate (оценка планировщика),
+                по умолчанию количество не считается
+    """
+
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    count_query_param = 'count'
+    orderings = {
+        'name': ('name', 'id'),
+        '-name': ('-name', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+    # Поля сортировок, нужные курсору в строках .values().
+    value_fields = ('id', 'name', 'price')
+    # Проверка значений полей сортировок из курсора.
+    cursor_fields = {
+        'name': serializers.CharField(
+            allow_blank=True,
+            trim_whitespace=False
+        ),
+        'price': serializers.DecimalField(
+            max_digits=MAGIC_NUMBERS['count']['max_decimal_digits'],
+            decimal_places=MAGIC_NUMBERS['count']['max_decimal_places']
+        ),
+    }
+    default_ordering = 'name'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = api_settings.PAGE_SIZE
+        self.count = self.get_count(queryset)
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            self.ordering = self.get_ordering(request)
+            position, self.reverse = None, False
+        else:
+            self.ordering, position, self.reverse = cursor
+
+        ordering = self.orderings[self.ordering]
+        if self.reverse:
+            ordering = tuple(self.invert(field) for field in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(ordering, position)
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_count(self, queryset):
+        mode = self.request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(
+            self.ordering_query_param,
+            self.default_ordering
+        )
+        if ordering not in self.orderings:
+            raise ValidationError(
+                {self.ordering_query_param: ERRORS['ordering']['wrong']}
+            )
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_position_filter(self, ordering, position):
+        """Условие (поле, id) > (значение, id) с учетом направления."""
+        (field, id_field), (value, pk) = ordering, position
+        field_lookup = 'lt' if field.startswith('-') else 'gt'
+        id_lookup = 'lt' if id_field.startswith('-') else 'gt'
+        field, id_field = field.lstrip('-'), id_field.lstrip('-')
+        return (
+            Q(**{f'{field}__{field_lookup}': value})
+            | Q(**{field: value, f'{id_field}__{id_lookup}': pk})
+        )
+
+    def encode_cursor(self, row, reverse):
+        field = self.orderings[self.ordering][0].lstrip('-')
+        payload = {
+            'o': self.ordering,
+            'p': [str(self.get_value(row, field)), self.get_value(row, 'id')],
+            'r': reverse,
+        }
+        cursor = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            ordering = payload['o']
+            value, pk = payload['p']
+            reverse = bool(payload['r'])
+            if ordering not in self.orderings or not isinstance(pk, int):
+                raise ValueError
+            value = self.parse_value(ordering, value)
+        except (
+            binascii.Error,
+            KeyError,
+            TypeError,
+            UnicodeDecodeError,
+            ValidationError,
+            ValueError
+        ):
+            raise NotFound(ERRORS['cursor']['invalid'])
+        return ordering, (value, pk), reverse
+
+    def parse_value(self, ordering, value):
+        """
+        Значение поля сортировки из курсора.
+
+        В курсор значение пишется строкой и проверяется как поле
+        модели: иначе условие по курсору упало бы при построении
+        запроса или в БД.
+        """
+        if not isinstance(value, str):
+            raise ValueError
+        field = self.orderings[ordering][0].lstrip('-')
+        return self.cursor_fields[field].run_validation(value)
+
+    @staticmethod
+    def get_value(row, field):
+        """Значение поля объекта или строки .values()."""
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class CatalogPagination(BasePagination):
+    """
+    Пагинация для списков товаров.
+
+    По умолчанию постраничная (page), с ?pagination=cursor
+    или при наличии курсора - пагинация по ключу. Пагинация
+    по ключу сортирует по своему полю, поэтому с поиском
+    (сортировка по релевантности) не используется.
+    """
+
+    mode_query_param = 'pagination'
+    value_fields = KeysetPagination.value_fields
+
+    @classmethod
+    def is_keyset(cls, request):
+        """Запрошена пагинация по ключу."""
+        return (
+            request.query_params.get(cls.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_keyset(request):
+            self.paginator = KeysetPagination()
+        else:
+            self.paginator = PageNumberPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
@@ -0,0 +1,97 @@
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+
+from api.timing import request_timings
+
+
+logger = logging.getLogger('api.queries')
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+VALUE_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+class NPlusOneError(Exception):
+    """Один и тот же запрос повторяется в рамках одного запроса API."""
+
+
+def fingerprint(sql):
+    """
+    Форма запроса без значений.
+
+    Параметры, строки и числа заменяются на ?, списки
+    значений (IN, VALUES) сворачиваются в (...).
+    """
+    return VALUE_LISTS.sub('(...)', LITERALS.sub('?', sql))
+
+
+class QueryDetector:
+    """
+    Счетчик запросов по форме: execute_wrapper
+    или detector в RequestTimings (NPlusOneMiddleware).
+
+    Одинаковые по форме запросы, повторенные threshold раз
+    и больше, - признак N+1 (запрос на каждую строку).
+    """
+
+    def __init__(self):
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.add(sql)
+        return execute(sql, params, many, context)
+
+    def add(self, sql):
+        self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold):
+        return [
+            (sql, count)
+            for sql, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+    def check(self, label, threshold, action='raise'):
+        """Предупреждение в лог (warn) или NPlusOneError (raise)."""
+        repeated = self.repeated(threshold)
+        if not repeated:
+            return
+        message = f'N+1 в {label}: ' + '; '.join(
+            f'{count} раз {sql}' for sql, count in repeated
+        )
+        if action == 'raise':
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+class NPlusOneMiddleware:
+    """
+    Поиск N+1 в каждом запросе.
+
+    N_PLUS_ONE['ACTION']: off - выключено, warn - предупреждение
+    в лог api.queries, raise - NPlusOneError (для тестов).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        action = settings.N_PLUS_ONE['ACTION']
+        if action == 'off':
+            return self.get_response(request)
+
+        detector = QueryDetector()
+        with request_timings(request) as timings:
+            timings.detector = detector
+            try:
+                response = self.get_response(request)
+            finally:
+                timings.detector = None
+        detector.check(
+            f'{request.method} {request.path}',
+            settings.N_PLUS_ONE['THRESHOLD'],
+            action
+        )
+        return response
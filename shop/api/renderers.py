@@ -0,0 +1,171 @@
+import csv
+import math
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+def has_non_finite(data):
+    """Есть ли в словарях и списках data NaN или бесконечность."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(has_non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(has_non_finite(value) for value in data)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если он установлен.
+
+    Ответ совпадает с JSONRenderer байт в байт: datetime, date, time
+    и UUID orjson пишет сам (UTC как Z), остальные типы (Decimal,
+    ленивые строки, QuerySet) уходят в default кодировщика DRF.
+    Отступы, ensure_ascii и все, что orjson не может записать
+    (например, целые больше 64 бит), рендерятся стандартным json.
+    NaN и бесконечность orjson пишет как null, а JSONRenderer
+    отвергает (ValueError): если в ответе есть null, данные
+    проверяются на такие float и рендерятся стандартным json.
+
+    Единственное отличие - float в экспоненциальной записи:
+    1e20 вместо 1e+20 (то же число). Цены и суммы сериализаторы
+    отдают строками, их формат ('0.00') не меняется.
+    """
+
+    options = orjson.OPT_UTC_Z if orjson is not None else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'null' in ret and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser на orjson, если он установлен.
+
+    Тело, которое orjson не разобрал (NaN, большие целые,
+    одиночные суррогаты, ошибки синтаксиса), разбирается
+    стандартным json, поэтому результат и тексты ошибок
+    такие же, как у JSONParser.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass
+
+        try:
+            return json.loads(
+                body.decode(encoding),
+                parse_constant=json.strict_constant if self.strict else None
+            )
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    JSON Lines: один объект на строку.
+
+    stream() отдает строки по одной для StreamingHttpResponse,
+    render() - для обычных ответов (например, ошибок).
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.stream(
+            data if isinstance(data, list) else [data]
+        ))
+
+    def stream(self, rows):
+        render = FastJSONRenderer().render
+        for row in rows:
+            yield render(row) + b'\n'
+
+
+class Echo:
+    """Буфер для csv.writer, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV с заголовком из ключей первой строки.
+
+    stream() отдает строки по одной для StreamingHttpResponse,
+    render() - для обычных ответов (например, ошибок).
+    """
+
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return ''.join(self.stream(
+            data if isinstance(data, list) else [data]
+        )).encode(self.charset)
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        header = None
+        for row in rows:
+            if header is None:
+                header = list(row)
+                yield writer.writerow(header)
+            yield writer.writerow([row[name] for name in header])
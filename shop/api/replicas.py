@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from rest_framework.permissions import SAFE_METHODS
+
+from products.routers import replica_reads
+
+
+def read_only(view):
+    """
+    Отмечает обработчик POST, который только читает данные.
+
+    Такой запрос читает каталог с реплик, как GET,
+    и не закрепляет клиента за основной базой.
+    """
+    view.read_only = True
+    return view
+
+
+class ReplicaMiddleware:
+    """
+    Чтение каталога с реплик для безопасных запросов.
+
+    Успешная запись (POST, PUT, PATCH, DELETE - корзина,
+    регистрация и т.д.) ставит cookie, и следующие
+    STICKY_SECONDS секунд все запросы клиента читают
+    с основной базы: свои записи он видит сразу.
+    Обработчики, отмеченные read_only, считаются безопасными.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas['ALIASES']:
+            return self.get_response(request)
+
+        if request.method in SAFE_METHODS or self.is_read_only(request):
+            if self.is_pinned(request):
+                return self.get_response(request)
+            with replica_reads():
+                return self.get_response(request)
+
+        response = self.get_response(request)
+        if response.status_code < 400:
+            pinned_until = time.time() + replicas['STICKY_SECONDS']
+            response.set_cookie(
+                replicas['COOKIE'],
+                f'{pinned_until:.0f}',
+                max_age=replicas['STICKY_SECONDS'],
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
+
+    def is_read_only(self, request):
+        try:
+            view = resolve(request.path_info).func
+        except Resolver404:
+            return False
+        action = getattr(view, 'actions', {}).get(request.method.lower())
+        handler = getattr(getattr(view, 'cls', None), action or '', view)
+        return getattr(handler, 'read_only', False)
+
+    def is_pinned(self, request):
+        value = request.COOKIES.get(settings.DATABASE_REPLICAS['COOKIE'])
+        try:
+            return value is not None and float(value) > time.time()
+        except ValueError:
+            return False
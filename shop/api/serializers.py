@@ -1,7 +1,21 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+    TokenVerifySerializer
+)
+from rest_framework_simplejwt.tokens import UntypedToken
 
+from api.authentication import (
+    SESSION_CLAIM,
+    RoleRefreshToken,
+    is_token_revoked
+)
+from api.timing import TimedSerializerMixin
 from products.models import (
     Cart,
     CartProduct,
@@ -9,13 +23,16 @@ from products.models import (
     Product,
     SubCategory
 )
-from users.consts import ERRORS, MAGIC_NUMBERS
+from users.consts import CART_OPERATIONS, ERRORS, MAGIC_NUMBERS
 
 
 User = get_user_model()
 
 
-class UserSignUpSerializer(serializers.ModelSerializer):
+class UserSignUpSerializer(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор для регистрации пользователя."""
 
     class Meta:
@@ -52,7 +69,10 @@ class UserSignUpSerializer(serializers.ModelSerializer):
         return user
 
 
-class BaseCategorySerializer(serializers.ModelSerializer):
+class BaseCategorySerializer(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
     """Базовый сериализатор для категорий и подкатегорий."""
 
     class Meta:
@@ -101,7 +121,10 @@ class CategoryWithSubcategoriesSerializer(
         read_only_fields = fields
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор для товаров."""
 
     category = serializers.CharField(
@@ -128,12 +151,34 @@ class ProductSerializer(serializers.ModelSerializer):
             'product_url'
         )
         read_only_fields = fields
+        row_fields = {'product_url': ('slug', Product.build_short_url)}
 
     def get_product_url(self, obj):
         return obj.short_url
 
 
-class CartProductSerializer(serializers.ModelSerializer):
+class ProductLookupSerializer(serializers.Serializer):
+    """Сериализатор запроса товаров по списку слагов."""
+
+    slugs = serializers.ListField(
+        child=serializers.SlugField(),
+        allow_empty=False
+    )
+
+    def validate_slugs(self, value):
+        if len(value) > settings.PRODUCT_LOOKUP_LIMIT:
+            raise ValidationError(
+                ERRORS['product']['too_many'].format(
+                    limit=settings.PRODUCT_LOOKUP_LIMIT
+                )
+            )
+        return list(dict.fromkeys(value))
+
+
+class CartProductSerializer(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор для товаров в корзине."""
 
     product = ProductSerializer(read_only=True)
@@ -153,7 +198,10 @@ class CartProductSerializer(serializers.ModelSerializer):
         )
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор для корзины."""
 
     products = CartProductSerializer(many=True, source='cart_products')
@@ -188,3 +236,99 @@ class CartProductUpdateSerializer(serializers.ModelSerializer):
                 ERRORS['quantity']['less_than_zero']
             )
         return value
+
+
+class CartProductAddSerializer(serializers.Serializer):
+    """Сериализатор для добавления товара в корзину."""
+
+    quantity = serializers.IntegerField(
+        default=1,
+        max_value=MAGIC_NUMBERS['count']['max_cart_quantity']
+    )
+
+    def validate_quantity(self, value):
+        if value < 1:
+            raise ValidationError(
+                ERRORS['quantity']['not_positive']
+            )
+        return value
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """
+    Сериализатор операции над корзиной.
+
+    add - добавить quantity (по умолчанию 1),
+    set - установить quantity (0 - удалить),
+    remove - удалить товар.
+    """
+
+    op = serializers.ChoiceField(choices=CART_OPERATIONS)
+    product = serializers.SlugField()
+    quantity = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        max_value=MAGIC_NUMBERS['count']['max_cart_quantity']
+    )
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add':
+            attrs.setdefault('quantity', 1)
+            if attrs['quantity'] < 1:
+                raise ValidationError(
+                    {'quantity': ERRORS['quantity']['not_positive']}
+                )
+        elif attrs['op'] == 'set' and 'quantity' not in attrs:
+            raise ValidationError(
+                {'quantity': ERRORS['quantity']['required']}
+            )
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """Сериализатор пакета операций над корзиной."""
+
+    operations = serializers.ListField(
+        child=CartOperationSerializer(),
+        allow_empty=False,
+        max_length=MAGIC_NUMBERS['count']['max_cart_batch']
+    )
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача пары JWT с ролью пользователя."""
+
+    token_class = RoleRefreshToken
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление access-токена с проверкой списка отзыва."""
+
+    def validate(self, attrs):
+        if is_token_revoked(self.token_class(attrs['refresh'])):
+            raise InvalidToken(ERRORS['token']['revoked'])
+        return super().validate(attrs)
+
+
+class RoleTokenVerifySerializer(TokenVerifySerializer):
+    """Проверка JWT с учетом списка отзыва."""
+
+    def validate(self, attrs):
+        if is_token_revoked(UntypedToken(attrs['token'])):
+            raise InvalidToken(ERRORS['token']['revoked'])
+        return super().validate(attrs)
+
+
+class TokenLogoutSerializer(serializers.Serializer):
+    """Сериализатор для выхода: отзывает сессию refresh-токена."""
+
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        try:
+            token = RoleRefreshToken(value)
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+        if SESSION_CLAIM not in token:
+            raise InvalidToken(ERRORS['token']['no_session'])
+        return token
@@ -0,0 +1,173 @@
+import logging
+import random
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('api.timing')
+
+_current = ContextVar('server_timings', default=None)
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """execute_wrapper сразу для всех подключений к базам."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield wrapper
+
+
+class RequestTimings:
+    """
+    Время обработки одного запроса.
+
+    db - запросы ко всем базам (execute_wrapper), serialize -
+    сериализаторы DRF и собранные (без запросов к БД внутри),
+    render - рендеринг ответа DRF, app - остальное: middleware,
+    аутентификация и код представления. detector - QueryDetector
+    поиска N+1, получает каждый запрос к БД.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+        self.render_start = None
+        self.detector = None
+        self._serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.detector is not None:
+            self.detector.add(sql)
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += perf_counter() - start
+            self.queries += 1
+
+    @contextmanager
+    def measure_serialization(self):
+        """Замер сериализации; вложенные сериализаторы не считаются."""
+        if self._serializing:
+            yield
+            return
+        self._serializing = True
+        start, db = perf_counter(), self.db
+        try:
+            yield
+        finally:
+            self.serialize += perf_counter() - start - (self.db - db)
+            self._serializing = False
+
+    def start_render(self):
+        self.render_start = perf_counter()
+
+    def finish_render(self, response):
+        self.render += perf_counter() - self.render_start
+
+    def as_dict(self):
+        total = perf_counter() - self.start
+        return {
+            'total': total * 1000,
+            'db': self.db * 1000,
+            'app': (total - self.db - self.serialize - self.render) * 1000,
+            'serialize': self.serialize * 1000,
+            'render': self.render * 1000,
+        }
+
+
+@contextmanager
+def request_timings(request):
+    """
+    RequestTimings запроса под одной оберткой запросов к БД.
+
+    Метрики, Server-Timing и поиск N+1 делят их: обертку
+    execute_wrapper ставит первый из middleware, остальные
+    получают те же RequestTimings.
+    """
+    timings = getattr(request, 'timings', None)
+    if timings is not None:
+        yield timings
+        return
+    timings = request.timings = RequestTimings()
+    with wrap_queries(timings):
+        yield timings
+
+
+def timed_serialization():
+    """Замер сериализации, если текущий запрос попал в выборку."""
+    timings = _current.get()
+    if timings is None:
+        return nullcontext()
+    return timings.measure_serialization()
+
+
+class TimedSerializerMixin:
+    """Сериализатор, время которого попадает в Server-Timing."""
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class ServerTimingMiddleware:
+    """
+    Заголовок Server-Timing и строка лога для доли запросов.
+
+    Доля задается SERVER_TIMING['SAMPLE_RATE']; запросы к базе
+    считаются в общих RequestTimings (request_timings).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        with request_timings(request) as timings:
+            request.server_timings = timings
+            token = _current.set(timings)
+            try:
+                response = self.get_response(request)
+            finally:
+                _current.reset(token)
+
+        durations = timings.as_dict()
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={durations["db"]:.2f};desc="{timings.queries} queries"',
+            *(
+                f'{name};dur={durations[name]:.2f}'
+                for name in ('app', 'serialize', 'render', 'total')
+            ),
+        ))
+        logger.info(
+            'method=%s path=%s status=%s queries=%s '
+            'db_ms=%.2f app_ms=%.2f serialize_ms=%.2f render_ms=%.2f '
+            'total_ms=%.2f',
+            request.method,
+            request.path,
+            response.status_code,
+            timings.queries,
+            durations['db'],
+            durations['app'],
+            durations['serialize'],
+            durations['render'],
+            durations['total'],
+            extra={'queries': timings.queries, **durations}
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        """Замер рендеринга: вызывается прямо перед response.render()."""
+        timings = getattr(request, 'server_timings', None)
+        if timings is not None:
+            timings.start_render()
+            response.add_post_render_callback(timings.finish_render)
+        return response
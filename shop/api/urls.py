@@ -6,6 +6,7 @@ from .views import (
     CartViewSet,
     product_redirect,
     ProductViewSet,
+    TokenLogoutView,
     UserViewSet,
 )
 
@@ -18,6 +19,12 @@ router.register('users', UserViewSet, basename='users')
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path(
+        'auth/jwt/logout/',
+        TokenLogoutView.as_view(),
+        name='jwt-logout'
+    ),
+    path('auth/', include('djoser.urls.jwt')),
     path(
         'categories/'
         '<slug:category_slug>/'
@@ -1,11 +1,36 @@
+from collections import Counter, namedtuple
+
+from django.db.models import Case, Count, IntegerField, Value, When
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.status import HTTP_200_OK as OK
 
+from products.cache import get_category_tree
+from products.models import Cart, CartProduct, Product
+from users.consts import ERRORS, MAGIC_NUMBERS
+
+
+CartContents = namedtuple(
+    'CartContents',
+    (
+        'id',
+        'updated_at',
+        'cart_products',
+        'total_quantity',
+        'total_price'
+    )
+)
+
 
-def paginated_response(queryset, request, serializer_class):
+def paginated_response(
+        queryset,
+        request,
+        serializer_class,
+        paginator_class=PageNumberPagination
+):
     """Функция для пагинации."""
-    paginator = PageNumberPagination()
+    paginator = paginator_class()
     page = paginator.paginate_queryset(queryset, request)
 
     if page is not None:
@@ -14,3 +39,219 @@ def paginated_response(queryset, request, serializer_class):
 
     serializer = serializer_class(queryset, many=True)
     return Response(serializer.data, status=OK)
+
+
+def get_cart_contents(user):
+    """
+    Корзина пользователя с товарами и итогами.
+
+    Товары и суммы по строкам читаются одним запросом вместе
+    с корзиной, итоги хранятся в самой корзине,
+    подкатегории и категории берутся из снимка дерева категорий.
+    Для пустой корзины нужен еще один запрос за самой корзиной.
+    """
+    items = list(
+        CartProduct.objects.filter(
+            cart__user_id=user.id
+        ).with_line_totals()
+    )
+    if items:
+        cart = items[0].cart
+    else:
+        cart, created = Cart.objects.get_or_create(user_id=user.id)
+
+    get_category_tree().attach_subcategories(
+        item.product for item in items
+    )
+    return CartContents(
+        id=cart.id,
+        updated_at=cart.updated_at,
+        cart_products=items,
+        total_quantity=cart.total_quantity,
+        total_price=cart.total_price
+    )
+
+
+def fold_cart_operations(operations):
+    """
+    Сводит операции к итоговому изменению по каждому товару.
+
+    Возвращает словарь {слаг: (абсолютное ли значение, количество)}:
+    после set и remove количество абсолютное, после одних add -
+    прибавка к текущему.
+    """
+    changes = {}
+    for operation in operations:
+        slug = operation['product']
+        if operation['op'] == 'remove':
+            changes[slug] = (True, 0)
+        elif operation['op'] == 'set':
+            changes[slug] = (True, operation['quantity'])
+        else:
+            absolute, quantity = changes.get(slug, (False, 0))
+            changes[slug] = (absolute, quantity + operation['quantity'])
+    return changes
+
+
+def apply_cart_operations(user, operations):
+    """
+    Применяет пакет операций к корзине пользователя.
+
+    Слаги разрешаются одним запросом, затем выполняются
+    одно удаление, одна вставка с обновлением количеств
+    и одна вставка с увеличением количеств, после чего
+    итоги корзины пересчитываются по товарам.
+    Если количество товара превысит допустимое, пакет
+    отклоняется: суммы пакета - ValidationError, сумма
+    с количеством в корзине - DataError из БД, как при
+    добавлении одного товара.
+    Вызывается внутри транзакции: добавляемые товары
+    и корзина блокируются до конца транзакции, чтобы пересчет
+    не потерял параллельные записи и смену цены.
+    """
+    changes = fold_cart_operations(operations)
+    product_ids = dict(
+        Product.objects.filter(
+            slug__in=changes
+        ).values_list('slug', 'id')
+    )
+    missing = sorted(set(changes) - set(product_ids))
+    if missing:
+        raise ValidationError(
+            {'products': ERRORS['product']['not_found'].format(
+                slugs=', '.join(missing)
+            )}
+        )
+
+    max_quantity = MAGIC_NUMBERS['count']['max_cart_quantity']
+    if any(
+        quantity > max_quantity for _, quantity in changes.values()
+    ):
+        raise ValidationError({'quantity': ERRORS['quantity']['too_many']})
+
+    removed, quantities, increments = [], {}, {}
+    for slug, (absolute, quantity) in changes.items():
+        product_id = product_ids[slug]
+        if not absolute:
+            increments[product_id] = quantity
+        elif quantity:
+            quantities[product_id] = quantity
+        else:
+            removed.append(product_id)
+
+    CartProduct.objects.lock_products({*quantities, *increments})
+    cart, created = Cart.objects.select_for_update(
+        no_key=True
+    ).get_or_create(user_id=user.id)
+    if removed:
+        CartProduct.objects.filter(
+            cart=cart,
+            product_id__in=removed
+        ).delete()
+    CartProduct.objects.set_quantities(cart.id, quantities)
+    CartProduct.objects.add_quantities(cart.id, increments)
+    Cart.objects.filter(pk=cart.pk).recalculate_totals()
+
+
+def get_product_facets(queryset):
+    """
+    Фасеты для отфильтрованных товаров.
+
+    Количество товаров по категориям, подкатегориям и ценовым
+    интервалам из MAGIC_NUMBERS['facets']['price_buckets'].
+    Считается одним запросом с группировкой по подкатегории
+    и номеру интервала, названия берутся из снимка дерева категорий.
+    """
+    bounds = MAGIC_NUMBERS['facets']['price_buckets']
+    bucket = Case(
+        *(
+            When(price__lt=bound, then=Value(index))
+            for index, bound in enumerate(bounds)
+        ),
+        default=Value(len(bounds)),
+        output_field=IntegerField()
+    )
+    groups = queryset.order_by().values(
+        'subcategory_id',
+        bucket=bucket
+    ).annotate(count=Count('id'))
+
+    subcategory_counts, category_counts, bucket_counts = (
+        Counter(), Counter(), Counter()
+    )
+    tree = get_category_tree()
+    for group in groups:
+        subcategory = tree.subcategories_by_id.get(group['subcategory_id'])
+        if subcategory is None:
+            continue
+        subcategory_counts[subcategory] += group['count']
+        category_counts[subcategory.category] += group['count']
+        bucket_counts[group['bucket']] += group['count']
+
+    return {
+        'categories': [
+            {
+                'slug': category.slug,
+                'name': category.name,
+                'count': category_counts[category],
+            }
+            for category in tree.categories if category in category_counts
+        ],
+        'subcategories': [
+            {
+                'slug': subcategory.slug,
+                'name': subcategory.name,
+                'category': subcategory.category.slug,
+                'count': count,
+            }
+            for subcategory, count in sorted(
+                subcategory_counts.items(),
+                key=lambda item: (item[0].category.name, item[0].name)
+            )
+        ],
+        'price': [
+            {
+                'from': lower,
+                'to': upper,
+                'count': bucket_counts[index],
+            }
+            for index, (lower, upper) in enumerate(
+                zip((0, *bounds), (*bounds, None))
+            )
+        ],
+    }
+
+
+EXPORT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'price': 'price',
+    'category': 'subcategory__category__slug',
+    'subcategory': 'subcategory__slug',
+    'image_small': 'image_small',
+    'image_medium': 'image_medium',
+    'image_large': 'image_large',
+}
+EXPORT_IMAGES = ('image_small', 'image_medium', 'image_large')
+
+
+def export_products(queryset):
+    """
+    Плоские строки товаров для выгрузки каталога.
+
+    Строки читаются серверным курсором порциями
+    по MAGIC_NUMBERS['count']['export_chunk_size'], поэтому
+    память не зависит от размера каталога. Цена - строкой,
+    как в API, изображения - ссылками из хранилища.
+    """
+    storage = Product._meta.get_field('image_small').storage
+    rows = queryset.order_by('id').values_list(*EXPORT_FIELDS.values())
+    for values in rows.iterator(
+        chunk_size=MAGIC_NUMBERS['count']['export_chunk_size']
+    ):
+        row = dict(zip(EXPORT_FIELDS, values))
+        row['price'] = str(row['price'])
+        for name in EXPORT_IMAGES:
+            row[name] = storage.url(row[name]) if row[name] else None
+        yield row
@@ -1,10 +1,15 @@
+from django.db import DataError, transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
     AllowAny,
     IsAdminUser,
     IsAuthenticated
 )
+from rest_framework.generics import GenericAPIView
 from rest_framework.mixins import CreateModelMixin
 from rest_framework.response import Response
 from rest_framework.status import (
@@ -18,27 +23,53 @@ from rest_framework.viewsets import (
     ReadOnlyModelViewSet
 )
 
+from api.authentication import SESSION_CLAIM
+from api.cache import (
+    cache_response,
+    check_cart_preconditions,
+    conditional_cart_write,
+    get_cart_etag,
+    set_cart_headers,
+    touch_cart
+)
+from api.compiled import get_compiled_serializer
+from api.filters import ProductFilter, ProductSearchFilter
+from api.pagination import CatalogPagination
 from api.permissions import (
     CartPermission,
 )
+from api.renderers import CSVRenderer, NDJSONRenderer
+from api.replicas import read_only
 from api.serializers import (
+    CartBatchSerializer,
+    CartProductAddSerializer,
     CartSerializer,
     CartProductSerializer,
     CartProductUpdateSerializer,
     CategorySerializer,
     CategoryWithSubcategoriesSerializer,
+    ProductLookupSerializer,
     ProductSerializer,
     SubCategorySerializer,
+    TokenLogoutSerializer,
     UserSignUpSerializer
 )
-from api.utils import paginated_response
+from api.utils import (
+    apply_cart_operations,
+    export_products,
+    get_cart_contents,
+    get_product_facets,
+    paginated_response
+)
+from products.cache import get_category_tree
 from products.models import (
-    Cart,
     CartProduct,
     Category,
     Product,
-    SubCategory
 )
+from products.routers import keep_replica_reads
+from users.cache import revoke_session
+from users.consts import ERRORS
 
 
 class UserViewSet(
@@ -65,6 +96,25 @@ class UserViewSet(
         )
 
 
+class TokenLogoutView(GenericAPIView):
+    """
+    Выход из JWT-сессии.
+
+    - POST /auth/jwt/logout/ {"refresh": "..."}
+        - отзывает refresh-токен и выданные по нему access-токены
+    """
+
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    serializer_class = TokenLogoutSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        revoke_session(serializer.validated_data['refresh'][SESSION_CLAIM])
+        return Response(status=NO_CONTENT)
+
+
 class CategoryViewSet(ReadOnlyModelViewSet):
     """
     Категории с подкатегориями.
@@ -75,6 +125,9 @@ class CategoryViewSet(ReadOnlyModelViewSet):
         - категория с подкатегориями
     - GET /categories/{category_slug}/{subcategory_slug}/
         - подкатегория с продуктами
+
+    Категории и подкатегории берутся из снимка дерева категорий
+    процесса, без запросов к БД. Ответы кэшируются.
     """
 
     queryset = Category.objects.prefetch_related(
@@ -87,11 +140,25 @@ class CategoryViewSet(ReadOnlyModelViewSet):
             return CategoryWithSubcategoriesSerializer
         return CategorySerializer
 
+    def get_object(self):
+        category = get_category_tree().get_category(self.kwargs['slug'])
+        if category is None:
+            raise Http404
+        return category
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        """Список категорий."""
+        page = self.paginate_queryset(get_category_tree().categories)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @cache_response
     def retrieve(self, request, *args, **kwargs):
         """Категория с подкатегориями."""
         instance = self.get_object()
         return paginated_response(
-            instance.subcategories.all(),
+            get_category_tree().get_subcategories(instance),
             request,
             SubCategorySerializer
         )
@@ -101,6 +168,7 @@ class CategoryViewSet(ReadOnlyModelViewSet):
         methods=['get'],
         url_path='(?P<subcategory_slug>[^/.]+)'
     )
+    @cache_response
     def subcategory_products(
         self,
         request,
@@ -108,20 +176,24 @@ class CategoryViewSet(ReadOnlyModelViewSet):
         subcategory_slug=None
     ):
         """Подкатегория с продуктами."""
-        category = get_object_or_404(
-            Category,
-            slug=slug,
+        subcategory = get_category_tree().get_subcategory(
+            slug,
+            subcategory_slug
         )
-        subcategory = get_object_or_404(
-            SubCategory,
-            category=category,
-            slug=subcategory_slug
+        if subcategory is None:
+            raise Http404
+
+        compiled = get_compiled_serializer(ProductSerializer, request)
+        paginator = CatalogPagination()
+        page = paginator.paginate_queryset(
+            compiled.values(
+                subcategory.products.all(),
+                *paginator.value_fields
+            ),
+            request
         )
-
-        return paginated_response(
-            subcategory.products.all(),
-            request,
-            ProductSerializer
+        return paginator.get_paginated_response(
+            compiled.serialize_many(page)
         )
 
 
@@ -131,57 +203,161 @@ class ProductViewSet(ReadOnlyModelViewSet):
 
     - GET /products/
         - список продуктов
+        - ?search=... - полнотекстовый поиск
+        - ?pagination=cursor&ordering=price - пагинация по ключу
+          (не вместе с ?search=, иначе 400)
+        - ?fields=id,name,price&expand=subcategory - только нужные поля
+        - ?price_min=&price_max=&category=a,b&subcategory=c - фильтры
+    - GET /products/export/?format=ndjson|csv
+        - потоковая выгрузка каталога с теми же фильтрами
+    - GET /products/facets/
+        - количество товаров по категориям, подкатегориям и ценам
+          с теми же фильтрами
     - GET /products/{slug}/
         - детальная информация о продукте
+    - POST /products/lookup/ {"slugs": [...]}
+        - товары по списку слагов в порядке запроса
     - POST /products/{slug}/to_cart/
         - добавить товар в корзину
+
+    Ответы на GET кэшируются.
     """
 
-    queryset = Product.objects.select_related(
-        'subcategory',
-        'subcategory__category'
-    ).all()
+    # Поисковый вектор нужен только в условиях поиска.
+    queryset = Product.objects.defer('search_vector')
     serializer_class = ProductSerializer
-    search_fields = (
-        'name',
-        'subcategory__name',
-        'subcategory__category__name'
-    )
-    filterset_fields = (
-        'subcategory__category__slug',
-        'subcategory__slug'
+    pagination_class = CatalogPagination
+    filter_backends = (
+        DjangoFilterBackend,
+        ProductSearchFilter
     )
+    filterset_class = ProductFilter
     lookup_field = 'slug'
 
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        """Список товаров: сериализуется прямо из строк .values()."""
+        if (
+            request.query_params.get(ProductSearchFilter.search_param)
+            and CatalogPagination.is_keyset(request)
+        ):
+            raise ValidationError(
+                {ProductSearchFilter.search_param: ERRORS['search']['cursor']}
+            )
+        compiled = get_compiled_serializer(ProductSerializer, request)
+        queryset = compiled.values(
+            self.filter_queryset(self.get_queryset()),
+            *self.pagination_class.value_fields
+        )
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(compiled.serialize_many(queryset, request))
+        return self.get_paginated_response(
+            compiled.serialize_many(page, request)
+        )
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        """Детальная информация о товаре."""
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_object(self):
+        product = super().get_object()
+        get_category_tree().attach_subcategories((product,))
+        return product
+
+    @action(
+        detail=False,
+        methods=['get'],
+        renderer_classes=(NDJSONRenderer, CSVRenderer)
+    )
+    def export(self, request):
+        """Выгрузка каталога: строки отдаются по мере чтения из БД."""
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            keep_replica_reads(renderer.stream(export_products(
+                self.filter_queryset(self.get_queryset())
+            ))),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="products.{renderer.format}"'
+        )
+        return response
+
+    @action(detail=False, methods=['get'])
+    @cache_response
+    def facets(self, request):
+        """Фасеты для отфильтрованного списка товаров."""
+        return Response(get_product_facets(
+            self.filter_queryset(self.get_queryset())
+        ))
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(AllowAny,)
+    )
+    @read_only
+    def lookup(self, request):
+        """
+        Товары по списку слагов одним запросом.
+
+        Порядок - как в запросе, повторы отбрасываются,
+        ненайденные слаги перечисляются в not_found.
+        Поддерживает ?fields= и ?expand=, как список товаров.
+        """
+        serializer = ProductLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        slugs = serializer.validated_data['slugs']
+
+        compiled = get_compiled_serializer(ProductSerializer, request)
+        rows = {
+            row['slug']: row
+            for row in compiled.values(
+                Product.objects.filter(slug__in=slugs),
+                'slug'
+            )
+        }
+        return Response({
+            'results': compiled.serialize_many(
+                (rows[slug] for slug in slugs if slug in rows),
+                request
+            ),
+            'not_found': [slug for slug in slugs if slug not in rows],
+        })
+
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=(IsAuthenticated,)
     )
+    @conditional_cart_write
     def to_cart(self, request, slug=None):
         """Добавить товар в корзину."""
-        product = get_object_or_404(Product, slug=slug)
-        cart, created = Cart.objects.get_or_create(user=request.user)
-
         if request.method == 'POST':
-            quantity = int(request.data.get('quantity', 1))
-            cart_item, created = CartProduct.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
-
+            serializer = CartProductAddSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            try:
+                with transaction.atomic():
+                    quantity = CartProduct.objects.add_to_cart(
+                        request.user.id,
+                        slug,
+                        serializer.validated_data['quantity']
+                    )
+            except DataError:
+                raise ValidationError(
+                    {'quantity': ERRORS['quantity']['too_many']}
+                )
+            if quantity is None:
+                raise Http404
             return Response(status=CREATED)
 
-        cart_item = get_object_or_404(
-            CartProduct, cart=cart,
-            product=product
-        )
-        cart_item.delete()
+        if not CartProduct.objects.remove_from_cart(request.user.id, slug):
+            raise Http404
         return Response(status=NO_CONTENT)
 
 
@@ -197,6 +373,11 @@ class CartViewSet(ModelViewSet):
         - удалить товар из корзины
     - DELETE /cart/clear/
         - очистить корзину
+    - POST /cart/batch/
+        - пакет операций add/set/remove по слагам товаров
+
+    GET отдает ETag и Last-Modified и отвечает 304
+    на условный запрос. Запись учитывает If-Match (412).
     """
 
     permission_classes = (
@@ -204,16 +385,11 @@ class CartViewSet(ModelViewSet):
         CartPermission
     )
     serializer_class = CartProductSerializer
-
-    def get_cart(self):
-        cart, created = Cart.objects.get_or_create(
-            user=self.request.user
-        )
-        return cart
+    lookup_value_regex = r'\d+'
 
     def get_queryset(self):
         return CartProduct.objects.filter(
-            cart__user=self.request.user
+            cart__user_id=self.request.user.id
         ).select_related(
             'product'
         )
@@ -223,52 +399,93 @@ class CartViewSet(ModelViewSet):
             return CartSerializer
         return CartProductUpdateSerializer
 
+    def get_cart_etag(self, cart):
+        return get_cart_etag(
+            cart,
+            (
+                (item.id, item.product_id, item.quantity, item.product.price)
+                for item in cart.cart_products
+            )
+        )
+
     def list(self, request, *args, **kwargs):
         """Список товаров в корзине."""
-        cart = self.get_cart()
+        cart = get_cart_contents(request.user)
+        etag = self.get_cart_etag(cart)
+        not_modified = check_cart_preconditions(request, cart, etag)
+        if not_modified is not None:
+            return not_modified
+
         serializer = CartSerializer(cart)
-        return Response(
-            serializer.data,
-            status=OK
+        return set_cart_headers(
+            Response(
+                serializer.data,
+                status=OK
+            ),
+            cart,
+            etag
         )
 
-    def update(self, request, *args, pk=None):
-        """Изменить количество товара."""
-        cart_product = get_object_or_404(
-            CartProduct,
-            id=pk
-        )
-        serializer = CartProductUpdateSerializer(
-            cart_product,
-            data=request.data,
+    @action(detail=False, methods=['post'])
+    @conditional_cart_write
+    @transaction.atomic
+    def batch(self, request):
+        """Пакет операций над корзиной, в ответе - новая корзина."""
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            apply_cart_operations(
+                request.user,
+                serializer.validated_data['operations']
+            )
+        except DataError:
+            raise ValidationError(
+                {'quantity': ERRORS['quantity']['too_many']}
+            )
+        touch_cart(request)
+
+        cart = get_cart_contents(request.user)
+        return set_cart_headers(
+            Response(CartSerializer(cart).data, status=OK),
+            cart,
+            self.get_cart_etag(cart)
         )
 
+    @conditional_cart_write
+    def update(self, request, *args, pk=None):
+        """Изменить количество товара."""
+        serializer = CartProductUpdateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        quantity = serializer.validated_data.get('quantity')
+        quantity = serializer.validated_data['quantity']
+
         if quantity == 0:
-            cart_product.delete()
+            if not CartProduct.objects.remove_item(request.user.id, pk):
+                raise Http404
             return Response(status=NO_CONTENT)
 
-        serializer.save()
+        if not CartProduct.objects.set_quantity(
+            request.user.id,
+            pk,
+            quantity
+        ):
+            raise Http404
         return Response(
             status=OK,
         )
 
+    @conditional_cart_write
     def destroy(self, request, *args, pk=None):
         """Удалить товар из корзины."""
-        cart_product = get_object_or_404(
-            CartProduct,
-            id=pk
-        )
-        cart_product.delete()
+        if not CartProduct.objects.remove_item(request.user.id, pk):
+            raise Http404
 
         return Response(status=NO_CONTENT)
 
     @action(detail=False, methods=['delete'])
+    @conditional_cart_write
     def clear(self, request):
         """Очистить корзину."""
-        cart = self.get_cart()
-        deleted_count, _ = cart.cart_products.all().delete()
+        CartProduct.objects.clear_cart(request.user.id)
 
         return Response(status=NO_CONTENT)
 
@@ -280,10 +497,15 @@ def product_redirect(
         product_slug
 ):
     """Перенаправление на товар из подкатегории."""
+    subcategory = get_category_tree().get_subcategory(
+        category_slug,
+        subcategory_slug
+    )
+    if subcategory is None:
+        raise Http404
     product = get_object_or_404(
-        Product,
+        Product.objects.only('slug'),
         slug=product_slug,
-        subcategory__slug=subcategory_slug,
-        subcategory__category__slug=category_slug
+        subcategory=subcategory
     )
     return redirect(f'/api/{product.short_url}')
@@ -0,0 +1,20 @@
+"""
+Настройки gunicorn: gunicorn shop.wsgi из папки shop
+(файл gunicorn.conf.py в текущей папке подхватывается сам).
+"""
+import os
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    """
+    Файлы метрик завершенного воркера.
+
+    Пулы соединений (shop_db_pool_*) - gauge с multiprocess_mode
+    livesum: значения процессов складываются по их файлам,
+    без удаления файлов соединения умершего воркера считались
+    бы открытыми до перезапуска gunicorn.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
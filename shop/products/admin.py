@@ -68,4 +68,4 @@ class ProductAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(
             request
-        ).select_related('subcategory')
+        ).select_related('subcategory__category')
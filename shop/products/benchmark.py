@@ -0,0 +1,389 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from products.cache import CATALOG, CATEGORY_TREE, invalidate
+from products.models import (
+    Cart,
+    CartProduct,
+    Category,
+    Product,
+    SubCategory
+)
+from users.cache import invalidate_tokens, revoke_users
+from users.consts import GENERATED_SLUG_PREFIX, GENERATED_USERNAME_PREFIX
+
+
+WORDS = (
+    'смартфон', 'ноутбук', 'наушники', 'футболка', 'куртка', 'чайник',
+    'сковорода', 'лампа', 'кресло', 'рюкзак', 'часы', 'планшет',
+)
+ADJECTIVES = (
+    'черный', 'белый', 'красный', 'беспроводной', 'компактный',
+    'игровой', 'детский', 'мужской', 'женский', 'кожаный',
+)
+BATCH_SIZE = 10000
+
+GENERATED_PASSWORD = 'benchmark'
+PROGRESS_EVERY = 100000
+MAX_CART_ITEMS = 10
+
+User = get_user_model()
+
+# Подкатегории сгенерированных категорий: все, что в них лежит,
+# удаляется вместе с ними.
+GENERATED_SUBCATEGORIES_SQL = """
+    SELECT id FROM {SubCategory}
+    WHERE slug LIKE %(slugs)s OR category_id IN (
+        SELECT id FROM {Category} WHERE slug LIKE %(slugs)s
+    )
+"""
+CLEAR_SQL = (
+    """
+    DELETE FROM {CartProduct}
+    WHERE cart_id IN (
+        SELECT id FROM {Cart} WHERE user_id = ANY(%(user_ids)s)
+    ) OR product_id IN (
+        SELECT id FROM {Product}
+        WHERE subcategory_id IN (%(subcategories)s)
+    )
+    """,
+    "DELETE FROM {Cart} WHERE user_id = ANY(%(user_ids)s)",
+    "DELETE FROM {Token} WHERE user_id = ANY(%(user_ids)s)",
+    "DELETE FROM {User} WHERE id = ANY(%(user_ids)s)",
+    "DELETE FROM {Product} WHERE subcategory_id IN (%(subcategories)s)",
+    "DELETE FROM {SubCategory} WHERE id IN (%(subcategories)s)",
+    "DELETE FROM {Category} WHERE slug LIKE %(slugs)s",
+)
+
+
+def copy_rows(model, columns, rows, stdout=None):
+    """
+    Загрузка строк в таблицу модели через COPY ... FROM STDIN.
+
+    Триггеры (поисковый вектор товара) срабатывают как при INSERT.
+    """
+    table = model._meta.db_table
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        with cursor.copy(
+            f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+        ) as copy:
+            for number, row in enumerate(rows, start=1):
+                copy.write_row(row)
+                if stdout is not None and number % PROGRESS_EVERY == 0:
+                    stdout.write(
+                        f'{table}: {number} '
+                        f'({number / (time.perf_counter() - start):.0f} '
+                        'строк/с)'
+                    )
+
+
+def analyze(*models):
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+
+class CatalogGenerator:
+    """
+    Детерминированный синтетический каталог для замеров.
+
+    Категории и подкатегории создаются через bulk_create,
+    товары, пользователи, корзины и их товары - через COPY.
+    Одинаковый seed дает одинаковые данные.
+    Слаги начинаются с GENERATED_SLUG_PREFIX, логины -
+    с GENERATED_USERNAME_PREFIX: таких не бывает у настоящих
+    данных, по ним clear() удаляет все сгенерированное.
+    """
+
+    def __init__(self, seed, stdout):
+        self.rng = random.Random(seed)
+        self.stdout = stdout
+
+    def generate(self, categories, subcategories, products, users, carts):
+        subcategory_ids = self.create_categories(categories, subcategories)
+        if products:
+            self.create_products(products, subcategory_ids)
+        if users:
+            self.create_users(users)
+        if carts:
+            self.create_carts(carts)
+        analyze(Category, SubCategory, Product, User, Cart, CartProduct)
+        invalidate(CATEGORY_TREE)
+        invalidate(CATALOG)
+
+    def create_categories(self, categories, subcategories):
+        if not categories:
+            return list(SubCategory.objects.filter(
+                slug__startswith=GENERATED_SLUG_PREFIX
+            ).values_list('id', flat=True))
+
+        created = Category.objects.bulk_create(
+            Category(
+                name=f'{self.rng.choice(WORDS).capitalize()} {number}',
+                slug=f'{GENERATED_SLUG_PREFIX}category-{number}'
+            )
+            for number in range(categories)
+        )
+        created = SubCategory.objects.bulk_create(
+            SubCategory(
+                name=(
+                    f'{self.rng.choice(ADJECTIVES).capitalize()} '
+                    f'{self.rng.choice(WORDS)} {category.id}-{number}'
+                ),
+                slug=f'{category.slug}-{number}',
+                category=category
+            )
+            for category in created
+            for number in range(subcategories)
+        )
+        self.stdout.write(f'Создано подкатегорий: {len(created)}')
+        return [subcategory.id for subcategory in created]
+
+    def create_products(self, count, subcategory_ids):
+        if not subcategory_ids:
+            raise ValueError('Нет подкатегорий для товаров.')
+        rng = self.rng
+        copy_rows(
+            Product,
+            ('name', 'slug', 'subcategory_id', 'price', 'image_small'),
+            (
+                (
+                    f'{rng.choice(ADJECTIVES)} {rng.choice(WORDS)} {number}',
+                    f'{GENERATED_SLUG_PREFIX}{number}',
+                    rng.choice(subcategory_ids),
+                    f'{rng.randint(100, 100000)}.{rng.randint(0, 99):02}',
+                    f'products/small/generated-{number}.jpg'
+                )
+                for number in range(count)
+            ),
+            self.stdout
+        )
+        self.stdout.write(f'Создано товаров: {count}')
+
+    def create_users(self, count):
+        password = make_password(GENERATED_PASSWORD)
+        now = timezone.now()
+        copy_rows(
+            User,
+            (
+                'username', 'email', 'password', 'first_name', 'last_name',
+                'role', 'is_superuser', 'is_staff', 'is_active',
+                'date_joined'
+            ),
+            (
+                (
+                    f'{GENERATED_USERNAME_PREFIX}user-{number}',
+                    f'user-{number}@generated.invalid',
+                    password, '', '', 'user', False, False, True, now
+                )
+                for number in range(count)
+            ),
+            self.stdout
+        )
+        self.stdout.write(f'Создано пользователей: {count}')
+
+    def create_carts(self, count):
+        """
+        Корзины первых count сгенерированных пользователей.
+
+        В каждой от 1 до MAX_CART_ITEMS разных сгенерированных
+        товаров, итоги пересчитываются одним UPDATE.
+        """
+        user_ids = list(User.objects.filter(
+            username__startswith=GENERATED_USERNAME_PREFIX,
+            cart__isnull=True
+        ).order_by('id').values_list('id', flat=True)[:count])
+        product_ids = list(Product.objects.filter(
+            slug__startswith=GENERATED_SLUG_PREFIX
+        ).order_by('id').values_list('id', flat=True))
+        if not product_ids:
+            raise ValueError('Нет товаров для корзин.')
+
+        now = timezone.now()
+        copy_rows(
+            Cart,
+            (
+                'user_id', 'created_at', 'updated_at', 'total_quantity',
+                'total_price'
+            ),
+            ((user_id, now, now, 0, 0) for user_id in user_ids)
+        )
+        cart_ids = list(Cart.objects.filter(
+            user_id__in=user_ids
+        ).order_by('id').values_list('id', flat=True))
+
+        rng = self.rng
+        copy_rows(
+            CartProduct,
+            ('cart_id', 'product_id', 'quantity'),
+            (
+                (cart_id, product_id, rng.randint(1, 5))
+                for cart_id in cart_ids
+                for product_id in rng.sample(
+                    product_ids,
+                    min(rng.randint(1, MAX_CART_ITEMS), len(product_ids))
+                )
+            ),
+            self.stdout
+        )
+        Cart.objects.filter(user_id__in=user_ids).recalculate_totals()
+        self.stdout.write(f'Создано корзин: {len(user_ids)}')
+
+    def exists(self):
+        """Есть ли в БД сгенерированные категории, товары или логины."""
+        return any(
+            queryset.exists()
+            for queryset in (
+                Category.objects.filter(
+                    slug__startswith=GENERATED_SLUG_PREFIX
+                ),
+                Product.objects.filter(slug__startswith=GENERATED_SLUG_PREFIX),
+                User.objects.filter(
+                    username__startswith=GENERATED_USERNAME_PREFIX
+                ),
+            )
+        )
+
+    def clear(self):
+        """
+        Удаляет сгенерированные данные, начиная с зависимых таблиц.
+
+        Удаление идет без сигналов, поэтому токены удаленных
+        пользователей сбрасываются из кэша, а их JWT отзываются
+        явно.
+        """
+        tables = {
+            model.__name__: model._meta.db_table
+            for model in (
+                Cart, CartProduct, Category, Product, SubCategory, Token,
+                User
+            )
+        }
+        # В LIKE "_" - любой символ.
+        slugs = GENERATED_SLUG_PREFIX.replace('_', '\\_') + '%'
+        with transaction.atomic():
+            users = User.objects.filter(
+                username__startswith=GENERATED_USERNAME_PREFIX
+            )
+            user_ids = list(users.values_list('id', flat=True))
+            token_keys = list(Token.objects.filter(
+                user__in=users
+            ).values_list('key', flat=True))
+            with connection.cursor() as cursor:
+                for sql in CLEAR_SQL:
+                    cursor.execute(
+                        sql.format(**tables).replace(
+                            '%(subcategories)s',
+                            GENERATED_SUBCATEGORIES_SQL.format(**tables)
+                        ),
+                        {'slugs': slugs, 'user_ids': user_ids}
+                    )
+        invalidate_tokens(token_keys)
+        revoke_users(user_ids)
+        Cart.objects.with_drift().recalculate_totals()
+        invalidate(CATEGORY_TREE)
+        invalidate(CATALOG)
+
+
+def add_generated_catalog_arguments(parser):
+    """Аргументы замера на текущем или сгенерированном каталоге."""
+    parser.add_argument(
+        '--products',
+        type=int,
+        default=0,
+        help=(
+            'Сгенерировать столько товаров (generate_catalog) '
+            'на время замера, иначе - замер на текущих данных.'
+        )
+    )
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def add_catalog_arguments(parser, requests, warmup):
+    """Аргументы замера эндпоинтов на текущем или сгенерированном каталоге."""
+    add_generated_catalog_arguments(parser)
+    parser.add_argument('--requests', type=int, default=requests)
+    parser.add_argument('--warmup', type=int, default=warmup)
+
+
+@contextmanager
+def generated_catalog(options, stdout):
+    """
+    Сгенерированный каталог на время замера.
+
+    С --products генерирует каталог (CatalogGenerator), если
+    сгенерированных данных еще нет, и удаляет его на выходе.
+    """
+    generator = CatalogGenerator(options['seed'], stdout)
+    if options['products']:
+        if generator.exists():
+            raise CommandError(
+                'Сгенерированные данные уже есть: удалите их '
+                '(generate_catalog --clear) или запустите без --products.'
+            )
+        generator.generate(10, 10, options['products'], 0, 0)
+    try:
+        yield
+    finally:
+        if options['products']:
+            generator.clear()
+
+
+@contextmanager
+def benchmark_catalog(options, stdout, catalog_cache=True):
+    """
+    Каталог и настройки на время замера эндпоинтов.
+
+    Каталог - как в generated_catalog. APIClient ходит
+    на testserver, без catalog_cache ответы каталога
+    не кэшируются.
+    """
+    if options['requests'] < 2:
+        raise CommandError('Для перцентилей нужно --requests не меньше 2.')
+
+    overrides = {
+        'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+    }
+    if not catalog_cache:
+        overrides['CATALOG_CACHE'] = {
+            **settings.CATALOG_CACHE,
+            'TIMEOUTS': {},
+        }
+    with generated_catalog(options, stdout):
+        with override_settings(**overrides):
+            yield
+
+
+def time_requests(request, count, reset=None):
+    """
+    Задержки count вызовов request в мс.
+
+    reset вызывается после каждого вызова вне замера: возвращает
+    данные в исходное состояние (товар в корзине).
+    """
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        request()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if reset is not None:
+            reset()
+    return latencies
+
+
+def get_percentiles(latencies):
+    """p50, p95 и p99 задержек."""
+    percentiles = statistics.quantiles(latencies, n=100)
+    return statistics.median(latencies), percentiles[94], percentiles[98]
@@ -0,0 +1,146 @@
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+from threading import Lock
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.db import transaction
+
+from products.models import Category, SubCategory
+
+
+CATALOG = 'catalog'
+CATEGORY_TREE = 'category_tree'
+VERSION_KEY = 'products:version:{}'
+CHANGED_KEY = 'products:changed'
+
+_tree = None
+_tree_lock = Lock()
+
+
+def get_version(name):
+    """Текущая версия данных из общего кэша."""
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Увеличивает версию данных в общем кэше и отмечает время записи."""
+    key = VERSION_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+    cache.set(CHANGED_KEY, time.time(), timeout=None)
+
+
+def get_changed_at():
+    """Время последней записи каталога (timestamp) или None."""
+    return cache.get(CHANGED_KEY)
+
+
+def invalidate(name):
+    """
+    Сбрасывает версию сразу и еще раз после коммита.
+
+    Второй сброс нужен, чтобы другой процесс не закэшировал
+    данные, прочитанные до коммита транзакции.
+    """
+    bump_version(name)
+    transaction.on_commit(partial(bump_version, name))
+
+
+@dataclass(frozen=True)
+class CategoryTree:
+    """
+    Неизменяемый снимок дерева категорий и подкатегорий.
+
+    Объекты моделей в снимке общие для всех запросов процесса,
+    изменять их нельзя.
+    """
+
+    version: int
+    categories: tuple
+    categories_by_slug: MappingProxyType
+    subcategories_by_category: MappingProxyType
+    subcategories_by_slug: MappingProxyType
+    subcategories_by_id: MappingProxyType
+
+    @classmethod
+    def build(cls, version):
+        categories = tuple(Category.objects.all())
+        categories_by_id = {
+            category.id: category for category in categories
+        }
+
+        subcategories = tuple(SubCategory.objects.all())
+        grouped = defaultdict(list)
+        for subcategory in subcategories:
+            subcategory.category = categories_by_id[subcategory.category_id]
+            grouped[subcategory.category_id].append(subcategory)
+
+        return cls(
+            version=version,
+            categories=categories,
+            categories_by_slug=MappingProxyType({
+                category.slug: category for category in categories
+            }),
+            subcategories_by_category=MappingProxyType({
+                category.id: tuple(grouped[category.id])
+                for category in categories
+            }),
+            subcategories_by_slug=MappingProxyType({
+                (subcategory.category.slug, subcategory.slug): subcategory
+                for subcategory in subcategories
+            }),
+            subcategories_by_id=MappingProxyType({
+                subcategory.id: subcategory for subcategory in subcategories
+            }),
+        )
+
+    def get_category(self, slug):
+        return self.categories_by_slug.get(slug)
+
+    def get_subcategories(self, category):
+        return self.subcategories_by_category.get(category.id, ())
+
+    def get_subcategory(self, category_slug, subcategory_slug):
+        return self.subcategories_by_slug.get(
+            (category_slug, subcategory_slug)
+        )
+
+    def attach_subcategories(self, products):
+        """Подставляет подкатегории из снимка вместо JOIN."""
+        for product in products:
+            subcategory = self.subcategories_by_id.get(
+                product.subcategory_id
+            )
+            if subcategory is not None:
+                product.subcategory = subcategory
+        return products
+
+
+def get_category_tree():
+    """
+    Снимок дерева категорий текущего процесса.
+
+    Пересобирается, когда версия в общем кэше
+    изменилась после записи категорий в любом процессе.
+    """
+    global _tree
+
+    version = get_version(CATEGORY_TREE)
+    tree = _tree
+    if tree is not None and tree.version == version:
+        return tree
+
+    with _tree_lock:
+        if _tree is None or _tree.version != version:
+            _tree = CategoryTree.build(version)
+        return _tree
@@ -0,0 +1,299 @@
+import csv
+import json
+import re
+from decimal import Decimal, InvalidOperation
+from urllib.parse import unquote, urlsplit
+
+from django.core.validators import slug_re
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from products.cache import CATALOG, invalidate
+from products.models import CartProduct, Category, Product, SubCategory
+from users.consts import GENERATED_SLUG_PREFIX, MAGIC_NUMBERS
+
+
+IMAGE_FIELDS = ('image_small', 'image_medium', 'image_large')
+UPDATE_FIELDS = ('name', 'price', 'subcategory')
+DEFAULT_SLUG = 'product'
+# Запас длины слага под суффикс -N.
+MAX_SLUG_BASE = MAGIC_NUMBERS['count']['max_length'] - 10
+MAX_PRICE = Decimal(10) ** (
+    MAGIC_NUMBERS['count']['max_decimal_digits']
+    - MAGIC_NUMBERS['count']['max_decimal_places']
+)
+
+
+class RowError(ValueError):
+    """Строка выгрузки, которую нельзя импортировать."""
+
+
+def check_new_slug(slug):
+    """Слаг новой категории или подкатегории."""
+    if (
+        not slug_re.match(slug)
+        or slug.startswith(GENERATED_SLUG_PREFIX)
+    ):
+        raise RowError(f'неверный слаг {slug!r}')
+
+
+def get_text(row, field):
+    """Значение колонки строкой без пробелов по краям."""
+    value = row.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def get_image_name(value):
+    """
+    Имя файла изображения в хранилище.
+
+    Выгрузка отдает URL хранилища (storage.url), из него
+    убирается base_url хранилища. Другие URL не принимаются.
+    """
+    storage = Product._meta.get_field('image_small').storage
+    base_url = storage.base_url or ''
+    if base_url and value.startswith(base_url):
+        return unquote(value[len(base_url):])
+    if value.startswith('/') or urlsplit(value).scheme:
+        raise RowError(f'изображение не из хранилища {value!r}')
+    return value
+
+
+def read_rows(stream, format):
+    """
+    Пары (номер строки файла, словарь) по одной: csv или jsonl.
+
+    Колонки совпадают с GET /api/products/export/. Вместо
+    словаря для строки, которая не разбирается как JSON,
+    отдается RowError.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as error:
+            yield number, RowError(f'неверный JSON: {error.msg}')
+
+
+def iter_batches(rows, batch_size):
+    batch = []
+    for number, row in rows:
+        batch.append((number, row))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class CatalogImporter:
+    """
+    Пакетная загрузка товаров с обновлением по слагу.
+
+    Категории и подкатегории ищутся по слагу в словарях,
+    загруженных один раз; недостающие создаются, если в строке
+    есть category_name и subcategory_name. Товары без слага
+    получают уникальный слаг из названия, проверка занятых
+    слагов - одним запросом на пакет. Пакет записывается
+    одним INSERT ... ON CONFLICT (slug) DO UPDATE в транзакции,
+    перед которым новые цены переносятся в итоги корзин.
+
+    Сигналы моделей не вызываются, кэш каталога
+    сбрасывается после каждого пакета.
+    """
+
+    def __init__(self, images=False):
+        self.update_fields = UPDATE_FIELDS + (IMAGE_FIELDS if images else ())
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.subcategories = {
+            slug: (id, category_id)
+            for slug, id, category_id in SubCategory.objects.values_list(
+                'slug',
+                'id',
+                'category_id'
+            )
+        }
+        self.created = self.updated = 0
+        self.errors = []
+
+    def import_batch(self, batch):
+        """Записывает пакет [(номер строки, словарь)], ошибки копит."""
+        products = []
+        for number, row in batch:
+            try:
+                products.append(self.build_product(row))
+            except RowError as error:
+                self.errors.append((number, str(error)))
+
+        products = self.deduplicate(products)
+        self.generate_slugs(
+            [product for product in products if not product.slug],
+            {product.slug for product in products if product.slug}
+        )
+        if not products:
+            return
+
+        with transaction.atomic():
+            current = dict(Product.objects.filter(
+                slug__in=[product.slug for product in products]
+            ).values_list('slug', 'id'))
+            CartProduct.objects.reprice_products({
+                current[product.slug]: product.price
+                for product in products if product.slug in current
+            })
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=('slug',),
+                update_fields=self.update_fields
+            )
+        self.updated += len(current)
+        self.created += len(products) - len(current)
+        invalidate(CATALOG)
+
+    def build_product(self, row):
+        if isinstance(row, RowError):
+            raise row
+        if not isinstance(row, dict):
+            raise RowError('строка - не объект')
+        name = get_text(row, 'name')
+        if not name:
+            raise RowError('нет названия')
+        if len(name) > MAGIC_NUMBERS['count']['max_length']:
+            raise RowError('слишком длинное название')
+        try:
+            price = Decimal(str(row.get('price', '')).strip())
+        except InvalidOperation:
+            raise RowError(f'неверная цена {row.get("price")!r}')
+        if not price.is_finite() or not 0 <= price < MAX_PRICE:
+            raise RowError(f'неверная цена {row.get("price")!r}')
+
+        slug = get_text(row, 'slug')
+        if slug and (
+            not slug_re.match(slug)
+            or len(slug) > MAGIC_NUMBERS['count']['max_length']
+            or slug.startswith(GENERATED_SLUG_PREFIX)
+        ):
+            raise RowError(f'неверный слаг {slug!r}')
+
+        return Product(
+            name=name,
+            slug=slug,
+            price=price,
+            subcategory_id=self.get_subcategory_id(row),
+            **{
+                field: get_image_name(get_text(row, field)) or None
+                for field in IMAGE_FIELDS
+                if field in self.update_fields
+            }
+        )
+
+    def get_subcategory_id(self, row):
+        slug = get_text(row, 'subcategory')
+        if not slug:
+            raise RowError('нет подкатегории')
+        category_slug = get_text(row, 'category')
+        if slug in self.subcategories:
+            id, category_id = self.subcategories[slug]
+            if (
+                category_slug
+                and self.categories.get(category_slug) != category_id
+            ):
+                raise RowError(
+                    f'подкатегория {slug} не из категории {category_slug}'
+                )
+            return id
+
+        name = get_text(row, 'subcategory_name')
+        if not name or not category_slug:
+            raise RowError(
+                f'нет подкатегории {slug}, для создания нужны '
+                'category и subcategory_name'
+            )
+        check_new_slug(slug)
+        category_id = self.get_category_id(row, category_slug)
+        try:
+            with transaction.atomic():
+                subcategory = SubCategory.objects.create(
+                    name=name,
+                    slug=slug,
+                    category_id=category_id
+                )
+        except IntegrityError:
+            raise RowError(f'подкатегория {name!r} уже существует')
+        self.subcategories[slug] = (subcategory.id, subcategory.category_id)
+        return subcategory.id
+
+    def get_category_id(self, row, slug):
+        if slug not in self.categories:
+            name = get_text(row, 'category_name')
+            if not name:
+                raise RowError(
+                    f'нет категории {slug}, для создания нужно category_name'
+                )
+            check_new_slug(slug)
+            try:
+                with transaction.atomic():
+                    category = Category.objects.create(name=name, slug=slug)
+            except IntegrityError:
+                raise RowError(f'категория {name!r} уже существует')
+            self.categories[slug] = category.id
+        return self.categories[slug]
+
+    def deduplicate(self, products):
+        """Последняя строка пакета с тем же слагом побеждает."""
+        by_slug = {}
+        unnamed = []
+        for product in products:
+            if product.slug:
+                by_slug[product.slug] = product
+            else:
+                unnamed.append(product)
+        return [*by_slug.values(), *unnamed]
+
+    def generate_slugs(self, products, reserved):
+        """
+        Уникальные слаги из названий для пакета.
+
+        Занятые слаги base и base-N ищутся одним запросом
+        (индекс по slug с varchar_pattern_ops), новый слаг
+        получает следующий свободный номер. reserved - слаги
+        из самого пакета.
+        """
+        if not products:
+            return
+        bases = [
+            slugify(product.name)[:MAX_SLUG_BASE].strip('-') or DEFAULT_SLUG
+            for product in products
+        ]
+        query = Q(slug__in=set(bases))
+        for base in set(bases):
+            query |= Q(slug__startswith=f'{base}-')
+
+        taken = {}
+        for slug in (
+            *Product.objects.filter(query).values_list('slug', flat=True),
+            *reserved
+        ):
+            for base, number in self.split_slug(slug):
+                taken[base] = max(taken.get(base, 0), number)
+
+        for product, base in zip(products, bases):
+            number = taken.get(base, 0) + 1
+            taken[base] = number
+            product.slug = base if number == 1 else f'{base}-{number}'
+
+    @staticmethod
+    def split_slug(slug):
+        """Варианты (base, номер) для занятого слага."""
+        yield slug, 1
+        match = re.fullmatch(r'(.+)-(\d+)', slug)
+        if match:
+            yield match[1], int(match[2])
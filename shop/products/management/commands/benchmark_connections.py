@@ -0,0 +1,109 @@
+from itertools import cycle
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from products.benchmark import (
+    add_catalog_arguments,
+    benchmark_catalog,
+    get_percentiles,
+    time_requests
+)
+from products.models import Product
+
+
+POOL = {'min_size': 1, 'max_size': 4}
+# Режим: CONN_MAX_AGE и OPTIONS основной базы.
+MODES = {
+    'new connection': (0, {}),
+    'persistent': (60, {}),
+    'pool': (0, {'pool': POOL}),
+    'pool + prepared': (0, {
+        'pool': POOL,
+        'server_side_binding': True,
+        'prepare_threshold': 5,
+    }),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет GET /api/products/{slug}/ с новым соединением на запрос, '
+        'постоянным соединением, пулом и пулом с подготовленными запросами.'
+    )
+
+    def add_arguments(self, parser):
+        add_catalog_arguments(parser, requests=500, warmup=20)
+        parser.add_argument(
+            '--slugs',
+            type=int,
+            default=100,
+            help='Сколько разных товаров запрашивать по кругу.'
+        )
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        original = (
+            connection.settings_dict['CONN_MAX_AGE'],
+            connection.settings_dict['OPTIONS'],
+        )
+        with benchmark_catalog(options, self.stdout, catalog_cache=False):
+            urls = [
+                reverse('products-detail', kwargs={'slug': slug})
+                for slug in Product.objects.order_by('id').values_list(
+                    'slug',
+                    flat=True
+                )[:options['slugs']]
+            ]
+            if not urls:
+                raise CommandError(
+                    'В каталоге нет товаров, укажите --products.'
+                )
+            self.stdout.write(
+                f'{"режим":<18}{"p50, мс":>10}{"p95, мс":>10}'
+                f'{"p99, мс":>10}{"соединений":>12}'
+            )
+            try:
+                for name, (max_age, database_options) in MODES.items():
+                    self.configure(max_age, database_options)
+                    self.benchmark(name, cycle(urls), options)
+            finally:
+                self.configure(*original)
+
+    def configure(self, max_age, options):
+        """Закрывает соединение и пул и меняет настройки основной базы."""
+        connection = connections['default']
+        connection.close()
+        connection.close_pool()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.settings_dict['OPTIONS'] = options
+
+    def benchmark(self, name, urls, options):
+        """
+        Запросы через APIClient с закрытием соединений после каждого,
+        как в обработчике запросов Django (тестовый клиент этого не
+        делает).
+        """
+        client = APIClient()
+        backends = set()
+
+        def request():
+            response = client.get(next(urls))
+            # Соединение на стороне сервера: новое или повторное.
+            backends.add(connections['default'].connection.info.backend_pid)
+            close_old_connections()
+            assert response.status_code == 200, response
+
+        for _ in range(options['warmup']):
+            request()
+
+        backends.clear()
+        p50, p95, p99 = get_percentiles(
+            time_requests(request, options['requests'])
+        )
+        self.stdout.write(
+            f'{name:<18}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}'
+            f'{len(backends):>12}'
+        )
@@ -0,0 +1,284 @@
+import json
+import secrets
+from itertools import count
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.authentication import RoleRefreshToken
+from products.benchmark import (
+    GENERATED_PASSWORD,
+    add_catalog_arguments,
+    benchmark_catalog,
+    get_percentiles,
+    time_requests
+)
+from products.models import Product
+from users.consts import GENERATED_USERNAME_PREFIX
+
+
+User = get_user_model()
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'endpoints.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет эндпоинты API через APIClient и настоящий URLconf: '
+        'перцентили задержки, запросы к БД и размер ответа. '
+        'Сохраняет базовую линию и падает при регрессии.'
+    )
+
+    def add_arguments(self, parser):
+        add_catalog_arguments(parser, requests=50, warmup=5)
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Отключить кэш ответов каталога.'
+        )
+        parser.add_argument(
+            '--baseline',
+            default=str(DEFAULT_BASELINE),
+            help='Файл базовой линии (JSON).'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Записать результаты как новую базовую линию.'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 и размера ответа (0.2 = 20%%).'
+        )
+        parser.add_argument(
+            '--min-delta',
+            type=float,
+            default=1.0,
+            help='Рост p95 меньше стольких мс не считается регрессией.'
+        )
+
+    def handle(self, *args, **options):
+        # Логины пользователей, созданных замером: удаляются только они.
+        self.usernames = []
+        with benchmark_catalog(
+            options,
+            self.stdout,
+            catalog_cache=not options['no_cache']
+        ):
+            try:
+                results = self.run_scenarios(options)
+            finally:
+                User.objects.filter(username__in=self.usernames).delete()
+
+        self.report(results)
+        baseline = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline.parent.mkdir(parents=True, exist_ok=True)
+            baseline.write_text(json.dumps(
+                {'products': Product.objects.count(), 'scenarios': results},
+                indent=2,
+                ensure_ascii=False
+            ))
+            self.stdout.write(f'Базовая линия записана в {baseline}.')
+        elif baseline.exists():
+            self.compare(
+                results,
+                json.loads(baseline.read_text())['scenarios'],
+                options
+            )
+
+    def get_scenarios(self):
+        """
+        Сценарии: имя и функция, выполняющая один запрос.
+
+        Данные берутся из первого товара каталога, корзина
+        и регистрация - от имени новых пользователей, их логины
+        копятся в self.usernames. Владелец корзины создается
+        без save() (full_clean не пропускает ":" в логине)
+        с GENERATED_USERNAME_PREFIX, и generate_catalog --clear
+        удалит его, если замер прервали. Регистрация проверяет
+        логин так же, поэтому ее пользователи - без префикса,
+        их удаляет сам замер. Добавленный в корзину товар
+        удаляется после каждого запроса, иначе количество
+        уперлось бы в предел.
+        """
+        product = Product.objects.select_related(
+            'subcategory__category'
+        ).order_by('id').first()
+        if product is None:
+            raise CommandError('В каталоге нет товаров, укажите --products.')
+        subcategory = product.subcategory
+        category = subcategory.category
+
+        client = APIClient()
+        run = secrets.token_hex(4)
+        [user] = User.objects.bulk_create([User(
+            username=f'{GENERATED_USERNAME_PREFIX}benchmark-{run}',
+            email=f'benchmark-{run}@generated.invalid',
+            password=make_password(GENERATED_PASSWORD)
+        )])
+        self.usernames.append(user.username)
+        owner = APIClient()
+        owner.credentials(HTTP_AUTHORIZATION=(
+            f'Bearer {RoleRefreshToken.for_user(user).access_token}'
+        ))
+        signups = count()
+
+        def get(url, params=None, expected=200, client=client):
+            def request():
+                response = client.get(url, params)
+                assert response.status_code == expected, response
+                return response
+            return request
+
+        def signup():
+            username = f'benchmark-{run}-{next(signups)}'
+            response = client.post(reverse('users-list'), {
+                'username': username,
+                'email': f'{username}@generated.invalid',
+                'password': 'Benchmark-password-1',
+            }, format='json')
+            assert response.status_code == 201, response
+            self.usernames.append(username)
+            return response
+
+        to_cart_url = reverse(
+            'products-to-cart',
+            kwargs={'slug': product.slug}
+        )
+
+        def to_cart():
+            response = owner.post(to_cart_url, {'quantity': 1}, format='json')
+            assert response.status_code == 201, response
+            return response
+
+        def remove_from_cart():
+            response = owner.delete(to_cart_url)
+            assert response.status_code == 204, response
+
+        self.resets = {'to-cart': remove_from_cart}
+        products = reverse('products-list')
+        return {
+            'categories-list': get(reverse('categories-list')),
+            'categories-detail': get(
+                reverse('categories-detail', kwargs={'slug': category.slug})
+            ),
+            'subcategory-products': get(reverse(
+                'categories-subcategory-products',
+                kwargs={
+                    'slug': category.slug,
+                    'subcategory_slug': subcategory.slug,
+                }
+            )),
+            'products-list': get(products),
+            'products-search': get(
+                products,
+                {'search': product.name.split()[0]}
+            ),
+            'products-filter': get(products, {
+                'category': category.slug,
+                'price_min': 1000,
+                'price_max': 50000,
+                'pagination': 'cursor',
+                'ordering': 'price',
+            }),
+            'products-detail': get(
+                reverse('products-detail', kwargs={'slug': product.slug})
+            ),
+            'product-redirect': get(
+                reverse('product-redirect', kwargs={
+                    'category_slug': category.slug,
+                    'subcategory_slug': subcategory.slug,
+                    'product_slug': product.slug,
+                }),
+                expected=302
+            ),
+            'cart-read': get(reverse('cart-list'), client=owner),
+            'to-cart': to_cart,
+            'signup': signup,
+        }
+
+    def run_scenarios(self, options):
+        results = {}
+        for name, request in self.get_scenarios().items():
+            reset = self.resets.get(name)
+            time_requests(request, options['warmup'], reset)
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            # Журнал запросов сбрасывается на каждом следующем запросе.
+            query_count = len(queries)
+            if reset is not None:
+                reset()
+
+            p50, p95, p99 = get_percentiles(
+                time_requests(request, options['requests'], reset)
+            )
+            results[name] = {
+                'p50': round(p50, 3),
+                'p95': round(p95, 3),
+                'p99': round(p99, 3),
+                'queries': query_count,
+                'bytes': len(response.content),
+            }
+        return results
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"сценарий":<22}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"p99, мс":>10}{"запросов":>10}{"байт":>10}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<22}{result["p50"]:>10.2f}{result["p95"]:>10.2f}'
+                f'{result["p99"]:>10.2f}{result["queries"]:>10}'
+                f'{result["bytes"]:>10}'
+            )
+
+    def compare(self, results, baseline, options):
+        """
+        Сравнение с базовой линией.
+
+        Регрессия - больше запросов к БД, рост p95 больше threshold
+        (и больше min-delta мс) или рост ответа больше threshold.
+        """
+        threshold = 1 + options['threshold']
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: запросов {result["queries"]} '
+                    f'вместо {base["queries"]}'
+                )
+            if (
+                result['p95'] > base['p95'] * threshold
+                and result['p95'] - base['p95'] > options['min_delta']
+            ):
+                regressions.append(
+                    f'{name}: p95 {result["p95"]:.2f} мс '
+                    f'вместо {base["p95"]:.2f} мс'
+                )
+            if result['bytes'] > base['bytes'] * threshold:
+                regressions.append(
+                    f'{name}: ответ {result["bytes"]} байт '
+                    f'вместо {base["bytes"]}'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессия относительно базовой линии:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базовой линии нет.'
+        ))
@@ -0,0 +1,96 @@
+import io
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.compiled import CompiledSerializer
+from api.renderers import FastJSONParser, FastJSONRenderer
+from api.serializers import ProductSerializer
+from products.benchmark import (
+    add_generated_catalog_arguments,
+    generated_catalog
+)
+from products.models import Product
+
+
+DEFAULT_PAGE_SIZES = (100, 1000, 10000)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает JSONRenderer и JSONParser DRF с FastJSONRenderer '
+        'и FastJSONParser на страницах списка товаров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'page_sizes',
+            nargs='*',
+            type=int,
+            default=DEFAULT_PAGE_SIZES,
+            help='Размеры страниц.'
+        )
+        add_generated_catalog_arguments(parser)
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз повторить каждый замер.'
+        )
+
+    def handle(self, *args, **options):
+        with generated_catalog(options, self.stdout):
+            compiled = CompiledSerializer(ProductSerializer)
+            self.stdout.write(
+                f'Товаров в каталоге: {Product.objects.count()}'
+            )
+            self.stdout.write(
+                f'{"страница":<10}{"":<10}{"DRF, мс":>12}'
+                f'{"быстрый, мс":>14}{"ускорение":>12}'
+            )
+            for page_size in options['page_sizes']:
+                page = compiled.serialize_many(compiled.values(
+                    Product.objects.order_by('id')[:page_size]
+                ))
+                self.compare(page_size, page, options['repeat'])
+
+    def compare(self, page_size, page, repeat):
+        data = {'count': len(page), 'results': page}
+        drf, drf_body = self.measure(JSONRenderer().render, data, repeat)
+        fast, fast_body = self.measure(
+            FastJSONRenderer().render,
+            data,
+            repeat
+        )
+        if drf_body != fast_body:
+            self.stderr.write(f'{page_size}: ответы отличаются')
+        self.report(page_size, 'рендер', drf, fast)
+
+        drf, _ = self.measure(self.parser(JSONParser()), drf_body, repeat)
+        fast, _ = self.measure(
+            self.parser(FastJSONParser()),
+            drf_body,
+            repeat
+        )
+        self.report(page_size, 'разбор', drf, fast)
+
+    def report(self, page_size, name, drf, fast):
+        self.stdout.write(
+            f'{page_size:<10}{name:<10}{drf:>12.2f}{fast:>14.2f}'
+            f'{drf / fast:>11.1f}x'
+        )
+
+    def parser(self, parser):
+        return lambda body: parser.parse(io.BytesIO(body))
+
+    def measure(self, function, argument, repeat):
+        """Медиана времени вызова в миллисекундах и его результат."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(argument)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), result
@@ -0,0 +1,98 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.filters import SearchFilter
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.filters import ProductSearchFilter
+from products.benchmark import (
+    add_generated_catalog_arguments,
+    generated_catalog
+)
+from products.models import Product
+
+
+LEGACY_SEARCH_FIELDS = (
+    'name',
+    'subcategory__name',
+    'subcategory__category__name'
+)
+DEFAULT_QUERIES = ('смартфон', 'наушники', 'чёрный ноутбук', 'смартфн')
+
+
+class LegacySearchView:
+    search_fields = LEGACY_SEARCH_FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает полнотекстовый поиск товаров '
+        'с прежним поиском через icontains.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries',
+            nargs='*',
+            default=DEFAULT_QUERIES,
+            help='Поисковые запросы.'
+        )
+        add_generated_catalog_arguments(parser)
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Сколько раз повторить каждый запрос.'
+        )
+
+    def handle(self, *args, **options):
+        with generated_catalog(options, self.stdout):
+            self.stdout.write(
+                f'Товаров в каталоге: {Product.objects.count()}'
+            )
+            self.stdout.write(
+                f'{"запрос":<20}{"icontains, мс":>15}{"fts, мс":>12}'
+                f'{"ускорение":>12}{"найдено":>16}'
+            )
+            for query in options['queries']:
+                self.compare(query, options['repeat'])
+
+    def compare(self, query, repeat):
+        legacy_time, legacy_count = self.measure(
+            SearchFilter(),
+            LegacySearchView(),
+            query,
+            repeat
+        )
+        fts_time, fts_count = self.measure(
+            ProductSearchFilter(),
+            None,
+            query,
+            repeat
+        )
+        self.stdout.write(
+            f'{query:<20}{legacy_time:>15.1f}{fts_time:>12.1f}'
+            f'{legacy_time / fts_time:>11.1f}x'
+            f'{f"{legacy_count} / {fts_count}":>16}'
+        )
+
+    def measure(self, search_filter, view, query, repeat):
+        """Медиана времени первой страницы выдачи вместе с COUNT(*)."""
+        timings = []
+        for _ in range(repeat):
+            request = Request(
+                APIRequestFactory().get('/api/products/', {'search': query})
+            )
+            queryset = Product.objects.select_related(
+                'subcategory',
+                'subcategory__category'
+            )
+            start = time.perf_counter()
+            queryset = search_filter.filter_queryset(request, queryset, view)
+            paginator = PageNumberPagination()
+            paginator.paginate_queryset(queryset, request)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), paginator.page.paginator.count
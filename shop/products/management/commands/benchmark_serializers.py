@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.compiled import CompiledSerializer
+from api.serializers import ProductSerializer
+from products.benchmark import (
+    add_generated_catalog_arguments,
+    generated_catalog
+)
+from products.models import Product
+
+
+DEFAULT_PAGE_SIZES = (10, 100, 1000)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ProductSerializer с собранным сериализатором '
+        'на страницах списка товаров (запрос, сериализация и JSON). '
+        'Ссылки на изображения относительные, без request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'page_sizes',
+            nargs='*',
+            type=int,
+            default=DEFAULT_PAGE_SIZES,
+            help='Размеры страниц.'
+        )
+        add_generated_catalog_arguments(parser)
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз повторить каждый замер.'
+        )
+
+    def handle(self, *args, **options):
+        with generated_catalog(options, self.stdout):
+            self.compiled = CompiledSerializer(ProductSerializer)
+            self.stdout.write(
+                f'Товаров в каталоге: {Product.objects.count()}'
+            )
+            self.stdout.write(
+                f'{"страница":<10}{"DRF, мс":>12}{"собранный, мс":>16}'
+                f'{"ускорение":>12}'
+            )
+            for page_size in options['page_sizes']:
+                self.compare(page_size, options['repeat'])
+
+    def compare(self, page_size, repeat):
+        queryset = Product.objects.order_by('id')[:page_size]
+        drf_time, drf_body = self.measure(self.render_drf, queryset, repeat)
+        compiled_time, compiled_body = self.measure(
+            self.render_compiled,
+            queryset,
+            repeat
+        )
+        if drf_body != compiled_body:
+            self.stderr.write(f'{page_size}: ответы отличаются')
+        self.stdout.write(
+            f'{page_size:<10}{drf_time:>12.2f}{compiled_time:>16.2f}'
+            f'{drf_time / compiled_time:>11.1f}x'
+        )
+
+    def measure(self, render, queryset, repeat):
+        """Медиана времени от запроса к БД до байтов JSON."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = render(queryset)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), body
+
+    def render_drf(self, queryset):
+        return JSONRenderer().render(ProductSerializer(
+            queryset.select_related('subcategory__category'),
+            many=True
+        ).data)
+
+    def render_compiled(self, queryset):
+        return JSONRenderer().render(self.compiled.serialize_many(
+            self.compiled.values(queryset)
+        ))
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.benchmark import CatalogGenerator
+from users.consts import GENERATED_SLUG_PREFIX, GENERATED_USERNAME_PREFIX
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет БД синтетическим каталогом для замеров: категории, '
+        'подкатегории, товары, пользователи и корзины. '
+        'Данные детерминированы seed, слаги начинаются '
+        f'с "{GENERATED_SLUG_PREFIX}", '
+        f'логины - с "{GENERATED_USERNAME_PREFIX}".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument(
+            '--subcategories',
+            type=int,
+            default=10,
+            help='Подкатегорий в каждой категории.'
+        )
+        parser.add_argument('--products', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=50000,
+            help='Сколько сгенерированных пользователей получат корзины.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее сгенерированные данные перед генерацией.'
+        )
+
+    def handle(self, *args, **options):
+        generator = CatalogGenerator(options['seed'], self.stdout)
+        start = time.perf_counter()
+        if options['clear']:
+            generator.clear()
+            self.stdout.write('Сгенерированные данные удалены.')
+        elif generator.exists():
+            raise CommandError(
+                'Сгенерированные данные уже есть, запустите с --clear.'
+            )
+
+        try:
+            generator.generate(
+                options['categories'],
+                options['subcategories'],
+                options['products'],
+                options['users'],
+                options['carts']
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - start:.1f} с.'
+        ))
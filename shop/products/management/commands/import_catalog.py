@@ -0,0 +1,92 @@
+import itertools
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import (
+    IMAGE_FIELDS,
+    CatalogImporter,
+    iter_batches,
+    read_rows
+)
+
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает товары из CSV или JSONL (колонки как у '
+        'GET /api/products/export/) пакетами с обновлением по слагу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл выгрузки или - для чтения из stdin.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(set(FORMATS.values())),
+            help='Формат файла, по умолчанию - по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько товаров записывать одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or FORMATS.get(Path(path).suffix)
+        if format is None:
+            raise CommandError('Укажите --format: csv или jsonl.')
+
+        if path == '-':
+            self.load(sys.stdin, format, options['batch_size'])
+        else:
+            with open(path, encoding='utf-8', newline='') as stream:
+                self.load(stream, format, options['batch_size'])
+
+    def load(self, stream, format, batch_size):
+        rows = read_rows(stream, format)
+        # Колонки изображений ищутся в первой строке-объекте.
+        head = []
+        for number, row in rows:
+            head.append((number, row))
+            if isinstance(row, dict):
+                break
+        if not head:
+            self.stdout.write('Файл пуст.')
+            return
+        first = head[-1][1]
+        importer = CatalogImporter(images=isinstance(first, dict) and any(
+            field in first for field in IMAGE_FIELDS
+        ))
+
+        start = time.perf_counter()
+        processed = 0
+        for batch in iter_batches(itertools.chain(head, rows), batch_size):
+            importer.import_batch(batch)
+            processed += len(batch)
+            self.stdout.write(
+                f'Обработано строк: {processed} '
+                f'({processed / (time.perf_counter() - start):.0f} строк/с)'
+            )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано товаров: {importer.created}, '
+            f'обновлено: {importer.updated}, '
+            f'{elapsed:.1f} с, {processed / elapsed:.0f} строк/с'
+        ))
+        if importer.errors:
+            for number, error in importer.errors:
+                self.stderr.write(f'Строка {number}: {error}')
+            raise CommandError(
+                f'Пропущено строк с ошибками: {len(importer.errors)}, '
+                'остальные загружены.'
+            )
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from products.models import Cart
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет сохраненные итоги корзин с товарами в них '
+        'и при --fix пересчитывает корзины с расхождениями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Пересчитать итоги корзин с расхождениями.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько корзин пересчитывать одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Cart.objects.with_drift().order_by('id').values_list(
+                'id',
+                'total_quantity',
+                'actual_quantity',
+                'total_price',
+                'actual_price'
+            )
+        )
+        self.stdout.write(f'Корзин с расхождением итогов: {len(drifted)}')
+        if options['verbosity'] > 1:
+            for row in drifted:
+                self.stdout.write(
+                    '{}: количество {} вместо {}, '
+                    'стоимость {} вместо {}'.format(*row)
+                )
+
+        if not drifted:
+            return
+        if not options['fix']:
+            raise CommandError(
+                'Итоги корзин расходятся с товарами, '
+                'запустите команду с --fix.'
+            )
+
+        ids = [row[0] for row in drifted]
+        batch_size = options['batch_size']
+        fixed = 0
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                fixed += Cart.objects.filter(
+                    id__in=ids[start:start + batch_size]
+                ).recalculate_totals()
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано корзин: {fixed}')
+        )
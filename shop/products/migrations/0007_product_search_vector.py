@@ -0,0 +1,89 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION products_product_search_vector() RETURNS trigger AS $$
+BEGIN
+    SELECT setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(s.name, '')), 'B')
+        || setweight(to_tsvector('russian', coalesce(c.name, '')), 'C')
+      INTO NEW.search_vector
+      FROM products_subcategory s
+      JOIN products_category c ON c.id = s.category_id
+     WHERE s.id = NEW.subcategory_id;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_product_search_vector
+BEFORE INSERT OR UPDATE OF name, subcategory_id, search_vector
+ON products_product
+FOR EACH ROW EXECUTE FUNCTION products_product_search_vector();
+
+-- Переименование подкатегории или категории пересчитывает
+-- векторы связанных товаров через триггер выше.
+CREATE FUNCTION products_subcategory_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE products_product SET search_vector = NULL
+     WHERE subcategory_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_subcategory_search_vector
+AFTER UPDATE OF name, category_id ON products_subcategory
+FOR EACH ROW
+WHEN (OLD.name IS DISTINCT FROM NEW.name
+      OR OLD.category_id IS DISTINCT FROM NEW.category_id)
+EXECUTE FUNCTION products_subcategory_search_vector();
+
+CREATE FUNCTION products_category_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE products_product SET search_vector = NULL
+     WHERE subcategory_id IN (
+         SELECT id FROM products_subcategory WHERE category_id = NEW.id
+     );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_category_search_vector
+AFTER UPDATE OF name ON products_category
+FOR EACH ROW
+WHEN (OLD.name IS DISTINCT FROM NEW.name)
+EXECUTE FUNCTION products_category_search_vector();
+
+UPDATE products_product SET search_vector = NULL;
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS products_category_search_vector ON products_category;
+DROP FUNCTION IF EXISTS products_category_search_vector();
+DROP TRIGGER IF EXISTS products_subcategory_search_vector
+    ON products_subcategory;
+DROP FUNCTION IF EXISTS products_subcategory_search_vector();
+DROP TRIGGER IF EXISTS products_product_search_vector ON products_product;
+DROP FUNCTION IF EXISTS products_product_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_SQL, DROP_SEARCH_VECTOR_SQL),
+    ]
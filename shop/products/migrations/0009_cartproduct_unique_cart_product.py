@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+from users.consts import MAGIC_NUMBERS
+
+
+# Повторы товара в корзине сливаются в одну строку с суммой
+# количеств, не больше предела количества в корзине.
+MERGE_DUPLICATES_SQL = """
+WITH merged AS (
+    SELECT cart_id,
+           product_id,
+           MIN(id) AS keep_id,
+           LEAST(SUM(quantity), {max_quantity}) AS quantity
+      FROM products_cartproduct
+     GROUP BY cart_id, product_id
+    HAVING COUNT(*) > 1
+), updated AS (
+    UPDATE products_cartproduct cart_product
+       SET quantity = merged.quantity
+      FROM merged
+     WHERE cart_product.id = merged.keep_id
+)
+DELETE FROM products_cartproduct cart_product
+ USING merged
+ WHERE cart_product.cart_id = merged.cart_id
+   AND cart_product.product_id = merged.product_id
+   AND cart_product.id <> merged.keep_id;
+""".format(max_quantity=MAGIC_NUMBERS['count']['max_cart_quantity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_name_trgm'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='cartproduct',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+
+BACKFILL_TOTALS_SQL = """
+UPDATE products_cart cart
+   SET total_quantity = totals.quantity,
+       total_price = totals.price
+  FROM (
+      SELECT cart_product.cart_id,
+             SUM(cart_product.quantity) AS quantity,
+             SUM(cart_product.quantity * product.price) AS price
+        FROM products_cartproduct cart_product
+        JOIN products_product product
+          ON product.id = cart_product.product_id
+       GROUP BY cart_product.cart_id
+  ) totals
+ WHERE cart.id = totals.cart_id;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_cartproduct_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Общая стоимость'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Общее количество'),
+        ),
+        migrations.RunSQL(BACKFILL_TOTALS_SQL, migrations.RunSQL.noop),
+    ]
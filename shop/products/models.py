@@ -1,14 +1,36 @@
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import Sum, F
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value
+)
+from django.db.models.functions import Coalesce
 from django.utils.text import slugify
 
-from users.consts import MAGIC_NUMBERS
+from users.consts import ERRORS, GENERATED_SLUG_PREFIX, MAGIC_NUMBERS
 
 
 User = get_user_model()
 
 
+def validate_slug_not_reserved(slug):
+    """Слаги синтетических данных нельзя задать вручную."""
+    if slug.startswith(GENERATED_SLUG_PREFIX):
+        raise ValidationError({'slug': ERRORS['slug']['reserved'].format(
+            prefix=GENERATED_SLUG_PREFIX
+        )})
+
+
 class CategoryBase(models.Model):
     """
     Базовый класс для категорий и подкатегорий.
@@ -40,6 +62,10 @@ class CategoryBase(models.Model):
     class Meta:
         abstract = True
 
+    def clean(self):
+        super().clean()
+        validate_slug_not_reserved(self.slug)
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -86,6 +112,8 @@ class Product(models.Model):
         image_medium - среднее изображение продукта
         image_large - большое изображение продукта
         price - цена продукта
+        search_vector - поисковый вектор по названиям продукта,
+            подкатегории и категории (заполняется триггером в БД)
     """
 
     name = models.CharField(
@@ -129,11 +157,43 @@ class Product(models.Model):
         max_digits=MAGIC_NUMBERS['count']['max_decimal_digits'],
         decimal_places=MAGIC_NUMBERS['count']['max_decimal_places']
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         ordering = ('name',)
+        indexes = (
+            models.Index(
+                fields=('name', 'id'),
+                name='product_name_id_idx'
+            ),
+            models.Index(
+                fields=('price', 'id'),
+                name='product_price_id_idx'
+            ),
+            models.Index(
+                fields=('subcategory', 'name', 'id'),
+                name='product_subcat_name_id_idx'
+            ),
+            models.Index(
+                fields=('subcategory', 'price', 'id'),
+                name='product_subcat_price_id_idx'
+            ),
+            GinIndex(
+                fields=('search_vector',),
+                name='product_search_vector_idx'
+            ),
+            GinIndex(
+                fields=('name',),
+                name='product_name_trgm_idx',
+                opclasses=['gin_trgm_ops']
+            ),
+        )
 
     @property
     def category(self):
@@ -141,17 +201,95 @@ class Product(models.Model):
 
     @property
     def short_url(self):
-        return f'products/{self.slug}/'
+        return self.build_short_url(self.slug)
+
+    @staticmethod
+    def build_short_url(slug):
+        return f'products/{slug}/'
+
+    def clean(self):
+        super().clean()
+        validate_slug_not_reserved(self.slug)
 
     def save(self, *args, **kwargs):
+        """
+        Сохраняет продукт.
+
+        Новая цена переносится в итоги корзин в одной транзакции
+        с записью продукта, до нее, пока в БД старая цена.
+        """
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or (
+            update_fields is not None and 'price' not in update_fields
+        ):
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic(using=router.db_for_write(Product)):
+            CartProduct.objects.reprice_product(self.pk, self.price)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name[:MAGIC_NUMBERS['count']['truncated_str']]
 
 
+def get_line_total(quantity='quantity', price='product__price'):
+    """Сумма по строке корзины: количество * цена."""
+    return ExpressionWrapper(
+        F(quantity) * F(price),
+        output_field=DecimalField(
+            max_digits=MAGIC_NUMBERS['count']['max_decimal_digits'],
+            decimal_places=MAGIC_NUMBERS['count']['max_decimal_places']
+        )
+    )
+
+
+class CartQuerySet(models.QuerySet):
+    """Запросы к корзинам."""
+
+    @staticmethod
+    def get_actual_totals():
+        """Итоги корзины, посчитанные по ее товарам (подзапросами)."""
+        items = CartProduct.objects.filter(
+            cart=OuterRef('pk')
+        ).order_by().values('cart')
+        return {
+            'total_quantity': Coalesce(
+                Subquery(
+                    items.annotate(total=Sum('quantity')).values('total')
+                ),
+                0
+            ),
+            'total_price': Coalesce(
+                Subquery(
+                    items.annotate(
+                        total=Sum(get_line_total())
+                    ).values('total')
+                ),
+                Value(Decimal(0))
+            ),
+        }
+
+    def with_drift(self):
+        """
+        Корзины, у которых сохраненные итоги
+        не совпадают с посчитанными по товарам.
+        """
+        actual = self.get_actual_totals()
+        return self.annotate(
+            actual_quantity=actual['total_quantity'],
+            actual_price=actual['total_price']
+        ).exclude(
+            total_quantity=F('actual_quantity'),
+            total_price=F('actual_price')
+        )
+
+    def recalculate_totals(self):
+        """Пересчитывает итоги корзин по товарам одним UPDATE."""
+        return self.update(**self.get_actual_totals())
+
+
 class Cart(models.Model):
     """
     Корзина пользователя.
@@ -160,6 +298,11 @@ class Cart(models.Model):
         user - пользователь, который добавил товар в корзину
         created_at - дата создания корзины
         products - список продуктов в корзине
+        total_quantity - общее количество товаров
+        total_price - общая стоимость товаров
+
+    Итоги хранятся в строке корзины и меняются
+    на разницу при каждой записи в корзину.
     """
 
     user = models.OneToOneField(
@@ -175,32 +318,408 @@ class Cart(models.Model):
         through='CartProduct',
         related_name='carts'
     )
+    total_quantity = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+        default=0
+    )
+    total_price = models.DecimalField(
+        verbose_name='Общая стоимость',
+        max_digits=MAGIC_NUMBERS['count']['max_decimal_digits'],
+        decimal_places=MAGIC_NUMBERS['count']['max_decimal_places'],
+        default=0
+    )
+
+    objects = CartQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
 
-    @property
-    def total_quantity(self):
-        """Общее количество товаров в корзине."""
-        return self.cart_products.aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
-
-    @property
-    def total_price(self):
-        """Общая стоимость товаров в корзине."""
-        result = self.cart_products.annotate(
-            item_total=F('quantity') * F('product__price')
-        ).aggregate(
-            total=Sum('item_total')
-        )['total']
-        return result if result else 0
-
     def __str__(self):
         return f'Корзина пользователя {self.user.username}'
 
 
+ADD_TO_CART_SQL = """
+WITH product AS (
+    SELECT id, price FROM {product} WHERE slug = %(slug)s FOR SHARE
+), cart AS (
+    INSERT INTO {cart} (
+        user_id, created_at, updated_at, total_quantity, total_price
+    )
+    SELECT %(user_id)s, now(), now(), %(quantity)s, %(quantity)s * price
+    FROM product
+    ON CONFLICT (user_id) DO UPDATE
+    SET updated_at = EXCLUDED.updated_at,
+        total_quantity = {cart}.total_quantity + EXCLUDED.total_quantity,
+        total_price = {cart}.total_price + EXCLUDED.total_price
+    RETURNING id
+)
+INSERT INTO {cart_product} (cart_id, product_id, quantity)
+SELECT cart.id, product.id, %(quantity)s FROM cart, product
+ON CONFLICT (cart_id, product_id) DO UPDATE
+SET quantity = {cart_product}.quantity + EXCLUDED.quantity
+RETURNING quantity
+"""
+
+ADD_QUANTITIES_SQL = """
+INSERT INTO {cart_product} (cart_id, product_id, quantity)
+SELECT %(cart_id)s, item.product_id, item.quantity
+FROM unnest(%(product_ids)s::bigint[], %(quantities)s::integer[])
+    AS item(product_id, quantity)
+ON CONFLICT (cart_id, product_id) DO UPDATE
+SET quantity = {cart_product}.quantity + EXCLUDED.quantity
+"""
+
+LOCK_CART_SQL = """
+SELECT id FROM {cart} WHERE user_id = %(user_id)s FOR NO KEY UPDATE
+"""
+
+SET_QUANTITY_SQL = """
+WITH item AS (
+    SELECT cart_product.id,
+           cart_product.cart_id,
+           cart_product.quantity,
+           product.price
+    FROM {cart_product} cart_product
+    JOIN {cart} cart ON cart.id = cart_product.cart_id
+    JOIN {product} product ON product.id = cart_product.product_id
+    WHERE cart_product.id = %(item_id)s
+      AND cart.user_id = %(user_id)s
+), updated AS (
+    UPDATE {cart_product} cart_product SET quantity = %(quantity)s
+    FROM item
+    WHERE cart_product.id = item.id
+)
+UPDATE {cart} cart
+SET updated_at = now(),
+    total_quantity = cart.total_quantity + %(quantity)s - item.quantity,
+    total_price = cart.total_price
+        + (%(quantity)s - item.quantity) * item.price
+FROM item
+WHERE cart.id = item.cart_id
+RETURNING cart.id
+"""
+
+REMOVE_ITEMS_SQL = """
+WITH deleted AS (
+    DELETE FROM {cart_product} cart_product
+    USING {cart} cart, {product} product
+    WHERE cart_product.cart_id = cart.id
+      AND cart_product.product_id = product.id
+      AND cart.user_id = %(user_id)s
+      AND {condition}
+    RETURNING cart_product.cart_id, cart_product.quantity, product.price
+), totals AS (
+    SELECT cart_id,
+           SUM(quantity) AS quantity,
+           SUM(quantity * price) AS price
+    FROM deleted
+    GROUP BY cart_id
+)
+UPDATE {cart} cart
+SET updated_at = now(),
+    total_quantity = cart.total_quantity - totals.quantity,
+    total_price = cart.total_price - totals.price
+FROM totals
+WHERE cart.id = totals.cart_id
+RETURNING totals.quantity
+"""
+
+LOCK_PRODUCTS_SQL = """
+SELECT product.id FROM {product} product
+WHERE {condition}
+ORDER BY product.id
+FOR {strength}
+"""
+
+LOCK_PRODUCT_CARTS_SQL = """
+SELECT cart.id FROM {cart} cart
+WHERE cart.id IN (
+    SELECT cart_product.cart_id
+    FROM {cart_product} cart_product
+    JOIN {product} product ON product.id = cart_product.product_id
+    WHERE {condition}
+)
+ORDER BY cart.id
+FOR NO KEY UPDATE
+"""
+
+REPRICE_PRODUCTS_SQL = """
+UPDATE {cart} cart
+SET total_price = cart.total_price + delta.price
+FROM (
+    SELECT cart_product.cart_id,
+           SUM(cart_product.quantity * (new.price - product.price)) AS price
+    FROM unnest(%(product_ids)s::bigint[], %(prices)s::numeric[])
+        AS new(product_id, price)
+    JOIN {cart_product} cart_product
+        ON cart_product.product_id = new.product_id
+    JOIN {product} product ON product.id = new.product_id
+    WHERE product.price <> new.price
+    GROUP BY cart_product.cart_id
+) delta
+WHERE cart.id = delta.cart_id
+"""
+
+DISCARD_PRODUCTS_SQL = """
+UPDATE {cart} cart
+SET total_quantity = cart.total_quantity - discarded.quantity,
+    total_price = cart.total_price - discarded.price
+FROM (
+    SELECT cart_product.cart_id,
+           SUM(cart_product.quantity) AS quantity,
+           SUM(cart_product.quantity * product.price) AS price
+    FROM {cart_product} cart_product
+    JOIN {product} product ON product.id = cart_product.product_id
+    WHERE {condition}
+    GROUP BY cart_product.cart_id
+) discarded
+WHERE cart.id = discarded.cart_id
+"""
+
+
+class CartProductQuerySet(models.QuerySet):
+    """
+    Запросы к товарам в корзине.
+
+    Каждая запись меняет итоги корзины на разницу в том же
+    запросе. Строка корзины блокируется раньше строк товаров:
+    добавление делает это через INSERT ... ON CONFLICT корзины,
+    изменение и удаление - отдельным SELECT ... FOR NO KEY UPDATE,
+    после которого запрос видит все завершенные записи.
+
+    Блокировки берутся в одном порядке: сначала товары, потом
+    корзины. Запись, добавляющая товар в корзину, держит товар
+    FOR SHARE. Смена цены и удаление товара блокируют товар,
+    затем все корзины с ним и только после этого меняют итоги:
+    к этому моменту новых строк с товаром не появится, а строки
+    заблокированных корзин никто не меняет. Поэтому параллельные
+    записи не теряют изменений и не встают во взаимную блокировку.
+    save() и delete() товара пересчитывают итоги его корзины,
+    массовые update() и delete() набора - нет.
+    """
+
+    def with_line_totals(self):
+        """Товары с суммой по строке, вместе с товаром и корзиной."""
+        return self.select_related(
+            'cart',
+            'product'
+        ).annotate(
+            line_total=get_line_total()
+        ).order_by('id')
+
+    def add_to_cart(self, user_id, product_slug, quantity):
+        """
+        Добавляет товар в корзину пользователя одним запросом.
+
+        Корзина создается при необходимости, количество
+        и итоги увеличиваются в БД (quantity = quantity + n),
+        поэтому параллельные добавления не теряются.
+        Возвращает новое количество или None, если товара нет.
+        Если количество превысит допустимое, БД вернет DataError.
+        """
+        row = self._execute_cart_sql(
+            ADD_TO_CART_SQL,
+            {
+                'user_id': user_id,
+                'slug': product_slug,
+                'quantity': quantity
+            }
+        )
+        return row[0] if row else None
+
+    def set_quantity(self, user_id, item_id, quantity):
+        """
+        Устанавливает количество товара в корзине пользователя.
+
+        Возвращает False, если такого товара в корзине нет.
+        """
+        row = self._execute_cart_sql(
+            SET_QUANTITY_SQL,
+            {'user_id': user_id, 'item_id': item_id, 'quantity': quantity},
+            lock_cart=True
+        )
+        return row is not None
+
+    def remove_from_cart(self, user_id, product_slug):
+        """
+        Удаляет товар из корзины пользователя одним запросом.
+
+        Возвращает False, если такого товара в корзине нет.
+        """
+        return self._remove_items(
+            user_id,
+            'product.slug = %(slug)s',
+            slug=product_slug
+        )
+
+    def remove_item(self, user_id, item_id):
+        """Удаляет строку корзины пользователя по id."""
+        return self._remove_items(
+            user_id,
+            'cart_product.id = %(item_id)s',
+            item_id=item_id
+        )
+
+    def clear_cart(self, user_id):
+        """Удаляет все товары из корзины пользователя."""
+        return self._remove_items(user_id, 'TRUE')
+
+    def reprice_product(self, product_id, price):
+        """
+        Переносит новую цену товара в итоги корзин.
+
+        Вызывается до сохранения товара, пока в БД старая цена.
+        """
+        self.reprice_products({product_id: price})
+
+    def reprice_products(self, prices):
+        """
+        Переносит новые цены товаров в итоги корзин одним запросом.
+
+        prices - словарь {id товара: новая цена}.
+        Вызывается до сохранения товаров, пока в БД старые цены,
+        внутри транзакции записи товаров: товары остаются
+        заблокированными до ее конца.
+        """
+        if not prices:
+            return
+        self._change_products(
+            REPRICE_PRODUCTS_SQL,
+            'product.id = ANY(%(product_ids)s::bigint[])',
+            {'product_ids': list(prices), 'prices': list(prices.values())},
+            strength='NO KEY UPDATE'
+        )
+
+    def discard_product(self, product_id):
+        """Вычитает товар из итогов корзин перед его удалением."""
+        self._change_products(
+            DISCARD_PRODUCTS_SQL,
+            'product.id = %(product_id)s',
+            {'product_id': product_id}
+        )
+
+    def discard_subcategory(self, subcategory_id):
+        """Вычитает товары подкатегории из итогов корзин одним запросом."""
+        self._change_products(
+            DISCARD_PRODUCTS_SQL,
+            'product.subcategory_id = %(subcategory_id)s',
+            {'subcategory_id': subcategory_id}
+        )
+
+    def discard_category(self, category_id):
+        """Вычитает товары категории из итогов корзин одним запросом."""
+        self._change_products(
+            DISCARD_PRODUCTS_SQL,
+            'product.subcategory_id IN ('
+            f'SELECT id FROM {SubCategory._meta.db_table} '
+            'WHERE category_id = %(category_id)s)',
+            {'category_id': category_id}
+        )
+
+    def lock_products(self, product_ids):
+        """
+        Блокирует товары FOR SHARE до конца транзакции.
+
+        Вызывается до блокировки корзины перед записью, которая
+        добавляет товары в корзину: пока товары заблокированы,
+        их цена не изменится.
+        """
+        if not product_ids:
+            return
+        self._execute_cart_sql(
+            LOCK_PRODUCTS_SQL,
+            {'product_ids': sorted(product_ids)},
+            condition='product.id = ANY(%(product_ids)s::bigint[])',
+            strength='SHARE'
+        )
+
+    def add_quantities(self, cart_id, quantities):
+        """
+        Увеличивает количества товаров в корзине одним запросом.
+
+        quantities - словарь {id товара: на сколько увеличить}.
+        Итоги корзины не меняет.
+        Если количество превысит допустимое, БД вернет DataError.
+        """
+        if not quantities:
+            return
+        self._execute_cart_sql(
+            ADD_QUANTITIES_SQL,
+            {
+                'cart_id': cart_id,
+                'product_ids': list(quantities),
+                'quantities': list(quantities.values())
+            }
+        )
+
+    def set_quantities(self, cart_id, quantities):
+        """
+        Устанавливает количества товаров в корзине одним запросом.
+
+        quantities - словарь {id товара: новое количество}.
+        Итоги корзины не меняет.
+        """
+        if not quantities:
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    cart_id=cart_id,
+                    product_id=product_id,
+                    quantity=quantity
+                )
+                for product_id, quantity in quantities.items()
+            ),
+            update_conflicts=True,
+            unique_fields=('cart', 'product'),
+            update_fields=('quantity',)
+        )
+
+    def _remove_items(self, user_id, condition, **params):
+        row = self._execute_cart_sql(
+            REMOVE_ITEMS_SQL,
+            {'user_id': user_id, **params},
+            lock_cart=True,
+            condition=condition
+        )
+        return row is not None
+
+    def _change_products(self, sql, condition, params, strength='UPDATE'):
+        """Блокирует товары, затем корзины с ними и выполняет sql."""
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            self._execute_cart_sql(
+                LOCK_PRODUCTS_SQL,
+                params,
+                condition=condition,
+                strength=strength
+            )
+            self._execute_cart_sql(
+                LOCK_PRODUCT_CARTS_SQL,
+                params,
+                condition=condition
+            )
+            self._execute_cart_sql(sql, params, condition=condition)
+
+    def _execute_cart_sql(self, sql, params, lock_cart=False, **parts):
+        using = router.db_for_write(self.model)
+        if lock_cart:
+            with transaction.atomic(using=using):
+                self._execute_cart_sql(LOCK_CART_SQL, params)
+                return self._execute_cart_sql(sql, params, **parts)
+
+        sql = sql.format(
+            cart=Cart._meta.db_table,
+            cart_product=self.model._meta.db_table,
+            product=Product._meta.db_table,
+            **parts
+        )
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description is not None:
+                return cursor.fetchone()
+
+
 class CartProduct(models.Model):
     """
     Товар в корзине.
@@ -225,12 +744,58 @@ class CartProduct(models.Model):
         verbose_name='Количество',
     )
 
+    objects = CartProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Товар в корзине'
         verbose_name_plural = 'Товары в корзине'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('cart', 'product'),
+                name='unique_cart_product'
+            ),
+        )
+
+    def save(self, *args, **kwargs):
+        """
+        Сохраняет товар и пересчитывает итоги корзины.
+
+        Для записи через ORM (админка, скрипты): запросы API меняют
+        итоги на разницу методами CartProductQuerySet. Товар
+        (FOR SHARE) и корзина (и прежняя, если товар перенесен)
+        блокируются до записи, как в этих методах.
+        """
+        with transaction.atomic(using=router.db_for_write(CartProduct)):
+            CartProduct.objects.lock_products({self.product_id})
+            carts = {self.cart_id}
+            if not self._state.adding:
+                carts.update(CartProduct.objects.filter(
+                    pk=self.pk
+                ).values_list('cart_id', flat=True))
+            self._lock_carts(carts)
+            super().save(*args, **kwargs)
+            Cart.objects.filter(pk__in=carts).recalculate_totals()
+
+    def delete(self, *args, **kwargs):
+        """Удаляет товар и пересчитывает итоги корзины."""
+        with transaction.atomic(using=router.db_for_write(CartProduct)):
+            self._lock_carts((self.cart_id,))
+            deleted = super().delete(*args, **kwargs)
+            Cart.objects.filter(pk=self.cart_id).recalculate_totals()
+        return deleted
+
+    @staticmethod
+    def _lock_carts(carts):
+        list(
+            Cart.objects.select_for_update(no_key=True).filter(
+                pk__in=carts
+            ).order_by('pk').values_list('pk', flat=True)
+        )
 
     @property
     def total_price(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.product.price * self.quantity
 
     def __str__(self):
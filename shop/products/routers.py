@@ -0,0 +1,110 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from products.cache import get_changed_at
+
+
+REPLICATED_MODELS = frozenset((
+    'products.category',
+    'products.subcategory',
+    'products.product',
+))
+
+_replica_reads = ContextVar('replica_reads', default=None)
+
+
+class ReplicaReads:
+    """Разрешение читать каталог с реплик в рамках одного запроса."""
+
+    def __init__(self):
+        self._settled = None
+
+    def is_settled(self):
+        """
+        Реплики успели получить последнюю запись каталога.
+
+        Пока после записи не прошло STICKY_SECONDS, каталог читается
+        с основной базы: иначе устаревшие данные реплики попали бы
+        в кэш ответов и снимок дерева категорий под новой версией.
+        Проверяется один раз за запрос.
+        """
+        if self._settled is None:
+            changed_at = get_changed_at()
+            self._settled = changed_at is None or (
+                time.time() - changed_at
+                > settings.DATABASE_REPLICAS['STICKY_SECONDS']
+            )
+        return self._settled
+
+
+@contextmanager
+def replica_reads():
+    """Чтение каталога с реплик внутри блока."""
+    token = _replica_reads.set(ReplicaReads())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def keep_replica_reads(iterable):
+    """
+    Итератор, который читает каталог так же, как код, создавший его.
+
+    Потоковый ответ перебирается после выхода из ReplicaMiddleware,
+    поэтому разрешение читать с реплик переносится в каждый шаг.
+    """
+    reads = _replica_reads.get()
+    iterator = iter(iterable)
+
+    def iterate():
+        while True:
+            token = _replica_reads.set(reads)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _replica_reads.reset(token)
+            yield item
+
+    return iterate()
+
+
+class ReplicaRouter:
+    """
+    Чтение категорий, подкатегорий и товаров с реплик.
+
+    Только внутри replica_reads() (безопасные запросы API без
+    закрепления за основной базой) и если реплики заданы в
+    DATABASE_REPLICAS['ALIASES']. Остальное, включая запись,
+    миграции и команды, - основная база.
+    """
+
+    def db_for_read(self, model, **hints):
+        aliases = settings.DATABASE_REPLICAS['ALIASES']
+        reads = _replica_reads.get()
+        if (
+            not aliases
+            or reads is None
+            or model._meta.label_lower not in REPLICATED_MODELS
+            or not reads.is_settled()
+        ):
+            return None
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS['ALIASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
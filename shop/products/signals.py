@@ -0,0 +1,55 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from products.cache import CATALOG, CATEGORY_TREE, invalidate
+from products.models import CartProduct, Category, Product, SubCategory
+
+
+@receiver((post_save, post_delete), sender=Category)
+@receiver((post_save, post_delete), sender=SubCategory)
+def invalidate_category_tree(**kwargs):
+    """Сброс снимка дерева категорий при изменении категорий."""
+    invalidate(CATEGORY_TREE)
+    invalidate(CATALOG)
+
+
+@receiver((post_save, post_delete), sender=Product)
+def invalidate_catalog(**kwargs):
+    """Сброс версии каталога при изменении товаров."""
+    invalidate(CATALOG)
+
+
+def is_deleted_with(origin, models):
+    """Удаление начато с объекта или набора одной из моделей."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(pre_delete, sender=Category)
+def discard_category_from_carts(instance, **kwargs):
+    """Вычитание товаров удаляемой категории из итогов корзин."""
+    CartProduct.objects.discard_category(instance.pk)
+
+
+@receiver(pre_delete, sender=SubCategory)
+def discard_subcategory_from_carts(instance, origin, **kwargs):
+    """
+    Вычитание товаров удаляемой подкатегории из итогов корзин.
+
+    При удалении категории товары уже вычтены ее обработчиком.
+    """
+    if not is_deleted_with(origin, Category):
+        CartProduct.objects.discard_subcategory(instance.pk)
+
+
+@receiver(pre_delete, sender=Product)
+def discard_from_carts(instance, origin, **kwargs):
+    """
+    Вычитание удаляемого товара из итогов корзин.
+
+    Каскадное удаление категории или подкатегории вычитает
+    все ее товары одним запросом, а не по товару.
+    """
+    if not is_deleted_with(origin, (Category, SubCategory)):
+        CartProduct.objects.discard_product(instance.pk)
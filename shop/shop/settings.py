@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -25,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_extensions',
@@ -39,6 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.PrometheusMiddleware',
+    'api.timing.ServerTimingMiddleware',
+    'api.queries.NPlusOneMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +81,27 @@ AUTH_USER_MODEL = 'users.User'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Пул соединений psycopg (DB_POOL=True): размер, ожидание свободного
+# соединения в секундах и проверка соединения перед выдачей.
+# Без пула соединение можно держать DB_CONN_MAX_AGE секунд.
+# DB_SERVER_SIDE_BINDING=True - параметры передаются серверу отдельно,
+# запрос, выполненный DB_PREPARE_THRESHOLD раз на соединении,
+# становится подготовленным (несовместимо с PgBouncer в режиме
+# transaction без поддержки prepared statements).
+DATABASE_OPTIONS = {}
+if os.getenv('DB_POOL', False) == 'True':
+    DATABASE_OPTIONS['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 600)),
+    }
+if os.getenv('DB_SERVER_SIDE_BINDING', False) == 'True':
+    DATABASE_OPTIONS['server_side_binding'] = True
+    DATABASE_OPTIONS['prepare_threshold'] = int(
+        os.getenv('DB_PREPARE_THRESHOLD', 5)
+    )
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -82,8 +109,125 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'django-password'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': (
+            0 if 'pool' in DATABASE_OPTIONS
+            else int(os.getenv('DB_CONN_MAX_AGE', 0))
+        ),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': DATABASE_OPTIONS,
+    }
+}
+
+# Реплики для чтения каталога: DB_REPLICAS=host[:port][/name],...
+# (пользователь и пароль - как у основной базы). После записи клиент
+# читает с основной базы STICKY_SECONDS секунд (cookie COOKIE),
+# каталог после своей записи - тоже.
+DATABASE_REPLICAS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5)),
+    'COOKIE': 'db_primary_until',
+}
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(','))
+):
+    address, _, name = replica.partition('/')
+    host, _, port = address.partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'OPTIONS': {**DATABASE_OPTIONS},
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS['ALIASES'].append(alias)
+
+DATABASE_ROUTERS = ['products.routers.ReplicaRouter']
+
+
+# Cache
+# Для сброса кэшей и кэша токенов между процессами нужен общий
+# бэкенд (Redis, Memcached, файловый или БД); вне DEBUG кэш в памяти
+# процесса - ошибка проверки api.E001.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кэш ответов каталога: алиас из CACHES и время жизни по эндпоинтам
+# (0 - не кэшировать). Ключи включают версию каталога.
+CATALOG_CACHE = {
+    'ALIAS': os.getenv('CATALOG_CACHE_ALIAS', 'default'),
+    'TIMEOUTS': {
+        'categories-list': 300,
+        'categories-detail': 300,
+        'categories-subcategory-products': 60,
+        'products-list': 60,
+        'products-facets': 60,
+        'products-detail': 60,
+    },
+}
+
+# Сколько товаров можно запросить одним POST /api/products/lookup/.
+PRODUCT_LOOKUP_LIMIT = int(os.getenv('PRODUCT_LOOKUP_LIMIT', 100))
+
+# Кэш аутентификации по токену: алиас из CACHES, размер LRU процесса
+# и время жизни записей в секундах.
+AUTH_TOKEN_CACHE = {
+    'ALIAS': os.getenv('AUTH_TOKEN_CACHE_ALIAS', 'default'),
+    'SIZE': int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000)),
+    'TTL': int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300)),
+}
+
+# Заголовок Server-Timing и строка лога api.timing для доли запросов
+# (0 - выключено, 1 - каждый запрос).
+SERVER_TIMING = {
+    'SAMPLE_RATE': float(os.getenv('SERVER_TIMING_SAMPLE_RATE', 0.1)),
+}
+
+# Адреса, с которых доступен /metrics (REMOTE_ADDR; пусто - только
+# при DEBUG). За обратным прокси REMOTE_ADDR - адрес прокси, /metrics
+# нужно закрыть на нем. Для gunicorn и uvicorn с несколькими воркерами
+# задайте PROMETHEUS_MULTIPROC_DIR (для gunicorn - с gunicorn.conf.py).
+METRICS = {
+    'ALLOWED_IPS': [
+        ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip
+    ],
+}
+
+# Поиск N+1: одинаковый по форме запрос к БД, повторенный THRESHOLD
+# раз за запрос API. ACTION: off, warn (лог api.queries) или raise.
+N_PLUS_ONE = {
+    'THRESHOLD': int(os.getenv('N_PLUS_ONE_THRESHOLD', 5)),
+    'ACTION': os.getenv('N_PLUS_ONE_ACTION', 'warn' if DEBUG else 'off'),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': os.getenv('SERVER_TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'api.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 
@@ -110,13 +254,26 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
 
+    # JSON через orjson, если он установлен, иначе стандартный json.
+    # Ответы совпадают с rest_framework.renderers.JSONRenderer побайтно.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': [
@@ -125,6 +282,31 @@ REST_FRAMEWORK = {
     ],
 }
 
+# JWT: короткий access-токен с id и ролью пользователя проверяется
+# без БД, refresh-токен выдает новые access. Отзыв (logout, смена роли,
+# деактивация) хранится в таблице JWTRevocation, пока живы refresh-токены;
+# процессы догружают новые отзывы раз в JWT_REVOCATION['REFRESH'] секунд.
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_MINUTES', 5))
+    ),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        days=int(os.getenv('JWT_REFRESH_DAYS', 7))
+    ),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+    'UPDATE_LAST_LOGIN': False,
+    'TOKEN_USER_CLASS': 'api.authentication.RoleTokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': (
+        'api.serializers.RoleTokenObtainPairSerializer'
+    ),
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.RoleTokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'api.serializers.RoleTokenVerifySerializer',
+}
+
+JWT_REVOCATION = {
+    'REFRESH': int(os.getenv('JWT_REVOCATION_REFRESH', 5)),
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -5,6 +5,8 @@ from django.urls import include, path
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 
+from api.metrics import metrics_view
+
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -18,6 +20,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
     path(
         'swagger/',
         schema_view.with_ui('swagger', cache_timeout=0),
@@ -1,15 +1,19 @@
 import os
+from contextlib import contextmanager
 
 import django
 import pytest
 
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework.test import APIClient
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop.settings')
 django.setup()
 
 
+from api.queries import QueryDetector
+from api.timing import wrap_queries
 from products.models import (
     Cart,
     CartProduct,
@@ -22,7 +26,7 @@ from products.models import (
 @pytest.fixture(scope='session')
 def django_db_setup():
     """Фикстура для настройки тестовой БД."""
-    settings.DATABASES['default'] = {
+    settings.DATABASES['default'].update({
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': 'test_db',
         'USER': 'postgres',
@@ -30,7 +34,38 @@ def django_db_setup():
         'HOST': 'localhost',
         'PORT': '5432',
         'ATOMIC_REQUESTS': False
-    }
+    })
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Очистка кэша: откат транзакции теста его не сбрасывает."""
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def raise_on_n_plus_one(settings):
+    """N+1 в любом запросе API роняет тест."""
+    settings.N_PLUS_ONE = {**settings.N_PLUS_ONE, 'ACTION': 'raise'}
+
+
+@pytest.fixture
+def query_budget(settings, django_assert_max_num_queries):
+    """
+    Бюджет запросов к БД для блока кода.
+
+    with query_budget(3): ... - не больше трех запросов
+    и без N+1 (как в NPlusOneMiddleware, но и вне запросов API).
+    """
+    @contextmanager
+    def budget(max_queries, label='query_budget'):
+        with (
+            django_assert_max_num_queries(max_queries),
+            wrap_queries(QueryDetector()) as detector
+        ):
+            yield
+        detector.check(label, settings.N_PLUS_ONE['THRESHOLD'])
+    return budget
 
 
 @pytest.fixture
@@ -0,0 +1,250 @@
+import time
+
+import pytest
+from django.core.cache import cache
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework.status import (
+    HTTP_200_OK as OK,
+    HTTP_204_NO_CONTENT as NO_CONTENT,
+    HTTP_401_UNAUTHORIZED as UNAUTHORIZED,
+)
+
+from api.authentication import RoleRefreshToken, is_token_revoked
+from api.checks import check_shared_cache
+from users.cache import (
+    TOKEN_KEY,
+    USER,
+    RevocationList,
+    get_token_cache,
+    get_token_digest,
+    revoke_user,
+)
+from users.consts import ADMIN
+from users.models import JWTRevocation
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def token(owner):
+    """Токен владельца."""
+    return Token.objects.create(user=owner)
+
+
+@pytest.fixture
+def token_client(token):
+    """Клиент с заголовком Authorization: Token."""
+    token_client = APIClient()
+    token_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return token_client
+
+
+def test_token_auth_is_cached(
+        token_client,
+        token,
+        owner,
+        cart_product,
+        django_assert_num_queries
+):
+    """Повторные запросы не читают токен и пользователя из БД."""
+    url = reverse('cart-list')
+    assert token_client.get(url).status_code == OK
+    user_values, _ = get_token_cache().get(
+        TOKEN_KEY.format(get_token_digest(token.key))
+    )
+    assert owner.password not in user_values
+
+    with django_assert_num_queries(1):
+        response = token_client.get(url)
+
+    assert response.status_code == OK
+    user = response.wsgi_request.user
+    assert user.pk == owner.pk
+    assert 'password' in user.get_deferred_fields()
+
+
+def test_logout_invalidates_token(token_client):
+    """После logout закэшированный токен не принимается."""
+    url = reverse('cart-list')
+    assert token_client.get(url).status_code == OK
+
+    response = token_client.post('/api/auth/token/logout/')
+    assert response.status_code == NO_CONTENT
+
+    assert token_client.get(url).status_code == UNAUTHORIZED
+
+
+def test_user_changes_invalidate_token(token_client, owner):
+    """Деактивация и смена роли действуют сразу."""
+    url = reverse('cart-list')
+    response = token_client.get(url)
+    assert response.wsgi_request.user.role != ADMIN
+
+    owner.role = ADMIN
+    owner.save()
+    response = token_client.get(url)
+    assert response.wsgi_request.user.role == ADMIN
+
+    owner.is_active = False
+    owner.save()
+    assert token_client.get(url).status_code == UNAUTHORIZED
+
+
+def test_login_keeps_token_cache(
+        token_client,
+        token,
+        owner,
+        cart_product,
+        django_assert_num_queries
+):
+    """Запись last_login и других полей не сбрасывает кэш токенов."""
+    url = reverse('cart-list')
+    token_client.get(url)
+    cache_key = TOKEN_KEY.format(get_token_digest(token.key))
+
+    owner.last_login = timezone.now()
+    # Проверка уникальности из full_clean и UPDATE, без чтения полей.
+    with django_assert_num_queries(2):
+        owner.save(update_fields=['last_login'])
+    owner.first_name = 'Владелец'
+    owner.save()
+    with django_assert_num_queries(1):
+        assert token_client.get(url).status_code == OK
+
+    owner.set_password('new-pass-12345')
+    owner.save()
+    assert get_token_cache().get(cache_key) is None
+
+
+@pytest.fixture
+def jwt_user(django_user_model):
+    """Пользователь с паролем для входа по JWT."""
+    user = django_user_model(username='jwt_user', email='jwt@test.test')
+    user.set_password('jwt-pass-12345')
+    user.save()
+    return user
+
+
+@pytest.fixture
+def jwt_tokens(jwt_user):
+    """Пара access и refresh для jwt_user."""
+    response = APIClient().post(
+        '/api/auth/jwt/create/',
+        {'username': 'jwt_user', 'password': 'jwt-pass-12345'}
+    )
+    assert response.status_code == OK
+    return response.data
+
+
+def jwt_client(access):
+    """Клиент с заголовком Authorization: Bearer."""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    return client
+
+
+def test_jwt_auth_without_database(
+        jwt_user,
+        jwt_tokens,
+        django_assert_num_queries
+):
+    """Access-токен проверяется без БД, роль берется из токена."""
+    client = jwt_client(jwt_tokens['access'])
+    url = reverse('categories-list')
+    client.get(url)
+
+    with django_assert_num_queries(0):
+        response = client.get(url)
+
+    assert response.status_code == OK
+    user = response.wsgi_request.user
+    assert user.id == jwt_user.id
+    assert user.role == jwt_user.role
+
+
+def test_jwt_refresh_and_logout(jwt_tokens):
+    """Logout отзывает refresh и выданные по нему access-токены."""
+    response = APIClient().post(
+        '/api/auth/jwt/refresh/',
+        {'refresh': jwt_tokens['refresh']}
+    )
+    assert response.status_code == OK
+    access = response.data['access']
+    url = reverse('cart-list')
+    assert jwt_client(access).get(url).status_code == OK
+
+    response = APIClient().post(
+        reverse('jwt-logout'),
+        {'refresh': jwt_tokens['refresh']}
+    )
+    assert response.status_code == NO_CONTENT
+
+    assert jwt_client(access).get(url).status_code == UNAUTHORIZED
+    response = APIClient().post(
+        '/api/auth/jwt/refresh/',
+        {'refresh': jwt_tokens['refresh']}
+    )
+    assert response.status_code == UNAUTHORIZED
+
+
+def test_jwt_revoked_on_role_change(jwt_user, jwt_tokens):
+    """Смена роли отзывает выданные пользователю JWT."""
+    client = jwt_client(jwt_tokens['access'])
+    url = reverse('cart-list')
+    assert client.get(url).status_code == OK
+
+    jwt_user.role = ADMIN
+    jwt_user.save()
+
+    assert client.get(url).status_code == UNAUTHORIZED
+
+
+def test_jwt_issued_after_revocation(owner):
+    """Токены, выданные сразу после отзыва, действительны."""
+    revoke_user(owner.pk)
+    refresh = RoleRefreshToken.for_user(owner)
+    assert not is_token_revoked(refresh)
+    assert not is_token_revoked(refresh.access_token)
+
+    revoke_user(owner.pk)
+    assert is_token_revoked(refresh)
+    assert is_token_revoked(refresh.access_token)
+
+
+def test_revocations_survive_cache_and_expire(owner):
+    """Отзыв хранится в БД: его видит новый процесс, истекшие удаляются."""
+    now = time.time()
+    JWTRevocation.objects.create(
+        kind=USER,
+        value=owner.pk,
+        revoked_at=now - 100,
+        expires_at=now - 1
+    )
+    revoke_user(owner.pk)
+    assert JWTRevocation.objects.count() == 1
+
+    cache.clear()
+    worker = RevocationList(refresh_interval=60)
+    assert worker.is_revoked(None, owner.pk, now)
+    assert not worker.is_revoked(None, owner.pk, time.time() + 1)
+
+
+def test_shared_cache_check(settings):
+    """Вне DEBUG кэш в памяти процесса - ошибка проверки."""
+    settings.DEBUG = False
+    [error] = check_shared_cache(None)
+    assert error.id == 'api.E001'
+
+    with override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379',
+    }}):
+        assert check_shared_cache(None) == []
+
+    settings.DEBUG = True
+    assert check_shared_cache(None) == []
@@ -1,16 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from threading import Barrier
+
 import pytest
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from rest_framework.test import APIClient
 from rest_framework.status import (
     HTTP_200_OK as OK,
     HTTP_201_CREATED as CREATED,
     HTTP_204_NO_CONTENT as NO_CONTENT,
+    HTTP_304_NOT_MODIFIED as NOT_MODIFIED,
     HTTP_400_BAD_REQUEST as BAD_REQUEST,
     HTTP_401_UNAUTHORIZED as UNAUTHORIZED,
+    HTTP_404_NOT_FOUND as NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED as PRECONDITION_FAILED,
 )
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from products.cache import get_category_tree
 from products.models import (
+    Cart,
     CartProduct,
-    Category
+    Category,
+    Product
 )
 
 
@@ -177,3 +193,386 @@ def test_clear_cart(owner_client, cart, cart_product, product2):
 
     cart_response_after = owner_client.get(cart_url)
     assert_empty(cart_response_after)
+
+
+def test_cart_conditional_get(owner_client, cart_product, product2):
+    """Корзина отвечает 304 на совпавший ETag и меняет его при записи."""
+    cart_url = reverse('cart-list')
+    response = owner_client.get(cart_url)
+    etag = response['ETag']
+    assert response.has_header('Last-Modified')
+
+    response = owner_client.get(cart_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == NOT_MODIFIED
+
+    add_url = reverse('products-to-cart', kwargs={'slug': product2.slug})
+    owner_client.post(add_url, {'quantity': 1})
+
+    response = owner_client.get(cart_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == OK
+    assert response['ETag'] != etag
+
+
+def test_cart_write_if_match(owner_client, cart_product):
+    """Запись со старым ETag отклоняется, с актуальным - проходит."""
+    cart_url = reverse('cart-list')
+    etag = owner_client.get(cart_url)['ETag']
+    url = reverse('cart-detail', kwargs={'pk': cart_product.id})
+
+    response = owner_client.put(url, {'quantity': 3}, HTTP_IF_MATCH=etag)
+    assert response.status_code == OK
+
+    response = owner_client.put(url, {'quantity': 4}, HTTP_IF_MATCH=etag)
+    assert response.status_code == PRECONDITION_FAILED
+
+    cart_response = owner_client.get(cart_url)
+    assert cart_response.data['total_quantity'] == 3
+
+
+def test_cart_read_query_count(
+        owner_client,
+        cart,
+        subcategory,
+        django_assert_num_queries
+):
+    """Чтение корзины - один запрос независимо от числа товаров."""
+    get_category_tree()
+    cart_url = reverse('cart-list')
+
+    for items_count in (1, 5):
+        for number in range(cart.cart_products.count(), items_count):
+            product = Product.objects.create(
+                name=f'Product {number}',
+                slug=f'product-{number}',
+                subcategory=subcategory,
+                price=10
+            )
+            CartProduct.objects.add_to_cart(cart.user_id, product.slug, 2)
+
+        with django_assert_num_queries(1):
+            response = owner_client.get(cart_url)
+
+        assert response.status_code == OK
+        assert len(response.data['products']) == items_count
+        assert response.data['total_quantity'] == 2 * items_count
+        assert response.data['total_price'] == f'{20 * items_count}.00'
+
+    item = response.data['products'][0]
+    assert item['total_price'] == '20.00'
+    assert item['product']['subcategory']['category']['slug'] == (
+        subcategory.category.slug
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_add_to_cart(owner, product1):
+    """Параллельные добавления товара не теряют количество."""
+    workers, adds_per_worker = 8, 5
+    barrier = Barrier(workers)
+    url = reverse('products-to-cart', kwargs={'slug': product1.slug})
+
+    def add_many():
+        client = APIClient()
+        client.force_authenticate(owner)
+        barrier.wait()
+        try:
+            return [
+                client.post(url, {'quantity': 1}).status_code
+                for _ in range(adds_per_worker)
+            ]
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(workers) as executor:
+        results = [executor.submit(add_many) for _ in range(workers)]
+        statuses = [status for result in results for status in result.result()]
+
+    assert set(statuses) == {CREATED}
+    cart_item = CartProduct.objects.get(cart__user=owner, product=product1)
+    assert cart_item.quantity == workers * adds_per_worker
+    assert owner.cart.total_quantity == workers * adds_per_worker
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_cart_writes_keep_totals(owner, product1, product2):
+    """Параллельные записи разными путями не сбивают итоги корзины."""
+    CartProduct.objects.add_to_cart(owner.id, product1.slug, 1)
+    item = CartProduct.objects.get(cart__user=owner, product=product1)
+    workers = 6
+    barrier = Barrier(workers)
+    add_url = reverse('products-to-cart', kwargs={'slug': product1.slug})
+    other_url = reverse('products-to-cart', kwargs={'slug': product2.slug})
+    item_url = reverse('cart-detail', kwargs={'pk': item.id})
+
+    def write(number):
+        client = APIClient()
+        client.force_authenticate(owner)
+        barrier.wait()
+        try:
+            for step in range(5):
+                if number % 3 == 0:
+                    client.post(add_url, {'quantity': 2})
+                elif number % 3 == 1:
+                    client.put(item_url, {'quantity': number + step + 1})
+                else:
+                    client.post(other_url)
+                    client.delete(other_url)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(workers) as executor:
+        for result in [executor.submit(write, n) for n in range(workers)]:
+            result.result()
+
+    assert not Cart.objects.with_drift().exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_price_change_during_cart_writes(
+        django_user_model,
+        product1,
+        product2
+):
+    """Смена цены во время записей в корзины не сбивает итоги."""
+    users = [
+        django_user_model.objects.create_user(
+            username=f'buyer{number}',
+            email=f'buyer{number}@test.test'
+        )
+        for number in range(4)
+    ]
+    batch_url = reverse('cart-batch')
+    barrier = Barrier(len(users) + 1)
+
+    def write(user):
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        try:
+            for step in range(15):
+                CartProduct.objects.add_to_cart(user.id, product1.slug, 1)
+                if step % 3 == 0:
+                    client.post(batch_url, {'operations': [
+                        {'op': 'add', 'product': product2.slug},
+                        {'op': 'set', 'product': product1.slug,
+                         'quantity': step + 1},
+                    ]}, format='json')
+                elif step % 3 == 1:
+                    CartProduct.objects.clear_cart(user.id)
+        finally:
+            connection.close()
+
+    def reprice():
+        barrier.wait()
+        try:
+            for step in range(30):
+                product = Product.objects.get(pk=product1.pk)
+                product.price = 100 + step
+                product.save()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(len(users) + 1) as executor:
+        results = [executor.submit(write, user) for user in users]
+        results.append(executor.submit(reprice))
+        for result in results:
+            result.result()
+
+    assert not Cart.objects.with_drift().exists()
+
+
+def test_cart_totals_follow_product_changes(
+        owner,
+        owner_client,
+        cart_product,
+        product2
+):
+    """Итоги корзины меняются вместе с ценой и удалением товаров."""
+    CartProduct.objects.add_to_cart(owner.id, product2.slug, 3)
+    cart_url = reverse('cart-list')
+    assert owner_client.get(cart_url).data['total_price'] == '500.00'
+
+    product = cart_product.product
+    product.price = 150
+    product.save()
+    response = owner_client.get(cart_url)
+    assert response.data['total_price'] == '600.00'
+
+    product2.delete()
+    response = owner_client.get(cart_url)
+    assert response.data['total_quantity'] == 2
+    assert response.data['total_price'] == '300.00'
+
+
+def test_category_delete_discards_products_at_once(
+        owner,
+        cart_product,
+        product2
+):
+    """Удаление категории вычитает ее товары из корзин одним запросом."""
+    CartProduct.objects.add_to_cart(owner.id, product2.slug, 3)
+    category = product2.subcategory.category
+
+    with CaptureQueriesContext(connection) as queries:
+        category.delete()
+
+    cart_updates = [
+        query for query in queries
+        if query['sql'].split()[:2] == ['UPDATE', Cart._meta.db_table]
+    ]
+    assert len(cart_updates) == 1
+    owner.cart.refresh_from_db()
+    assert (owner.cart.total_quantity, owner.cart.total_price) == (0, 0)
+    assert not Cart.objects.with_drift().exists()
+
+
+def test_cart_totals_follow_orm_writes(cart, cart_product, product2):
+    """Запись товаров корзины через ORM пересчитывает итоги."""
+    item = CartProduct.objects.create(cart=cart, product=product2, quantity=3)
+    cart.refresh_from_db()
+    assert (cart.total_quantity, cart.total_price) == (5, 500)
+
+    item.quantity = 1
+    item.save()
+    cart_product.delete()
+    cart.refresh_from_db()
+    assert (cart.total_quantity, cart.total_price) == (1, 100)
+    assert not Cart.objects.with_drift().exists()
+
+
+def test_failed_product_save_keeps_cart_totals(cart, cart_product, product2):
+    """Итоги корзин не меняются, если товар не сохранился."""
+    product = cart_product.product
+    product.price = 150
+    product.slug = product2.slug
+    with pytest.raises(IntegrityError):
+        product.save()
+
+    cart.refresh_from_db()
+    assert cart.total_price == 200
+    assert not Cart.objects.with_drift().exists()
+
+
+def test_add_to_cart_quantity_overflow(owner_client, cart_product):
+    """Переполнение количества товара - ошибка 400, итоги не меняются."""
+    url = reverse(
+        'products-to-cart',
+        kwargs={'slug': cart_product.product.slug}
+    )
+    response = owner_client.post(url, {'quantity': 32767})
+    assert response.status_code == BAD_REQUEST
+    assert owner_client.get(reverse('cart-list')).data['total_quantity'] == 2
+
+
+def test_reconcile_cart_totals(cart, cart_product):
+    """Команда находит и исправляет расхождения итогов корзин."""
+    Cart.objects.filter(pk=cart.pk).update(total_quantity=7, total_price=1)
+    with pytest.raises(CommandError):
+        call_command('reconcile_cart_totals', stdout=StringIO())
+
+    call_command('reconcile_cart_totals', '--fix', stdout=StringIO())
+    cart.refresh_from_db()
+    assert cart.total_quantity == 2
+    assert cart.total_price == 200
+    assert not Cart.objects.with_drift().exists()
+
+
+def test_add_to_cart_validation(owner_client, product1):
+    """Количество должно быть положительным, товар - существовать."""
+    url = reverse('products-to-cart', kwargs={'slug': product1.slug})
+    assert owner_client.post(url, {'quantity': 0}).status_code == BAD_REQUEST
+
+    url = reverse('products-to-cart', kwargs={'slug': 'missing'})
+    assert owner_client.post(url).status_code == NOT_FOUND
+    assert owner_client.delete(url).status_code == NOT_FOUND
+
+
+def test_cart_batch(
+        owner_client,
+        cart,
+        cart_product,
+        product2,
+        subcategory,
+        django_assert_max_num_queries
+):
+    """Пакет операций применяется за постоянное число запросов."""
+    products = Product.objects.bulk_create(
+        Product(
+            name=f'Batch Product {number}',
+            slug=f'batch-product-{number}',
+            subcategory=subcategory,
+            price=1
+        )
+        for number in range(20)
+    )
+    operations = [
+        {'op': 'add', 'product': product.slug, 'quantity': 2}
+        for product in products
+    ] + [
+        {'op': 'add', 'product': product2.slug},
+        {'op': 'add', 'product': product2.slug, 'quantity': 2},
+        {'op': 'remove', 'product': cart_product.product.slug},
+        {'op': 'set', 'product': products[0].slug, 'quantity': 7},
+        {'op': 'add', 'product': products[0].slug},
+        {'op': 'set', 'product': products[1].slug, 'quantity': 0},
+    ]
+    get_category_tree()
+
+    with django_assert_max_num_queries(11):
+        response = owner_client.post(
+            reverse('cart-batch'),
+            {'operations': operations},
+            format='json'
+        )
+
+    assert response.status_code == OK
+    quantities = {
+        item['product']['slug']: item['quantity']
+        for item in response.data['products']
+    }
+    assert quantities[product2.slug] == 3
+    assert quantities[products[0].slug] == 8
+    assert products[1].slug not in quantities
+    assert cart_product.product.slug not in quantities
+    assert len(quantities) == 20
+    assert response.data['total_quantity'] == 3 + 8 + 18 * 2
+    assert response.has_header('ETag')
+
+
+def test_cart_batch_too_many(owner_client, cart_product):
+    """Пакет, превышающий допустимое количество, отклоняется целиком."""
+    url = reverse('cart-batch')
+    slug = cart_product.product.slug
+    for operations in (
+        [{'op': 'add', 'product': slug, 'quantity': 32767}],
+        [
+            {'op': 'remove', 'product': slug},
+            {'op': 'add', 'product': slug, 'quantity': 32767},
+            {'op': 'add', 'product': slug, 'quantity': 32767},
+        ],
+    ):
+        response = owner_client.post(
+            url,
+            {'operations': operations},
+            format='json'
+        )
+        assert response.status_code == BAD_REQUEST
+        assert 'quantity' in response.data
+
+    cart_product.refresh_from_db()
+    assert cart_product.quantity == 2
+
+
+def test_cart_batch_unknown_product(owner_client, cart_product):
+    """Неизвестный слаг отклоняет весь пакет."""
+    response = owner_client.post(
+        reverse('cart-batch'),
+        {'operations': [
+            {'op': 'remove', 'product': cart_product.product.slug},
+            {'op': 'add', 'product': 'missing'},
+        ]},
+        format='json'
+    )
+
+    assert response.status_code == BAD_REQUEST
+    assert CartProduct.objects.filter(pk=cart_product.pk).exists()
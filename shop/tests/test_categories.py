@@ -0,0 +1,90 @@
+import pytest
+from django.urls import reverse
+from rest_framework.status import (
+    HTTP_200_OK as OK,
+    HTTP_302_FOUND as FOUND,
+    HTTP_404_NOT_FOUND as NOT_FOUND,
+)
+
+from products.cache import get_category_tree
+from products.models import SubCategory
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_categories_served_from_tree(
+        client,
+        category,
+        subcategory,
+        django_assert_num_queries
+):
+    """Категории и подкатегории отдаются без запросов к БД."""
+    get_category_tree()
+
+    with django_assert_num_queries(0):
+        list_response = client.get(reverse('categories-list'))
+        detail_response = client.get(
+            reverse('categories-detail', kwargs={'slug': category.slug})
+        )
+
+    assert list_response.status_code == OK
+    assert list_response.data['results'][0]['slug'] == category.slug
+    assert detail_response.status_code == OK
+    assert detail_response.data['results'][0]['category']['slug'] == (
+        category.slug
+    )
+
+
+def test_category_tree_invalidated_on_save(client, category, subcategory):
+    """Запись подкатегории сбрасывает снимок дерева."""
+    url = reverse('categories-detail', kwargs={'slug': category.slug})
+    assert len(client.get(url).data['results']) == 1
+
+    SubCategory.objects.create(
+        name='Another SubCategory',
+        slug='another-subcategory',
+        category=category
+    )
+    assert len(client.get(url).data['results']) == 2
+
+    category.delete()
+    assert client.get(url).status_code == NOT_FOUND
+
+
+def test_subcategory_products_single_query(
+        client,
+        category,
+        subcategory,
+        product1,
+        product2,
+        django_assert_num_queries
+):
+    """Товары подкатегории не догружают подкатегорию и категорию."""
+    get_category_tree()
+    url = reverse(
+        'categories-subcategory-products',
+        kwargs={'slug': category.slug, 'subcategory_slug': subcategory.slug}
+    )
+
+    with django_assert_num_queries(2):
+        response = client.get(url)
+
+    assert response.status_code == OK
+    assert response.data['results'][0]['category'] == category.name
+
+
+def test_product_redirect(client, category, subcategory, product1):
+    """Редирект на товар по слагам категории и подкатегории."""
+    url = reverse(
+        'product-redirect',
+        kwargs={
+            'category_slug': category.slug,
+            'subcategory_slug': subcategory.slug,
+            'product_slug': product1.slug
+        }
+    )
+    response = client.get(url)
+
+    assert response.status_code == FOUND
+    assert response.url == f'/api/{product1.short_url}'
@@ -0,0 +1,117 @@
+import runpy
+from types import SimpleNamespace
+
+import pytest
+from django.conf import settings
+from django.test.utils import override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework.status import (
+    HTTP_200_OK as OK,
+    HTTP_404_NOT_FOUND as NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED as PRECONDITION_FAILED,
+)
+
+
+pytestmark = pytest.mark.django_db
+
+AUTH_CACHE = 'shop_auth_token_cache_requests_total'
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_metrics(client, owner, cart_product):
+    """Запросы, БД, кэш каталога, конфликты корзины и кэш токенов."""
+    requests = {
+        'route': 'products-list',
+        'method': 'GET',
+        'status': '200',
+    }
+    before = {
+        'requests': sample('shop_http_requests_total', **requests),
+        'queries': sample(
+            'shop_http_request_db_queries_sum',
+            route='products-list'
+        ),
+        'hits': sample(
+            'shop_catalog_cache_requests_total',
+            endpoint='products-list',
+            result='hit'
+        ),
+        'conflicts': sample('shop_cart_write_conflicts_total', reason='etag'),
+        'misses': sample(AUTH_CACHE, result='miss'),
+        'local': sample(AUTH_CACHE, result='local'),
+    }
+
+    url = reverse('products-list')
+    assert client.get(url).status_code == OK
+    assert client.get(url).status_code == OK
+
+    token_client = APIClient()
+    token_client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=owner).key}'
+    )
+    response = token_client.put(
+        reverse('cart-detail', kwargs={'pk': cart_product.id}),
+        {'quantity': 3},
+        HTTP_IF_MATCH='"stale"'
+    )
+    assert response.status_code == PRECONDITION_FAILED
+    token_client.get(reverse('cart-list'))
+
+    assert sample('shop_http_requests_total', **requests) == (
+        before['requests'] + 2
+    )
+    assert sample(
+        'shop_http_request_duration_seconds_count',
+        route='products-list',
+        method='GET'
+    ) >= 2
+    assert sample(
+        'shop_http_request_db_queries_sum',
+        route='products-list'
+    ) > before['queries']
+    assert sample(
+        'shop_catalog_cache_requests_total',
+        endpoint='products-list',
+        result='hit'
+    ) == before['hits'] + 1
+    assert sample('shop_cart_write_conflicts_total', reason='etag') == (
+        before['conflicts'] + 1
+    )
+    assert sample(AUTH_CACHE, result='miss') == before['misses'] + 1
+    assert sample(AUTH_CACHE, result='local') == before['local'] + 1
+
+    with override_settings(METRICS={'ALLOWED_IPS': ['127.0.0.1']}):
+        response = client.get(reverse('metrics'))
+    assert response.status_code == OK
+    assert b'shop_http_request_duration_seconds_bucket{' in response.content
+    with override_settings(METRICS={'ALLOWED_IPS': ['10.0.0.1']}):
+        assert client.get(reverse('metrics')).status_code == NOT_FOUND
+
+    assert client.get(reverse('metrics')).status_code == NOT_FOUND
+    with override_settings(DEBUG=True):
+        assert client.get(reverse('metrics')).status_code == OK
+
+
+def test_gunicorn_child_exit(monkeypatch, tmp_path):
+    """Файлы livesum-метрик завершенного воркера удаляются."""
+    child_exit = runpy.run_path(
+        str(settings.BASE_DIR / 'gunicorn.conf.py')
+    )['child_exit']
+    dead = tmp_path / 'gauge_livesum_100.db'
+    alive = tmp_path / 'gauge_livesum_200.db'
+    counter = tmp_path / 'counter_100.db'
+    for path in (dead, alive, counter):
+        path.touch()
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+
+    child_exit(None, SimpleNamespace(pid=100))
+
+    assert not dead.exists()
+    assert alive.exists()
+    assert counter.exists()
@@ -0,0 +1,988 @@
+import base64
+import csv
+import datetime
+import io
+import json
+import logging
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.status import (
+    HTTP_200_OK as OK,
+    HTTP_304_NOT_MODIFIED as NOT_MODIFIED,
+    HTTP_400_BAD_REQUEST as BAD_REQUEST,
+    HTTP_401_UNAUTHORIZED as UNAUTHORIZED,
+    HTTP_404_NOT_FOUND as NOT_FOUND,
+)
+
+from api import timing
+from api.authentication import RoleRefreshToken, is_token_revoked
+from api.cache import get_cache_stats
+from api.compiled import CompiledSerializer
+from api.renderers import FastJSONParser, FastJSONRenderer
+from api.serializers import ProductSerializer
+from products.cache import CHANGED_KEY, get_category_tree
+from products.models import (
+    Cart,
+    CartProduct,
+    Category,
+    Product,
+    SubCategory
+)
+from products.routers import ReplicaRouter
+from users.consts import GENERATED_SLUG_PREFIX, GENERATED_USERNAME_PREFIX
+from users.models import User
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def products(subcategory):
+    """25 товаров с повторяющимися ценами."""
+    return Product.objects.bulk_create(
+        Product(
+            name=f'Product {i:02}',
+            slug=f'product-{i}',
+            subcategory=subcategory,
+            price=10 * (i % 5)
+        )
+        for i in range(25)
+    )
+
+
+def collect_pages(client, url, params):
+    """Проходит по всем страницам через ссылки next."""
+    response = client.get(url, params)
+    assert response.status_code == OK
+    pages = [response.data]
+    while response.data['next']:
+        response = client.get(response.data['next'])
+        assert response.status_code == OK
+        pages.append(response.data)
+    return pages
+
+
+def test_cursor_pagination_by_price(client, products):
+    """Пагинация по ключу (price, id) отдает все товары без повторов."""
+    url = reverse('products-list')
+    pages = collect_pages(
+        client,
+        url,
+        {'pagination': 'cursor', 'ordering': 'price'}
+    )
+
+    slugs = [item['slug'] for page in pages for item in page['results']]
+    expected = list(
+        Product.objects.order_by('price', 'id').values_list('slug', flat=True)
+    )
+    assert slugs == expected
+    assert len(pages) == 3
+    assert 'count' not in pages[0]
+    assert pages[0]['previous'] is None
+
+
+def test_cursor_pagination_previous_link(client, products):
+    """Ссылка previous возвращает на предыдущую страницу."""
+    url = reverse('products-list')
+    first = client.get(
+        url,
+        {'pagination': 'cursor', 'ordering': '-name'}
+    ).data
+    second = client.get(first['next']).data
+    back = client.get(second['previous']).data
+
+    assert back['results'] == first['results']
+
+
+def test_subcategory_products_cursor_pagination(
+        client,
+        category,
+        subcategory,
+        products
+):
+    """Пагинация по ключу работает для товаров подкатегории."""
+    url = reverse(
+        'categories-subcategory-products',
+        kwargs={'slug': category.slug, 'subcategory_slug': subcategory.slug}
+    )
+    pages = collect_pages(
+        client,
+        url,
+        {'pagination': 'cursor', 'count': 'exact'}
+    )
+
+    assert pages[0]['count'] == 25
+    assert sum(len(page['results']) for page in pages) == 25
+
+
+def test_cursor_pagination_estimated_count(client, products):
+    """Оценка количества берется из плана запроса."""
+    url = reverse('products-list')
+    response = client.get(
+        url,
+        {'pagination': 'cursor', 'count': 'estimate'}
+    )
+
+    assert response.status_code == OK
+    assert isinstance(response.data['count'], int)
+
+
+def test_cursor_pagination_errors(client, products):
+    """Неверные курсор и сортировка."""
+    url = reverse('products-list')
+
+    response = client.get(url, {'cursor': 'broken'})
+    assert response.status_code == NOT_FOUND
+
+    for ordering, position in (
+        ('price', ['abc', 1]),
+        ('price', ['NaN', 1]),
+        ('price', ['1e1000000', 1]),
+        ('price', [['1'], 1]),
+        ('name', [None, 1]),
+        ('name', [{}, 1]),
+        ('name', ['name\x00', 1]),
+        ('name', ['name', '1']),
+    ):
+        cursor = base64.urlsafe_b64encode(json.dumps(
+            {'o': ordering, 'p': position, 'r': False}
+        ).encode()).decode()
+        response = client.get(url, {'cursor': cursor})
+        assert response.status_code == NOT_FOUND
+
+    response = client.get(
+        url,
+        {'pagination': 'cursor', 'ordering': 'slug'}
+    )
+    assert response.status_code == BAD_REQUEST
+
+
+def test_cursor_pagination_empty_name(client, subcategory, products):
+    """Курсор на товаре с пустым названием ведет на следующую страницу."""
+    empty = Product.objects.create(
+        name='',
+        slug='empty-name',
+        subcategory=subcategory,
+        price=10
+    )
+    url = reverse('products-list')
+    cursor = base64.urlsafe_b64encode(json.dumps(
+        {'o': 'name', 'p': ['', empty.id], 'r': False}
+    ).encode()).decode()
+
+    response = client.get(url, {'cursor': cursor})
+
+    assert response.status_code == OK
+    assert [item['slug'] for item in response.data['results']] == list(
+        Product.objects.exclude(id=empty.id).order_by(
+            'name',
+            'id'
+        ).values_list('slug', flat=True)[:10]
+    )
+
+
+def has_trigram_extension():
+    """Установлено ли расширение pg_trgm."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        )
+        return cursor.fetchone() is not None
+
+
+def test_search_ranks_by_relevance(client, category, subcategory):
+    """Совпадение в названии товара выше совпадения в подкатегории."""
+    subcategory.name = 'Смартфоны'
+    subcategory.save()
+    Product.objects.create(
+        name='Чехол',
+        slug='case',
+        subcategory=subcategory,
+        price=10
+    )
+    Product.objects.create(
+        name='Смартфон Galaxy',
+        slug='galaxy',
+        subcategory=subcategory,
+        price=100
+    )
+
+    response = client.get(reverse('products-list'), {'search': 'смартфон'})
+
+    assert response.status_code == OK
+    slugs = [item['slug'] for item in response.data['results']]
+    assert slugs == ['galaxy', 'case']
+
+
+def test_search_vector_follows_category_rename(client, category, product1):
+    """Переименование категории обновляет поисковые векторы товаров."""
+    category.name = 'Электроника'
+    category.save()
+
+    response = client.get(
+        reverse('products-list'),
+        {'search': 'электроника'}
+    )
+
+    assert [item['slug'] for item in response.data['results']] == [
+        product1.slug
+    ]
+
+
+def test_search_trigram_fallback(client, subcategory):
+    """При опечатке поиск находит товар по схожести названия."""
+    if not has_trigram_extension():
+        pytest.skip('Расширение pg_trgm не установлено.')
+    Product.objects.create(
+        name='Наушники',
+        slug='headphones',
+        subcategory=subcategory,
+        price=10
+    )
+
+    response = client.get(reverse('products-list'), {'search': 'наушнки'})
+
+    assert [item['slug'] for item in response.data['results']] == [
+        'headphones'
+    ]
+
+
+def test_search_with_cursor_pagination(client, product1):
+    """Поиск с пагинацией по ключу отклоняется: она сменила бы порядок."""
+    url = reverse('products-list')
+
+    for params in (
+        {'search': 'product', 'pagination': 'cursor'},
+        {'search': 'product', 'cursor': 'abc'},
+    ):
+        response = client.get(url, params)
+
+        assert response.status_code == BAD_REQUEST
+        assert 'search' in response.data
+
+    response = client.get(url, {'search': 'product', 'page': 1})
+    assert response.status_code == OK
+
+
+def test_product_queries_skip_search_vector(client, product1):
+    """Карточка и список товаров не читают поисковый вектор."""
+    for url in (
+        reverse('products-list'),
+        reverse('products-detail', args=(product1.slug,)),
+    ):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+
+        assert response.status_code == OK
+        assert not any(
+            'search_vector' in query['sql'] for query in queries
+        )
+
+
+def test_catalog_response_cache(
+        client,
+        product1,
+        django_assert_num_queries
+):
+    """Повторный GET отдается из кэша до изменения каталога."""
+    url = reverse('products-detail', kwargs={'slug': product1.slug})
+    first = client.get(url)
+    assert first['X-Cache'] == 'MISS'
+
+    with django_assert_num_queries(0):
+        second = client.get(url)
+    assert second['X-Cache'] == 'HIT'
+    assert second.data == first.data
+
+    product1.price = 150
+    product1.save()
+    third = client.get(url)
+    assert third['X-Cache'] == 'MISS'
+    assert third.data['price'] == '150.00'
+
+    stats = get_cache_stats()
+    assert stats[('products-detail', 'hit')] >= 1
+    assert stats[('products-detail', 'miss')] >= 2
+
+
+def test_catalog_response_cache_varies_by_query(client, products):
+    """Параметры поиска и фильтрации входят в ключ кэша."""
+    url = reverse('products-list')
+    first = client.get(url, {'search': 'product'})
+    second = client.get(url, {'search': 'product', 'page': 2})
+
+    assert second['X-Cache'] == 'MISS'
+    assert first.data['results'] != second.data['results']
+
+    secure = client.get(url, {'search': 'product'}, secure=True)
+    assert secure['X-Cache'] == 'MISS'
+    assert secure['ETag'] != first['ETag']
+    assert secure.data['next'].startswith('https://')
+
+
+def test_catalog_conditional_get(
+        client,
+        product1,
+        django_assert_num_queries
+):
+    """Совпавший ETag каталога дает 304 без запросов к БД."""
+    url = reverse('products-detail', kwargs={'slug': product1.slug})
+    etag = client.get(url)['ETag']
+
+    with django_assert_num_queries(0):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == NOT_MODIFIED
+
+
+def test_compiled_serializer_is_byte_identical(products, subcategory):
+    """Собранный сериализатор отдает те же байты, что и DRF."""
+    subcategory.image = 'subcategories/пример фото.png'
+    subcategory.save()
+    products[0].image_small = 'products/small/a b.jpg'
+    products[0].price = '99.90'
+    products[0].save()
+
+    queryset = Product.objects.order_by('id')
+    compiled = CompiledSerializer(ProductSerializer)
+    rows = list(compiled.values(queryset))
+    request = Request(APIRequestFactory().get('/api/products/'))
+    renderer = JSONRenderer()
+
+    for context_request in (None, request):
+        expected = ProductSerializer(
+            queryset.select_related('subcategory__category'),
+            many=True,
+            context={'request': context_request}
+        ).data
+        assert renderer.render(
+            compiled.serialize_many(rows, context_request)
+        ) == renderer.render(expected)
+
+
+def test_product_list_uses_compiled_serializer(client, products):
+    """Список товаров совпадает с выводом ProductSerializer."""
+    response = client.get(reverse('products-list'))
+    expected = ProductSerializer(
+        Product.objects.select_related(
+            'subcategory__category'
+        ).order_by('id')[:10],
+        many=True,
+        context={'request': response.wsgi_request}
+    ).data
+
+    assert response.status_code == OK
+    assert response.data['results'] == expected
+
+
+def test_fast_json_renderer_matches_drf(client, products):
+    """FastJSONRenderer отдает те же байты, что и JSONRenderer."""
+    payload = {
+        'price': '0.00',
+        'total_price': Decimal('10.50'),
+        'updated_at': datetime.datetime(
+            2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc
+        ),
+        'date': datetime.date(2024, 1, 2),
+        'name': 'Товар \u2028 \u2029',
+        'big': 2 ** 70,
+        'items': ({'id': 1}, [None, True, 1.5]),
+    }
+    fast = FastJSONRenderer()
+    assert fast.render(payload) == JSONRenderer().render(payload)
+    assert fast.render(
+        payload,
+        'application/json; indent=4'
+    ) == JSONRenderer().render(payload, 'application/json; indent=4')
+
+    response = client.get(reverse('products-list'))
+    assert response.content == JSONRenderer().render(response.data)
+
+    for value in (float('nan'), float('inf'), -float('inf')):
+        for renderer in (fast, JSONRenderer()):
+            with pytest.raises(ValueError, match='Out of range float'):
+                renderer.render({'items': [{'rating': value}]})
+
+
+def test_fast_json_parser_matches_drf():
+    """FastJSONParser разбирает и отклоняет тела как JSONParser."""
+    body = '{"quantity": 2, "name": "Товар", "big": 1180591620717411303424}'
+    assert FastJSONParser().parse(
+        io.BytesIO(body.encode())
+    ) == JSONParser().parse(io.BytesIO(body.encode()))
+
+    for body in (b'{"quantity": NaN}', b'{"quantity": '):
+        errors = []
+        for parser in (FastJSONParser(), JSONParser()):
+            with pytest.raises(ParseError) as error:
+                parser.parse(io.BytesIO(body))
+            errors.append(str(error.value.detail))
+        assert errors[0] == errors[1]
+
+
+def test_product_list_sparse_fields(client, products, subcategory):
+    """?fields= и ?expand= сужают ответ и запрос к БД."""
+    url = reverse('products-list')
+    fields = 'id,name,slug,price,image_small'
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, {'fields': fields})
+    assert response.status_code == OK
+    assert list(response.data['results'][0]) == fields.split(',')
+    assert 'JOIN' not in queries[-1]['sql']
+
+    response = client.get(url, {'fields': 'id,subcategory'})
+    assert response.data['results'][0] == {
+        'id': products[0].id,
+        'subcategory': subcategory.id,
+    }
+
+    response = client.get(
+        url,
+        {'fields': 'id', 'expand': 'subcategory.category'}
+    )
+    nested = response.data['results'][0]['subcategory']
+    assert nested['slug'] == subcategory.slug
+    assert nested['category']['id'] == subcategory.category_id
+
+    response = client.get(
+        url,
+        {'fields': 'name', 'pagination': 'cursor', 'ordering': 'price'}
+    )
+    assert response.status_code == OK
+    assert response.data['next'] is not None
+
+    response = client.get(url, {'fields': 'id,secret', 'expand': 'price'})
+    assert response.status_code == BAD_REQUEST
+    assert set(response.data) == {'fields', 'expand'}
+
+
+def test_product_lookup(client, products, django_assert_num_queries):
+    """Товары по слагам одним запросом и в порядке запроса."""
+    url = reverse('products-lookup')
+    slugs = ['product-7', 'missing', 'product-2', 'product-7']
+    with django_assert_num_queries(1):
+        response = client.post(url, {'slugs': slugs}, format='json')
+
+    assert response.status_code == OK
+    assert [item['slug'] for item in response.data['results']] == [
+        'product-7',
+        'product-2',
+    ]
+    assert response.data['results'][0] == ProductSerializer(
+        products[7],
+        context={'request': response.wsgi_request}
+    ).data
+    assert response.data['not_found'] == ['missing']
+
+    response = client.post(
+        f'{url}?fields=slug,price',
+        {'slugs': ['product-1']},
+        format='json'
+    )
+    assert response.data['results'] == [
+        {'slug': 'product-1', 'price': '10.00'}
+    ]
+
+    with override_settings(PRODUCT_LOOKUP_LIMIT=2):
+        response = client.post(url, {'slugs': slugs[:3]}, format='json')
+    assert response.status_code == BAD_REQUEST
+
+
+@pytest.fixture
+def catalog(subcategory):
+    """Товары в двух категориях с разными ценами."""
+    other = SubCategory.objects.create(
+        name='Other SubCategory',
+        slug='other-subcategory',
+        category=Category.objects.create(name='Other', slug='other')
+    )
+    return Product.objects.bulk_create(
+        Product(
+            name=f'Product {price}',
+            slug=f'product-{price}',
+            subcategory=subcategory if price < 10000 else other,
+            price=price
+        )
+        for price in (500, 999, 1000, 4000, 20000, 60000)
+    )
+
+
+def test_product_filters(client, catalog, subcategory):
+    """Диапазон цены и несколько категорий и подкатегорий."""
+    url = reverse('products-list')
+
+    def slugs(params):
+        response = client.get(
+            url,
+            {**params, 'pagination': 'cursor', 'ordering': 'price'}
+        )
+        assert response.status_code == OK
+        return [item['slug'] for item in response.data['results']]
+
+    assert slugs({'price_min': 999, 'price_max': 4000}) == [
+        'product-999', 'product-1000', 'product-4000'
+    ]
+    assert slugs({'category': 'other,missing'}) == [
+        'product-20000', 'product-60000'
+    ]
+    assert len(slugs({'category': f'other,{subcategory.category.slug}'})) == 6
+    assert slugs({
+        'subcategory': subcategory.slug,
+        'price_min': 1000
+    }) == ['product-1000', 'product-4000']
+    assert len(slugs({'subcategory__slug': subcategory.slug})) == 4
+
+
+def test_product_facets(
+        client,
+        catalog,
+        subcategory,
+        django_assert_num_queries
+):
+    """Фасеты одним запросом и из кэша по набору фильтров."""
+    url = reverse('products-facets')
+    get_category_tree()
+    with django_assert_num_queries(1):
+        response = client.get(url, {'price_max': 50000})
+
+    assert response.status_code == OK
+    assert response.data['categories'] == [
+        {'slug': 'other', 'name': 'Other', 'count': 1},
+        {
+            'slug': subcategory.category.slug,
+            'name': subcategory.category.name,
+            'count': 4,
+        },
+    ]
+    assert [
+        (item['slug'], item['count'])
+        for item in response.data['subcategories']
+    ] == [('other-subcategory', 1), (subcategory.slug, 4)]
+    assert response.data['price'] == [
+        {'from': 0, 'to': 1000, 'count': 2},
+        {'from': 1000, 'to': 5000, 'count': 2},
+        {'from': 5000, 'to': 10000, 'count': 0},
+        {'from': 10000, 'to': 50000, 'count': 1},
+        {'from': 50000, 'to': None, 'count': 0},
+    ]
+
+    with django_assert_num_queries(0):
+        cached = client.get(url, {'price_max': 50000})
+    assert cached['X-Cache'] == 'HIT'
+    assert client.get(url)['X-Cache'] == 'MISS'
+
+
+def test_product_export(client, catalog, subcategory):
+    """Выгрузка каталога потоком в NDJSON и CSV с фильтрами."""
+    url = reverse('products-export')
+    response = client.get(url, {'format': 'ndjson', 'price_max': 1000})
+    assert response.status_code == OK
+    assert response.streaming
+    assert response['Content-Type'] == 'application/x-ndjson'
+    rows = [
+        json.loads(line)
+        for line in b''.join(response.streaming_content).splitlines()
+    ]
+    assert rows == [
+        {
+            'id': product.id,
+            'name': product.name,
+            'slug': product.slug,
+            'price': f'{product.price}.00',
+            'category': subcategory.category.slug,
+            'subcategory': subcategory.slug,
+            'image_small': None,
+            'image_medium': None,
+            'image_large': None,
+        }
+        for product in catalog[:3]
+    ]
+
+    response = client.get(url, {'format': 'csv'})
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    rows = list(csv.DictReader(io.StringIO(
+        b''.join(response.streaming_content).decode()
+    )))
+    assert [row['slug'] for row in rows] == [
+        product.slug for product in catalog
+    ]
+    assert rows[-1]['category'] == 'other'
+    assert rows[0]['image_small'] == ''
+
+    assert client.get(url, {'format': 'xml'}).status_code == NOT_FOUND
+
+
+def test_import_catalog(tmp_path, cart, cart_product, product1, subcategory):
+    """Загрузка CSV: обновление по слагу, новые слаги и категории."""
+    source = tmp_path / 'catalog.csv'
+    with open(source, 'w', newline='') as stream:
+        writer = csv.writer(stream)
+        writer.writerow((
+            'slug', 'name', 'price', 'category', 'subcategory',
+            'category_name', 'subcategory_name'
+        ))
+        writer.writerows((
+            (product1.slug, 'Renamed', '150.00', '', subcategory.slug, '', ''),
+            ('', 'Test Product 1', '10', '', subcategory.slug, '', ''),
+            ('', 'Test Product 1', '20', '', subcategory.slug, '', ''),
+            ('phone', 'Phone', '99.90', 'gadgets', 'phones', 'Гаджеты',
+             'Телефоны'),
+            ('broken', 'Broken', 'free', '', subcategory.slug, '', ''),
+            ('lost', 'Lost', '1', '', 'missing', '', ''),
+        ))
+
+    with pytest.raises(CommandError, match='2'):
+        call_command(
+            'import_catalog',
+            str(source),
+            batch_size=2,
+            stdout=io.StringIO(),
+            stderr=io.StringIO()
+        )
+
+    product1.refresh_from_db()
+    assert (product1.name, product1.price) == ('Renamed', 150)
+    assert set(Product.objects.filter(
+        name='Test Product 1'
+    ).values_list('slug', flat=True)) == {'test-product-1', 'test-product-1-2'}
+    phone = Product.objects.select_related('subcategory__category').get(
+        slug='phone'
+    )
+    assert phone.subcategory.category.name == 'Гаджеты'
+    assert not Product.objects.filter(slug__in=('broken', 'lost')).exists()
+
+    cart.refresh_from_db()
+    assert cart.total_price == 2 * 150
+    assert not Cart.objects.with_drift().exists()
+
+
+def test_export_import_round_trip(client, tmp_path, product1, product2):
+    """Выгрузка загружается обратно без изменений, включая изображения."""
+    product1.image_small = 'products/small/red phone.jpg'
+    product1.image_large = 'products/large/red.jpg'
+    product1.save()
+    for format in ('csv', 'ndjson'):
+        response = client.get(reverse('products-export'), {'format': format})
+        source = tmp_path / f'catalog.{format}'
+        source.write_bytes(b''.join(response.streaming_content))
+        call_command('import_catalog', str(source), stdout=io.StringIO())
+
+        product1.refresh_from_db()
+        assert product1.image_small.name == 'products/small/red phone.jpg'
+        assert product1.image_large.name == 'products/large/red.jpg'
+        assert not product1.image_medium
+        response = client.get(
+            reverse('products-detail', kwargs={'slug': product1.slug})
+        )
+        assert response.data['image_small'].endswith(
+            f'{settings.MEDIA_URL}products/small/red%20phone.jpg'
+        )
+    assert Product.objects.count() == 2
+
+    source = tmp_path / 'foreign.jsonl'
+    source.write_text(json.dumps({
+        'slug': product2.slug,
+        'name': product2.name,
+        'price': '1',
+        'subcategory': product2.subcategory.slug,
+        'image_small': 'https://example.com/a.jpg',
+    }))
+    with pytest.raises(CommandError):
+        call_command(
+            'import_catalog',
+            str(source),
+            stdout=io.StringIO(),
+            stderr=io.StringIO()
+        )
+    product2.refresh_from_db()
+    assert not product2.image_small
+
+
+def test_import_catalog_jsonl_errors(tmp_path, subcategory):
+    """Неверные строки JSONL пропускаются с номером строки файла."""
+    source = tmp_path / 'catalog.jsonl'
+    source.write_text('\n'.join((
+        json.dumps({'name': 'First', 'price': 1,
+                    'subcategory': subcategory.slug}),
+        '{"name": "Broken",',
+        '',
+        '["not", "an", "object"]',
+        json.dumps({'name': 7, 'price': '2',
+                    'subcategory': subcategory.slug}),
+    )))
+    stderr = io.StringIO()
+
+    with pytest.raises(CommandError, match='2'):
+        call_command(
+            'import_catalog',
+            str(source),
+            batch_size=1,
+            stdout=io.StringIO(),
+            stderr=stderr
+        )
+
+    errors = stderr.getvalue().splitlines()
+    assert [error.split(':')[0] for error in errors] == [
+        'Строка 2', 'Строка 4'
+    ]
+    assert set(Product.objects.values_list('name', flat=True)) == {
+        'First', '7'
+    }
+
+
+def test_generate_catalog(product1, subcategory):
+    """Генератор детерминирован seed и удаляет только свои данные."""
+    def generate(*args):
+        call_command(
+            'generate_catalog',
+            '--categories=2',
+            '--subcategories=3',
+            '--products=50',
+            '--users=10',
+            '--carts=5',
+            *args,
+            stdout=io.StringIO()
+        )
+        return list(Product.objects.filter(
+            slug__startswith=GENERATED_SLUG_PREFIX
+        ).order_by('slug').values_list('slug', 'name', 'price'))
+
+    hoodie = Product.objects.create(
+        name='Худи',
+        slug='gen-z-hoodie',
+        price=100,
+        subcategory=subcategory
+    )
+    alex = User.objects.create_user(username='gen-alex', email='a@test.test')
+
+    first = generate()
+    assert len(first) == 50
+    assert SubCategory.objects.filter(
+        slug__startswith=GENERATED_SLUG_PREFIX
+    ).count() == 6
+    assert Cart.objects.filter(
+        user__username__startswith=GENERATED_USERNAME_PREFIX
+    ).count() == 5
+    assert CartProduct.objects.exists()
+    assert not Cart.objects.with_drift().exists()
+    assert not Product.objects.filter(search_vector__isnull=True).exists()
+
+    user = User.objects.filter(
+        username__startswith=GENERATED_USERNAME_PREFIX
+    ).first()
+    token = Token.objects.create(user=user)
+    token_client = APIClient()
+    token_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert token_client.get(reverse('cart-list')).status_code == OK
+    refresh = RoleRefreshToken.for_user(user)
+
+    with pytest.raises(CommandError):
+        generate()
+    assert generate('--clear') == first
+    assert token_client.get(reverse('cart-list')).status_code == UNAUTHORIZED
+    assert is_token_revoked(refresh)
+
+    call_command(
+        'generate_catalog',
+        '--clear',
+        *(f'--{name}=0' for name in (
+            'categories', 'products', 'users', 'carts'
+        )),
+        stdout=io.StringIO()
+    )
+    assert set(Product.objects.all()) == {product1, hoodie}
+    assert list(User.objects.filter(username__startswith='gen')) == [alex]
+
+    product1.slug = f'{GENERATED_SLUG_PREFIX}{product1.slug}'
+    with pytest.raises(ValidationError, match='зарезервированы'):
+        product1.full_clean()
+
+
+def test_benchmark_endpoints(tmp_path, owner, product1):
+    """Бенчмарк эндпоинтов сохраняет базовую линию и ловит регрессию."""
+    baseline = tmp_path / 'endpoints.json'
+
+    def benchmark(*args):
+        call_command(
+            'benchmark_endpoints',
+            '--requests=2',
+            '--warmup=0',
+            '--no-cache',
+            f'--baseline={baseline}',
+            *args,
+            stdout=io.StringIO()
+        )
+
+    benchmark('--save-baseline')
+    scenarios = json.loads(baseline.read_text())['scenarios']
+    assert scenarios['products-detail']['queries'] >= 1
+    assert scenarios['products-detail']['bytes'] > 0
+    assert list(User.objects.all()) == [owner]
+
+    scenarios['products-detail']['queries'] = 0
+    scenarios['categories-list']['bytes'] = 1
+    baseline.write_text(json.dumps({'scenarios': scenarios}))
+    with pytest.raises(
+        CommandError,
+        match=r'(?s)categories-list: ответ.*products-detail: запросов'
+    ):
+        benchmark()
+
+
+def test_benchmarks_on_generated_catalog(product1):
+    """Бенчмарки с --products работают на сгенерированном каталоге."""
+    for command in ('benchmark_serializers', 'benchmark_renderers'):
+        stdout = io.StringIO()
+        call_command(
+            command,
+            '5',
+            '--products=20',
+            '--repeat=1',
+            stdout=stdout
+        )
+
+        assert 'Товаров в каталоге: 21' in stdout.getvalue()
+        assert list(Product.objects.all()) == [product1]
+        assert not Category.objects.filter(
+            slug__startswith=GENERATED_SLUG_PREFIX
+        ).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_connections(product1):
+    """Бенчмарк соединений проходит все режимы и возвращает настройки."""
+    options = connection.settings_dict['OPTIONS']
+    stdout = io.StringIO()
+    call_command(
+        'benchmark_connections',
+        '--requests=2',
+        '--warmup=0',
+        stdout=stdout
+    )
+    rows = stdout.getvalue().splitlines()[1:]
+    assert [row[:18].strip() for row in rows] == [
+        'new connection', 'persistent', 'pool', 'pool + prepared'
+    ]
+    assert rows[0].split()[-1] == '2'
+    assert connection.settings_dict['OPTIONS'] is options
+    assert Product.objects.filter(id=product1.id).exists()
+
+
+def test_server_timing(client, products, caplog, monkeypatch):
+    """Server-Timing и строка лога для выбранных запросов."""
+    monkeypatch.setattr(logging.getLogger('api.timing'), 'propagate', True)
+    url = reverse('products-list')
+    with override_settings(SERVER_TIMING={'SAMPLE_RATE': 1}):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+    assert response.status_code == OK
+    timing = dict(
+        metric.split(';', 1)
+        for metric in response['Server-Timing'].split(', ')
+    )
+    assert set(timing) == {'db', 'app', 'serialize', 'render', 'total'}
+    assert f'desc="{len(queries)} queries"' in timing['db']
+    [record] = [
+        record for record in caplog.records if record.name == 'api.timing'
+    ]
+    assert record.queries == len(queries)
+    assert record.serialize > 0
+    assert f'path={url} status=200' in record.getMessage()
+
+    with override_settings(SERVER_TIMING={'SAMPLE_RATE': 0}):
+        assert 'Server-Timing' not in client.get(url)
+
+
+def test_middleware_share_query_wrapper(client, products, monkeypatch):
+    """Метрики, Server-Timing и поиск N+1 - одна обертка запросов к БД."""
+    wrapped = []
+
+    def wrap_queries(wrapper):
+        wrapped.append(wrapper)
+        return original(wrapper)
+
+    original = timing.wrap_queries
+    monkeypatch.setattr(timing, 'wrap_queries', wrap_queries)
+    with override_settings(SERVER_TIMING={'SAMPLE_RATE': 1}):
+        response = client.get(reverse('products-list'))
+
+    assert response.status_code == OK
+    assert len(wrapped) == 1
+
+
+def test_replica_routing(client, owner_client, product1, monkeypatch):
+    """Каталог - с реплик, после записи клиента и каталога - с основной."""
+    routed = []
+    db_for_read = ReplicaRouter.db_for_read
+
+    def spy(self, model, **hints):
+        routed.append((model._meta.label_lower, db_for_read(
+            self,
+            model,
+            **hints
+        )))
+        return None
+
+    def aliases():
+        result = {alias for model, alias in routed}
+        routed.clear()
+        return result
+
+    monkeypatch.setattr(ReplicaRouter, 'db_for_read', spy)
+    url = reverse('products-detail', kwargs={'slug': product1.slug})
+    replicas = {
+        **settings.DATABASE_REPLICAS,
+        'ALIASES': ['replica_0'],
+        'STICKY_SECONDS': 60,
+    }
+    with override_settings(DATABASE_REPLICAS=replicas):
+        cache.delete(CHANGED_KEY)
+        assert client.get(url).status_code == OK
+        assert ('products.product', 'replica_0') in routed
+        routed.clear()
+
+        response = owner_client.post(
+            reverse('products-to-cart', kwargs={'slug': product1.slug}),
+            {'quantity': 1}
+        )
+        assert response.cookies[replicas['COOKIE']]['max-age'] == 60
+        assert aliases() <= {None}
+        cache.clear()
+        owner_client.get(url)
+        assert aliases() == {None}
+        owner_client.get(reverse('cart-list'))
+        assert aliases() == {None}
+
+        cache.clear()
+        client.get(url)
+        assert aliases() == {'replica_0'}
+        product1.save()
+        client.get(url)
+        assert aliases() == {None}
+
+        cache.clear()
+        response = client.post(
+            reverse('products-lookup'),
+            {'slugs': [product1.slug]},
+            format='json'
+        )
+        assert replicas['COOKIE'] not in response.cookies
+        assert aliases() == {'replica_0'}
+        response = client.get(reverse('products-export'), {'format': 'csv'})
+        assert aliases() == set()
+        b''.join(response.streaming_content)
+        assert aliases() == {'replica_0'}
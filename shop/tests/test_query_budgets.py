@@ -0,0 +1,290 @@
+import pytest
+from django.urls import reverse
+from rest_framework.status import (
+    HTTP_200_OK as OK,
+    HTTP_201_CREATED as CREATED,
+    HTTP_204_NO_CONTENT as NO_CONTENT,
+    HTTP_302_FOUND as FOUND,
+)
+
+from api.authentication import RoleRefreshToken
+from api.queries import NPlusOneError, QueryDetector, fingerprint
+from products.models import Category, CartProduct, Product, SubCategory
+
+
+pytestmark = pytest.mark.django_db
+
+# Запросов к БД на эндпоинт при холодном кэше; растут - значит,
+# появился лишний запрос (или N+1).
+QUERY_BUDGETS = {
+    'users-list': 5,
+    'jwt-logout': 2,
+    'categories-list': 2,
+    'categories-detail': 0,
+    'categories-subcategory-products': 2,
+    'products-list': 2,
+    'products-search': 3,
+    'products-filter': 3,
+    'products-detail': 1,
+    'products-lookup': 1,
+    'products-facets': 1,
+    'products-export': 1,
+    'products-to-cart': 3,
+    'product-redirect': 1,
+    'cart-list': 3,
+    'cart-batch': 9,
+    'cart-detail': 4,
+    'cart-clear': 4,
+    'admin-products': 7,
+}
+
+
+@pytest.fixture
+def budget_request(query_budget):
+    """Запрос к API в рамках бюджета эндпоинта из QUERY_BUDGETS."""
+    def request(client, name, method, url, expected=OK, **kwargs):
+        with query_budget(QUERY_BUDGETS[name], name):
+            response = getattr(client, method)(url, **kwargs)
+        assert response.status_code == expected, response.content
+        return response
+    return request
+
+
+@pytest.fixture
+def catalog_tree():
+    """Три категории по три подкатегории и по три товара в каждой."""
+    products = []
+    for number in range(3):
+        category = Category.objects.create(
+            name=f'Budget Category {number}',
+            slug=f'budget-category-{number}'
+        )
+        for sub_number in range(3):
+            subcategory = SubCategory.objects.create(
+                name=f'Budget SubCategory {number}-{sub_number}',
+                slug=f'budget-subcategory-{number}-{sub_number}',
+                category=category
+            )
+            products += Product.objects.bulk_create(
+                Product(
+                    name=f'Budget Product {number}-{sub_number}-{item}',
+                    slug=f'budget-product-{number}-{sub_number}-{item}',
+                    subcategory=subcategory,
+                    price=100 * (item + 1)
+                )
+                for item in range(3)
+            )
+    return products
+
+
+def test_fingerprint():
+    """Значения не влияют на форму запроса."""
+    assert fingerprint(
+        'SELECT * FROM "t" WHERE "id" = %s AND "slug" IN (%s, %s, %s)'
+    ) == fingerprint(
+        "SELECT * FROM \"t\" WHERE \"id\" = 7 AND \"slug\" IN ('a', 'b')"
+    ) == 'SELECT * FROM "t" WHERE "id" = ? AND "slug" IN (...)'
+
+    detector = QueryDetector()
+    for _ in range(3):
+        detector(lambda *args: None, 'SELECT %s', (1,), False, {})
+    assert detector.repeated(3) == [('SELECT ?', 3)]
+    with pytest.raises(NPlusOneError, match='3 раз SELECT'):
+        detector.check('test', 3)
+
+
+def test_user_query_budgets(client, owner, budget_request):
+    """Регистрация и выход из JWT-сессии."""
+    budget_request(
+        client,
+        'users-list',
+        'post',
+        reverse('users-list'),
+        CREATED,
+        data={
+            'username': 'budget_user',
+            'email': 'budget@test.test',
+            'password': 'Budget-password-1',
+        },
+        format='json'
+    )
+    budget_request(
+        client,
+        'jwt-logout',
+        'post',
+        reverse('jwt-logout'),
+        NO_CONTENT,
+        data={'refresh': str(RoleRefreshToken.for_user(owner))},
+        format='json'
+    )
+
+
+def test_category_query_budgets(client, catalog_tree, budget_request):
+    """Категории, подкатегории и редирект на товар."""
+    product = catalog_tree[-1]
+    subcategory = product.subcategory
+    category = subcategory.category
+    budget_request(
+        client,
+        'categories-list',
+        'get',
+        reverse('categories-list')
+    )
+    budget_request(
+        client,
+        'categories-detail',
+        'get',
+        reverse('categories-detail', kwargs={'slug': category.slug})
+    )
+    budget_request(
+        client,
+        'categories-subcategory-products',
+        'get',
+        reverse('categories-subcategory-products', kwargs={
+            'slug': category.slug,
+            'subcategory_slug': subcategory.slug,
+        })
+    )
+    budget_request(
+        client,
+        'product-redirect',
+        'get',
+        reverse('product-redirect', kwargs={
+            'category_slug': category.slug,
+            'subcategory_slug': subcategory.slug,
+            'product_slug': product.slug,
+        }),
+        FOUND
+    )
+
+
+def test_product_query_budgets(
+        client,
+        owner_client,
+        catalog_tree,
+        query_budget,
+        budget_request
+):
+    """Список, поиск, фильтры, карточка, фасеты, выгрузка и корзина."""
+    products = reverse('products-list')
+    budget_request(client, 'products-list', 'get', products)
+    budget_request(
+        client,
+        'products-search',
+        'get',
+        products,
+        data={'search': 'Budget'}
+    )
+    budget_request(
+        client,
+        'products-filter',
+        'get',
+        products,
+        data={
+            'category': 'budget-category-0,budget-category-1',
+            'price_min': 200,
+            'pagination': 'cursor',
+            'ordering': 'price',
+        }
+    )
+    product = catalog_tree[0]
+    budget_request(
+        client,
+        'products-detail',
+        'get',
+        reverse('products-detail', kwargs={'slug': product.slug})
+    )
+    budget_request(
+        client,
+        'products-lookup',
+        'post',
+        reverse('products-lookup'),
+        data={'slugs': [product.slug for product in catalog_tree]},
+        format='json'
+    )
+    budget_request(
+        client,
+        'products-facets',
+        'get',
+        reverse('products-facets')
+    )
+    with query_budget(QUERY_BUDGETS['products-export'], 'products-export'):
+        response = client.get(
+            reverse('products-export'),
+            {'format': 'ndjson'}
+        )
+        rows = b''.join(response.streaming_content).splitlines()
+    assert response.status_code == OK
+    assert len(rows) == len(catalog_tree)
+    budget_request(
+        owner_client,
+        'products-to-cart',
+        'post',
+        reverse('products-to-cart', kwargs={'slug': product.slug}),
+        CREATED,
+        data={'quantity': 2},
+        format='json'
+    )
+
+
+def test_cart_query_budgets(owner, owner_client, catalog_tree, budget_request):
+    """Корзина из товаров разных подкатегорий и категорий."""
+    for product in catalog_tree[::3]:
+        CartProduct.objects.add_to_cart(owner.id, product.slug, 1)
+    budget_request(owner_client, 'cart-list', 'get', reverse('cart-list'))
+    budget_request(
+        owner_client,
+        'cart-batch',
+        'post',
+        reverse('cart-batch'),
+        data={'operations': [
+            {'op': 'add', 'product': product.slug, 'quantity': 2}
+            for product in catalog_tree[1::3]
+        ]},
+        format='json'
+    )
+    item = CartProduct.objects.filter(cart__user=owner).first()
+    budget_request(
+        owner_client,
+        'cart-detail',
+        'put',
+        reverse('cart-detail', kwargs={'pk': item.pk}),
+        data={'quantity': 5},
+        format='json'
+    )
+    budget_request(
+        owner_client,
+        'cart-detail',
+        'delete',
+        reverse('cart-detail', kwargs={'pk': item.pk}),
+        NO_CONTENT
+    )
+    budget_request(
+        owner_client,
+        'cart-clear',
+        'delete',
+        reverse('cart-clear'),
+        NO_CONTENT
+    )
+
+
+def test_product_admin_query_budget(
+        client,
+        django_user_model,
+        catalog_tree,
+        budget_request
+):
+    """Список товаров в админке без запроса категории на строку."""
+    admin = django_user_model.objects.create_superuser(
+        username='budget_admin',
+        email='admin@test.test',
+        password='admin-pass-12345'
+    )
+    client.force_login(admin)
+    response = budget_request(
+        client,
+        'admin-products',
+        'get',
+        reverse('admin:products_product_changelist')
+    )
+    assert b'Budget Category 2' in response.content
@@ -0,0 +1,326 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router, transaction
+from prometheus_client import Counter
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from users.models import JWTRevocation
+
+
+User = get_user_model()
+
+TOKEN_KEY = 'users:token:{}'
+GENERATION_KEY = 'users:token:generation'
+# Поля, которые читают аутентификация и права доступа, в порядке
+# полей модели (его ждет from_db). Остальные (пароль, email и т.д.)
+# в кэш не попадают и догружаются из БД при обращении.
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {
+        'id',
+        'username',
+        'role',
+        'is_active',
+        'is_staff',
+        'is_superuser',
+    }
+)
+
+AUTH_CACHE_REQUESTS = Counter(
+    'shop_auth_token_cache_requests',
+    'Поиск пользователя по токену: local - LRU процесса, '
+    'shared - общий кэш, miss - запрос к БД.',
+    ('result',)
+)
+
+
+class LocalLRU:
+    """Ограниченный LRU-кэш процесса с временем жизни записей."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_tokens = LocalLRU(
+    settings.AUTH_TOKEN_CACHE['SIZE'],
+    settings.AUTH_TOKEN_CACHE['TTL']
+)
+
+
+def get_token_cache():
+    """Бэкенд общего кэша токенов из настроек AUTH_TOKEN_CACHE."""
+    return caches[settings.AUTH_TOKEN_CACHE['ALIAS']]
+
+
+def get_token_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_generation():
+    """
+    Поколение кэша токенов из общего кэша.
+
+    Меняется при каждой инвалидации, после чего записи
+    LRU процессов перечитываются из общего кэша.
+    """
+    token_cache = get_token_cache()
+    generation = token_cache.get(GENERATION_KEY)
+    if generation is None:
+        token_cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = token_cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    token_cache = get_token_cache()
+    try:
+        token_cache.incr(GENERATION_KEY)
+    except ValueError:
+        token_cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def get_cached_token(key):
+    """
+    Пользователь и токен из кэша или None.
+
+    Сначала проверяется LRU процесса, затем общий кэш.
+    Объекты собираются заново на каждый запрос,
+    поэтому запросы не делят один экземпляр пользователя.
+    """
+    digest = get_token_digest(key)
+    generation = get_generation()
+    entry = _tokens.get(digest)
+    if entry is not None and entry[0] == generation:
+        payload = entry[1]
+        AUTH_CACHE_REQUESTS.labels('local').inc()
+    else:
+        payload = get_token_cache().get(TOKEN_KEY.format(digest))
+        if payload is None:
+            AUTH_CACHE_REQUESTS.labels('miss').inc()
+            return None
+        AUTH_CACHE_REQUESTS.labels('shared').inc()
+        _tokens.set(digest, (generation, payload))
+
+    user_values, created = payload
+    user = User.from_db(router.db_for_read(User), USER_FIELDS, user_values)
+    token = Token.from_db(
+        router.db_for_read(Token),
+        ('key', 'user_id', 'created'),
+        (key, user.pk, created)
+    )
+    token.user = user
+    return user, token
+
+
+def cache_token(token, generation):
+    """
+    Кладет пользователя токена в общий кэш и LRU процесса.
+
+    generation - поколение, прочитанное до запроса к БД:
+    если его сменила инвалидация, данные могли устареть
+    и не кэшируются.
+    """
+    if get_generation() != generation:
+        return
+    payload = (
+        tuple(getattr(token.user, field) for field in USER_FIELDS),
+        token.created
+    )
+    digest = get_token_digest(token.key)
+    get_token_cache().set(
+        TOKEN_KEY.format(digest),
+        payload,
+        settings.AUTH_TOKEN_CACHE['TTL']
+    )
+    _tokens.set(digest, (generation, payload))
+
+
+def invalidate_tokens(keys):
+    """
+    Удаляет токены из общего кэша и меняет поколение.
+
+    Поколение меняется сразу и еще раз после коммита,
+    чтобы другой процесс не закэшировал данные,
+    прочитанные до коммита транзакции.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    get_token_cache().delete_many(
+        [TOKEN_KEY.format(get_token_digest(key)) for key in keys]
+    )
+    bump_generation()
+    transaction.on_commit(bump_generation)
+
+
+SESSION = 'session'
+USER = 'user'
+USERS = 'users'
+# Пользователей в одной записи пакетного отзыва.
+REVOKE_BATCH_SIZE = 10000
+# Запас чтения назад, с. Отзыв, записанный в транзакции, виден
+# другим процессам после коммита, а время у него - время записи.
+SYNC_OVERLAP = 60
+
+
+class RevocationList:
+    """
+    Список отзыва JWT в памяти процесса.
+
+    Отзывы хранятся в таблице JWTRevocation, пока могут быть
+    живы отозванные токены: истекшие удаляются при каждом
+    отзыве. Процесс не чаще раза в refresh_interval секунд
+    догружает отзывы, сделанные после прошлой загрузки
+    (с запасом SYNC_OVERLAP), первый раз - все действующие.
+    Так чтение не растет с числом отзывов за все время,
+    а проверка токена выполняется по словарям в памяти,
+    без запросов к БД.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._sessions = {}
+        self._users = {}
+        self._loaded_at = None
+        self._synced_at = None
+        self._lock = Lock()
+
+    def revoke(self, kind, value, lifetime):
+        """
+        Добавляет отзыв сессии (SESSION), пользователя (USER)
+        или кортежа пользователей (USERS).
+        """
+        now = time.time()
+        JWTRevocation.objects.filter(expires_at__lte=now).delete()
+        revocation = JWTRevocation.objects.create(
+            kind=kind,
+            value=value,
+            revoked_at=now,
+            expires_at=now + lifetime
+        )
+        with self._lock:
+            self._add(kind, value, now, revocation.expires_at)
+
+    def is_revoked(self, session, user_id, issued_at):
+        """Отозвана ли сессия или все токены пользователя до issued_at."""
+        self.sync()
+        revoked = self._users.get(str(user_id))
+        return (
+            session in self._sessions
+            or revoked is not None and issued_at <= revoked[0]
+        )
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if (
+            not force
+            and self._synced_at is not None
+            and now - self._synced_at < self.refresh_interval
+        ):
+            return
+
+        with self._lock:
+            loaded_at = time.time()
+            revocations = JWTRevocation.objects.filter(
+                expires_at__gt=loaded_at
+            )
+            if self._loaded_at is not None:
+                revocations = revocations.filter(
+                    revoked_at__gte=self._loaded_at - SYNC_OVERLAP
+                )
+            for kind, value, revoked_at, expires_at in (
+                revocations.values_list(
+                    'kind',
+                    'value',
+                    'revoked_at',
+                    'expires_at'
+                )
+            ):
+                self._add(kind, value, revoked_at, expires_at)
+            self._loaded_at = loaded_at
+            self._synced_at = now
+            self._prune()
+
+    def _add(self, kind, value, revoked_at, expires_at):
+        if kind == SESSION:
+            self._sessions[value] = expires_at
+            return
+        for user_id in value if kind == USERS else (value,):
+            previous = self._users.get(str(user_id))
+            if previous is None or previous[0] < revoked_at:
+                self._users[str(user_id)] = (revoked_at, expires_at)
+
+    def _prune(self):
+        now = time.time()
+        self._sessions = {
+            session: expires_at
+            for session, expires_at in self._sessions.items()
+            if expires_at > now
+        }
+        self._users = {
+            user_id: revoked
+            for user_id, revoked in self._users.items()
+            if revoked[1] > now
+        }
+
+
+revoked_tokens = RevocationList(settings.JWT_REVOCATION['REFRESH'])
+
+
+def get_revocation_lifetime():
+    """Сколько хранить отзыв: пока живы выданные refresh-токены."""
+    return int(jwt_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+
+def revoke_session(session):
+    """Отзывает сессию JWT: refresh-токен и выданные по нему access."""
+    revoked_tokens.revoke(SESSION, session, get_revocation_lifetime())
+
+
+def revoke_user(user_id):
+    """Отзывает все JWT пользователя, выданные до текущего момента."""
+    revoked_tokens.revoke(USER, user_id, get_revocation_lifetime())
+
+
+def revoke_users(user_ids):
+    """Отзывает JWT пользователей пакетами по REVOKE_BATCH_SIZE."""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), REVOKE_BATCH_SIZE):
+        revoked_tokens.revoke(
+            USERS,
+            tuple(user_ids[start:start + REVOKE_BATCH_SIZE]),
+            get_revocation_lifetime()
+        )
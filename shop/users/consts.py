@@ -9,10 +9,39 @@ ERRORS = {
     },
     'quantity': {
         'less_than_zero': 'Количество товаров не может быть отрицательным.',
+        'not_positive': 'Количество товаров должно быть больше нуля.',
+        'required': 'Укажите количество товара.',
+        'too_many': 'Слишком большое количество товара в корзине.',
     },
     'username': {
         'exists': 'Пользователь с таким username уже существует.'
-    }
+    },
+    'product': {
+        'not_found': 'Товары не найдены: {slugs}.',
+        'too_many': 'Можно запросить не больше {limit} товаров.',
+    },
+    'cursor': {
+        'invalid': 'Неверный курсор.',
+    },
+    'ordering': {
+        'wrong': 'Недопустимая сортировка.',
+    },
+    'search': {
+        'cursor': (
+            'Результаты поиска отсортированы по релевантности '
+            'и не листаются курсором (pagination=cursor).'
+        ),
+    },
+    'fields': {
+        'unknown': 'Неизвестные поля: {names}.',
+    },
+    'token': {
+        'revoked': 'Токен отозван.',
+        'no_session': 'Токен выдан без сессии.',
+    },
+    'slug': {
+        'reserved': 'Слаги, начинающиеся с "{prefix}", зарезервированы.',
+    },
 }
 
 
@@ -21,10 +50,35 @@ MAGIC_NUMBERS = {
         'max_decimal_digits': 10,
         'max_decimal_places': 2,
         'max_length': 150,
+        'max_cart_batch': 100,
+        'max_cart_quantity': 32767,
+        'export_chunk_size': 2000,
         'truncated_str': 35
+    },
+    'search': {
+        'trigram_threshold': 0.3
+    },
+    'facets': {
+        'price_buckets': (1000, 5000, 10000, 50000)
     }
 }
 
+SEARCH_CONFIG = 'russian'
+
+# Префиксы синтетических данных (generate_catalog). slugify не дает
+# слагов с "_" в начале, а модели и загрузка каталога такие слаги
+# отклоняют; ":" не допускается в логинах, поэтому такие
+# пользователи создаются только через COPY.
+GENERATED_SLUG_PREFIX = '_gen-'
+GENERATED_USERNAME_PREFIX = 'gen:'
+
+
+CART_OPERATIONS = (
+    ('add', 'Добавить'),
+    ('set', 'Установить количество'),
+    ('remove', 'Удалить'),
+)
+
 
 USER_ROLES = (
     ('admin', 'Администратор'),
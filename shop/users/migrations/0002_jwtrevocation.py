@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JWTRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(verbose_name='Тип')),
+                ('value', models.JSONField(verbose_name='Значение')),
+                ('revoked_at', models.FloatField(db_index=True, verbose_name='Время отзыва')),
+                ('expires_at', models.FloatField(db_index=True, verbose_name='Истекает')),
+            ],
+            options={
+                'verbose_name': 'Отзыв JWT',
+                'verbose_name_plural': 'Отзывы JWT',
+            },
+        ),
+    ]
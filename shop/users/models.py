@@ -52,3 +52,28 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.username[:MAGIC_NUMBERS['count']['truncated_str']]
+
+
+class JWTRevocation(models.Model):
+    """
+    Отзыв JWT.
+
+    Поля:
+        kind - что отозвано: session, user или users
+        value - id сессии, id пользователя или список id
+        revoked_at - время отзыва (Unix): отзываются токены,
+            выданные не позже
+        expires_at - время, когда отозванные токены истекут сами
+    """
+
+    kind = models.CharField('Тип')
+    value = models.JSONField('Значение')
+    revoked_at = models.FloatField('Время отзыва', db_index=True)
+    expires_at = models.FloatField('Истекает', db_index=True)
+
+    class Meta:
+        verbose_name = 'Отзыв JWT'
+        verbose_name_plural = 'Отзывы JWT'
+
+    def __str__(self):
+        return f'{self.kind} {self.value}'
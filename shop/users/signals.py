@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.cache import invalidate_tokens, revoke_user
+
+
+User = get_user_model()
+
+# Поля, которые попадают в JWT или влияют на доступ.
+ACCESS_FIELDS = ('role', 'is_active', 'is_staff')
+# Изменение этих полей сбрасывает кэш токенов пользователя.
+TOKEN_CACHE_FIELDS = (*ACCESS_FIELDS, 'username', 'is_superuser', 'password')
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    """Сброс кэша при удалении токена (в том числе при logout)."""
+    invalidate_tokens((instance.key,))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, **kwargs):
+    """
+    Сброс кэша токенов пользователя при изменении TOKEN_CACHE_FIELDS.
+
+    Так деактивация и смена роли действуют сразу,
+    а не после истечения времени жизни записи. Запись других
+    полей (last_login при каждом входе) кэш не сбрасывает.
+    """
+    if created or not getattr(instance, '_token_cache_stale', False):
+        return
+    instance._token_cache_stale = False
+    invalidate_tokens(
+        Token.objects.filter(user_id=instance.pk).values_list(
+            'key',
+            flat=True
+        )
+    )
+
+
+@receiver(pre_save, sender=User)
+def revoke_user_jwt(instance, update_fields, **kwargs):
+    """
+    Отзыв JWT пользователя при смене роли или деактивации.
+
+    Заодно отмечает, нужно ли после записи сбросить кэш токенов.
+    Если update_fields не задевает TOKEN_CACHE_FIELDS,
+    пользователь из БД не читается.
+    """
+    instance._token_cache_stale = False
+    if instance._state.adding or (
+        update_fields is not None
+        and not set(update_fields) & set(TOKEN_CACHE_FIELDS)
+    ):
+        return
+    stored = User.objects.filter(pk=instance.pk).values(
+        *TOKEN_CACHE_FIELDS
+    ).first()
+    if stored is None:
+        return
+    changed = {
+        field for field in TOKEN_CACHE_FIELDS
+        if stored[field] != getattr(instance, field)
+    }
+    if changed & set(ACCESS_FIELDS):
+        revoke_user(instance.pk)
+    instance._token_cache_stale = bool(changed)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_jwt(instance, **kwargs):
+    """Отзыв JWT удаленного пользователя."""
+    revoke_user(instance.pk)